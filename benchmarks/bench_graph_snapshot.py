@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+/v1/graph/edge をチャネルごとに呼ぶ方式と、/v1/graph のスナップショットを
+ストリーミング解析する方式の所要時間を比較し、切り替えの目安となるチャネル数を求める。
+
+ローカルの疑似 LND サーバー（1 リクエストごとに指定した遅延を挿入）に対して計測する。
+
+    python benchmarks/bench_graph_snapshot.py --graph-edges 60000 --latency-ms 20 --concurrency 8
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+import requests
+
+from src.api.collector import _fetch_edges
+from src.api.lightning_client import LightningClient, close_clients
+
+
+def build_graph(edge_count, seed=0):
+    """describegraph 形式の疑似グラフを生成し、(JSON バイト列, エッジの辞書) を返す"""
+    rng = random.Random(seed)
+    node_count = max(2, edge_count // 5)
+    pubkeys = [f"{i:066x}" for i in range(node_count)]
+    nodes = [{
+        'last_update': 1700000000,
+        'pub_key': pubkey,
+        'alias': f'node-{i}',
+        'addresses': [{'network': 'tcp', 'addr': f'10.0.{i % 256}.{i // 256 % 256}:9735'}],
+        'color': '#3399ff',
+        'features': {},
+    } for i, pubkey in enumerate(pubkeys)]
+
+    def policy():
+        return {
+            'time_lock_delta': 80,
+            'min_htlc': '1000',
+            'fee_base_msat': '1000',
+            'fee_rate_milli_msat': str(rng.randint(0, 3000)),
+            'disabled': False,
+            'max_htlc_msat': '990000000',
+            'last_update': 1700000000,
+            'inbound_fee_base_msat': 0,
+            'inbound_fee_rate_milli_msat': -rng.randint(0, 500),
+        }
+
+    edges = {}
+    for i in range(edge_count):
+        node1, node2 = rng.sample(pubkeys, 2)
+        channel_id = str(800000 << 40 | i)
+        edges[channel_id] = {
+            'channel_id': channel_id,
+            'chan_point': f'{i:064x}:0',
+            'last_update': 1700000000,
+            'node1_pub': node1,
+            'node2_pub': node2,
+            'capacity': '5000000',
+            'node1_policy': policy(),
+            'node2_policy': policy(),
+        }
+
+    data = json.dumps({'nodes': nodes, 'edges': list(edges.values())}).encode('utf-8')
+    return data, edges
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if path == '/v1/graph':
+            time.sleep(self.server.graph_latency)
+            body = self.server.graph_bytes
+        elif path.startswith('/v1/graph/edge/'):
+            time.sleep(self.server.latency)
+            edge = self.server.edges.get(path.rsplit('/', 1)[-1])
+            body = json.dumps(edge).encode('utf-8') if edge else b'{}'
+        else:
+            body = b'{}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        for start in range(0, len(body), 1 << 16):
+            self.wfile.write(body[start:start + (1 << 16)])
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # スナップショットの読み込みを途中で打ち切ると接続がリセットされるため無視する
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Edge-per-channel vs graph snapshot benchmark")
+    parser.add_argument('--graph-edges', type=int, default=60000, help="Number of edges in the synthetic graph")
+    parser.add_argument('--latency-ms', type=float, default=20.0, help="Simulated per-request latency")
+    parser.add_argument('--graph-latency-ms', type=float, default=1000.0,
+                        help="Simulated time for LND to start answering /v1/graph (describegraph)")
+    parser.add_argument('--concurrency', type=int, default=8, help="collection.concurrency for per-edge calls")
+    parser.add_argument('--channels', default='25,50,100,200,400,800', help="Comma separated channel counts")
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    graph_bytes, edges = build_graph(args.graph_edges)
+    server = _Server(('127.0.0.1', 0), _Handler)
+    server.graph_bytes = graph_bytes
+    server.edges = edges
+    server.latency = args.latency_ms / 1000
+    server.graph_latency = args.graph_latency_ms / 1000
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    tmpdir = tempfile.mkdtemp()
+    macaroon_path = os.path.join(tmpdir, 'admin.macaroon')
+    with open(macaroon_path, 'wb') as f:
+        f.write(b'\x00')
+    config = {
+        'lightning': {
+            'api_url': f'http://127.0.0.1:{server.server_address[1]}',
+            'macaroon_path': macaroon_path,
+            'tls_path': requests.certs.where(),
+        },
+        'collection': {'concurrency': args.concurrency},
+    }
+
+    print(f"graph: {args.graph_edges} edges, {len(graph_bytes) / 1e6:.1f} MB, "
+          f"edge latency {args.latency_ms} ms, graph latency {args.graph_latency_ms} ms, "
+          f"concurrency {args.concurrency}")
+    print(f"{'channels':>8} {'edge [s]':>10} {'graph [s]':>10}")
+
+    rng = random.Random(1)
+    all_ids = list(edges)
+    # 接続の確立などを計測から除くためのウォームアップ
+    list(_fetch_edges([{'chan_id': chan_id} for chan_id in all_ids[:args.concurrency]],
+                      config, args.concurrency, 'edge'))
+    results = []
+    for count in (int(c) for c in args.channels.split(',')):
+        channel_lists = [{'chan_id': chan_id} for chan_id in rng.sample(all_ids, count)]
+
+        start = time.perf_counter()
+        list(_fetch_edges(channel_lists, config, args.concurrency, 'edge'))
+        edge_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        LightningClient(config).get_graph_edges([c['chan_id'] for c in channel_lists])
+        graph_seconds = time.perf_counter() - start
+
+        results.append({'channels': count, 'edge_seconds': edge_seconds, 'graph_seconds': graph_seconds})
+        print(f"{count:>8} {edge_seconds:>10.3f} {graph_seconds:>10.3f}")
+
+    crossover = next((r['channels'] for r in results if r['graph_seconds'] <= r['edge_seconds']), None)
+    if crossover is None:
+        print("graph snapshot was slower for every channel count measured")
+    else:
+        print(f"graph snapshot is faster from about {crossover} channels "
+              f"(collection.graph_snapshot_threshold)")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'params': vars(args), 'results': results, 'crossover': crossover}, f, indent=2)
+
+    close_clients()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
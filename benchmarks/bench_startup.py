@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+CLI の起動から終了までの時間 (コールドスタート) を、短いモードごとに計測して目標時間と比較する。
+
+  help     --help (インポートと引数の解析のみ)
+  schema   --update_add_active (設定の読み込み・データベースの初期化・スキーマ更新)
+  delete   --delete 1 (空のデータベースに対する保持期間の削除)
+
+一時ディレクトリの config.yaml と空のデータベースを使うため、LND には接続しない。
+設定のキャッシュも一時ディレクトリに保存する（LIGHTNING_NODE_DB_CACHE_DIR）。
+
+  python   python src/main.py --config <config.yaml>
+  onefile  PyInstaller の onefile の実行ファイルと同じく、実行ごとに config.yaml を新しい一時ディレクトリに展開し、
+           sys._MEIPASS を設定して --config なしで実行する（同梱した config.yaml の設定のキャッシュが使われるか）
+  exe      --exe に指定した PyInstaller でビルドした実行ファイル（--config で一時ディレクトリの config.yaml を指定）
+  exe-bundled  --exe-bundled を指定した場合、実行ファイルに同梱した config.yaml のまま schema モードを実行する
+               （同梱した設定のデータベースを開くため、テスト用の設定でビルドした実行ファイルに使う）
+
+いずれかのモードの中央値が目標時間を超えた場合は終了コード 1 を返す。
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --exe dist/lnddb.exe --output results/startup.json
+    python benchmarks/bench_startup.py --exe dist/lnddb.exe --exe-bundled
+    python benchmarks/bench_startup.py --importtime  # インポートに時間がかかっているモジュールを表示
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN_SCRIPT = os.path.join(project_root, 'src', 'main.py')
+
+MODES = {
+    'help': ['--help'],
+    'schema': ['--update_add_active'],
+    'delete': ['--delete', '1'],
+}
+
+# 中央値の目標時間 (ミリ秒)。実行ファイルは展開 (onefile) とブートローダーの分を見込む
+DEFAULT_PYTHON_BUDGET_MS = 300
+DEFAULT_EXE_BUDGET_MS = 1500
+
+CONFIG_TEMPLATE = """\
+database:
+  path: "{db_path}"
+  channel_log_dir: ""
+lightning:
+  api_url: "https://127.0.0.1:1"
+  macaroon_path: "{tmpdir}/admin.macaroon"
+  tls_path: "{tmpdir}/tls.cert"
+metrics:
+  enabled: true
+"""
+
+
+def write_config(tmpdir):
+    """一時ディレクトリのデータベースを使う config.yaml を作成してパスを返す"""
+    path = os.path.join(tmpdir, 'config.yaml')
+    tmpdir_posix = tmpdir.replace(os.sep, '/')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(CONFIG_TEMPLATE.format(db_path=f'{tmpdir_posix}/lightning_node.db', tmpdir=tmpdir_posix))
+    return path
+
+
+# onefile の実行ファイルを模して、sys._MEIPASS に展開先を設定してから src/main.py を実行する
+ONEFILE_BOOTSTRAP = ("import runpy, sys; sys._MEIPASS = sys.argv[1]; main = sys.argv[2]; "
+                     "sys.argv = [main] + sys.argv[3:]; runpy.run_path(main, run_name='__main__')")
+
+
+def time_command(command, repeat, cwd, env=None):
+    """
+    command を repeat 回実行し、各回の秒数のリストを返す（失敗した場合は RuntimeError）
+    command が呼び出し可能な場合は、各回の実行前（計測の外）に呼び出して実行するコマンドを作る
+    """
+    seconds = []
+    for _ in range(repeat):
+        args = command() if callable(command) else command
+        started = time.perf_counter()
+        result = subprocess.run(args, cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        seconds.append(time.perf_counter() - started)
+        if result.returncode != 0:
+            raise RuntimeError(f"{' '.join(args)} failed: {result.stderr.decode(errors='replace')[-2000:]}")
+    return seconds
+
+
+def cache_env(tmpdir):
+    """設定のキャッシュを一時ディレクトリに保存する環境変数"""
+    return dict(os.environ, LIGHTNING_NODE_DB_CACHE_DIR=os.path.join(tmpdir, 'config_cache'))
+
+
+def onefile_command(config_path, tmpdir):
+    """実行ごとに config.yaml を新しいディレクトリに展開して、onefile の実行ファイルと同じ条件で実行するコマンドを作る"""
+    def build(args):
+        def command():
+            bundle = tempfile.mkdtemp(prefix='_MEI', dir=tmpdir)
+            shutil.copy(config_path, os.path.join(bundle, 'config.yaml'))
+            return [sys.executable, '-c', ONEFILE_BOOTSTRAP, bundle, MAIN_SCRIPT] + args
+        return command
+    return build
+
+
+def bench_target(name, build_command, repeat, budget_ms, tmpdir, modes=MODES):
+    """build_command(引数) で作るコマンド (python src/main.py または実行ファイル) の各モードの起動時間を計測する"""
+    results = {}
+    env = cache_env(tmpdir)
+    for mode, args in modes.items():
+        command = build_command(args)
+        # 1 回目は設定のキャッシュとデータベースの作成を含むため別に記録する
+        shutil.rmtree(env['LIGHTNING_NODE_DB_CACHE_DIR'], ignore_errors=True)
+        first = time_command(command, 1, tmpdir, env)[0]
+        seconds = time_command(command, repeat, tmpdir, env)
+        median_ms = statistics.median(seconds) * 1000
+        results[mode] = {'first_ms': first * 1000, 'median_ms': median_ms, 'min_ms': min(seconds) * 1000,
+                         'runs': repeat, 'budget_ms': budget_ms, 'within_budget': median_ms <= budget_ms}
+        status = 'ok' if median_ms <= budget_ms else 'OVER BUDGET'
+        print(f"  {name:7} {mode:7} median {median_ms:8.1f} ms  min {min(seconds) * 1000:8.1f} ms  "
+              f"first {first * 1000:8.1f} ms  (budget {budget_ms} ms) {status}")
+    return results
+
+
+def print_importtime(config_path, tmpdir, top):
+    """python -X importtime の結果から、累積のインポート時間が長いモジュールを表示する"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', MAIN_SCRIPT] + MODES['schema']
+                            + ['--config', config_path], cwd=tmpdir, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, self_us, cumulative_us, module = (part.strip() for part in line.split('|', 1)[0].split(':', 1)
+                                              + line.split('|', 1)[1].split('|'))
+        rows.append((int(cumulative_us), int(self_us), module))
+    print(f"== slowest imports (schema mode, top {top})")
+    for cumulative_us, self_us, module in sorted(rows, reverse=True)[:top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms (self {self_us / 1000:6.1f} ms)  {module.strip()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start time of src/main.py and the built executable")
+    parser.add_argument('--repeat', type=int, default=5, help="Runs per mode (median is compared with the budget)")
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_PYTHON_BUDGET_MS,
+                        help="Budget for python src/main.py")
+    parser.add_argument('--exe', help="Also measure this PyInstaller executable")
+    parser.add_argument('--exe-budget-ms', type=float, default=DEFAULT_EXE_BUDGET_MS, help="Budget for --exe")
+    parser.add_argument('--exe-bundled', action='store_true',
+                        help="Also run --exe with its bundled config.yaml (opens the database configured in the build)")
+    parser.add_argument('--importtime', action='store_true', help="Show the slowest imports of the schema mode")
+    parser.add_argument('--top', type=int, default=15, help="Modules shown by --importtime")
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    results = {}
+    try:
+        config_path = write_config(tmpdir)
+        print("== startup")
+        with_config = lambda base: lambda mode_args: base + mode_args + ['--config', config_path]
+        results['python'] = bench_target('python', with_config([sys.executable, MAIN_SCRIPT]), args.repeat,
+                                         args.budget_ms, tmpdir)
+        results['onefile'] = bench_target('onefile', onefile_command(config_path, tmpdir), args.repeat,
+                                          args.budget_ms, tmpdir)
+        if args.exe:
+            exe = os.path.abspath(args.exe)
+            results['exe'] = bench_target('exe', with_config([exe]), args.repeat, args.exe_budget_ms, tmpdir)
+            if args.exe_bundled:
+                results['exe-bundled'] = bench_target('exe-bundled', lambda mode_args: [exe] + mode_args, args.repeat,
+                                                      args.exe_budget_ms, tmpdir, {'schema': MODES['schema']})
+        if args.importtime:
+            print_importtime(config_path, tmpdir, args.top)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'python': sys.version.split()[0], 'results': results}, f, indent=2)
+        print(f"results written to {args.output}")
+
+    over = [f"{target}.{mode}" for target, modes in results.items() for mode, result in modes.items()
+            if not result['within_budget']]
+    if over:
+        print(f"over budget: {', '.join(over)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
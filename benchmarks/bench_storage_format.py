@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+channel_datas (legacy)、channel_samples (compact)、channel_intervals (delta) のファイルサイズ・
+書き込み/移行/読み込み速度と、全チャネル・全期間の配列での読み込み速度 (numpy がある場合) を
+合成データで比較する。
+
+    python benchmarks/bench_storage_format.py --channels 300 --samples 2000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src.db.database import Database
+
+
+def synthetic_runs(channels, samples, seed=0):
+    """10 分間隔の収集結果 (日時, スナップショットのリスト) を生成する"""
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    balances = {chan_id: rng.randint(0, 10_000_000) for chan_id in channels}
+    fees = {chan_id: rng.randint(0, 3000) for chan_id in channels}
+    for i in range(samples):
+        date = (start + timedelta(minutes=10 * i)).strftime(Database.DATE_FORMAT)
+        snapshots = []
+        for chan_id in channels:
+            if rng.random() < 0.2:
+                balances[chan_id] = max(0, balances[chan_id] + rng.randint(-100_000, 100_000))
+            if rng.random() < 0.01:
+                fees[chan_id] = rng.randint(0, 3000)
+            channel = {
+                'chan_id': chan_id,
+                'remote_pubkey': 'remote',
+                'local_balance': str(balances[chan_id]),
+                'remote_balance': str(10_000_000 - balances[chan_id]),
+                'num_updates': str(i),
+                'active': True,
+            }
+            edge = {
+                'node1_pub': 'remote',
+                'node1_policy': {'fee_rate_milli_msat': str(fees[chan_id]), 'inbound_fee_rate_milli_msat': 0},
+                'node2_policy': {'fee_rate_milli_msat': '500', 'inbound_fee_rate_milli_msat': -100},
+            }
+            snapshots.append((channel, edge, 1200))
+        yield date, snapshots
+
+
+def open_db(path, storage, channels):
+    db = Database(path, storage=storage)
+    db.initialize()
+    db.bulk_insert_channels([{'chan_id': chan_id, 'peer_alias': chan_id, 'capacity': 10_000_000}
+                             for chan_id in channels])
+    db.conn.commit()
+    return db
+
+
+def file_size(db):
+    db.conn.execute("VACUUM;")
+    return os.path.getsize(db.db_path)
+
+
+def range_reads(db, table, channels, queries, seed=1):
+    """ランダムなチャネルの 1 日分を queries 回読み込み、読み込んだ行数を返す"""
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    rows = 0
+    for _ in range(queries):
+        chan_id = rng.choice(channels)
+        day = start + timedelta(days=rng.randint(0, 6))
+        if table == 'channel_intervals':
+            # 差分形式は区間を展開して読み込む
+            rows += len(db.get_channel_samples(chan_id, day.strftime(Database.DATE_FORMAT),
+                                               (day + timedelta(days=1)).strftime(Database.DATE_FORMAT)))
+            continue
+        if table == 'channel_datas':
+            sql = "SELECT * FROM channel_datas WHERE channel_id = ? AND date >= ? AND date < ? ORDER BY date;"
+            params = (chan_id, day.strftime(Database.DATE_FORMAT),
+                      (day + timedelta(days=1)).strftime(Database.DATE_FORMAT))
+        else:
+            sql = "SELECT * FROM channel_samples WHERE channel_id = ? AND ts >= ? AND ts < ? ORDER BY ts;"
+            params = (int(chan_id), int(day.timestamp()), int((day + timedelta(days=1)).timestamp()))
+        rows += len(db.conn.execute(sql, params).fetchall())
+    return rows
+
+
+def array_reads(db, samples):
+    """全チャネル・全期間を配列で読み込み、(そのままの秒数, 1 時間間隔に揃えた秒数) を返す"""
+    start = datetime(2024, 1, 1)
+    end = (start + timedelta(minutes=10 * samples)).strftime(Database.DATE_FORMAT)
+    start = start.strftime(Database.DATE_FORMAT)
+    timer = time.perf_counter()
+    db.get_channels_arrays(start, end)
+    raw_seconds = time.perf_counter() - timer
+    timer = time.perf_counter()
+    db.get_channels_arrays(start, end, step=3600)
+    return raw_seconds, time.perf_counter() - timer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="legacy vs compact sample storage benchmark")
+    parser.add_argument('--channels', type=int, default=300)
+    parser.add_argument('--samples', type=int, default=2000, help="Samples (runs) per channel")
+    parser.add_argument('--queries', type=int, default=500, help="Number of one-day range reads")
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    channels = [str((800000 + i) << 40 | i) for i in range(args.channels)]
+    total_rows = args.channels * args.samples
+    tmpdir = tempfile.mkdtemp()
+    results = {'rows': total_rows}
+
+    for storage in Database.STORAGE_FORMATS:
+        db = open_db(os.path.join(tmpdir, f'{storage}.db'), storage, channels)
+        start = time.perf_counter()
+        for date, snapshots in synthetic_runs(channels, args.samples):
+            db.insert_channel_datas(snapshots, date=date)
+        write_seconds = time.perf_counter() - start
+
+        table = {'compact': 'channel_samples', 'delta': 'channel_intervals'}.get(storage, 'channel_datas')
+        start = time.perf_counter()
+        read_rows = range_reads(db, table, channels, args.queries)
+        read_seconds = time.perf_counter() - start
+
+        results[storage] = {
+            'write_rows_per_sec': total_rows / write_seconds,
+            'range_reads_per_sec': args.queries / read_seconds,
+            'rows_read': read_rows,
+            'file_bytes': file_size(db),
+        }
+        try:
+            results[storage]['array_read_seconds'], results[storage]['array_resample_seconds'] = \
+                array_reads(db, args.samples)
+        except ImportError:
+            pass
+        db.close()
+
+    # legacy のデータベースを移行したときの速度
+    db = Database(os.path.join(tmpdir, 'legacy.db'), storage='compact')
+    db.initialize()
+    start = time.perf_counter()
+    migrated = db.migrate_to_compact()
+    migrate_seconds = time.perf_counter() - start
+    db.close()
+    results['migration_rows_per_sec'] = migrated / migrate_seconds
+
+    print(f"rows: {total_rows} ({args.channels} channels x {args.samples} samples)")
+    print(f"{'':10} {'size [MB]':>10} {'write [rows/s]':>15} {'reads [q/s]':>12} {'arrays [s]':>11} {'hourly [s]':>11}")
+    for storage in Database.STORAGE_FORMATS:
+        r = results[storage]
+        print(f"{storage:10} {r['file_bytes'] / 1e6:>10.1f} {r['write_rows_per_sec']:>15.0f} "
+              f"{r['range_reads_per_sec']:>12.0f} {r.get('array_read_seconds', float('nan')):>11.2f} "
+              f"{r.get('array_resample_seconds', float('nan')):>11.2f}")
+    print(f"compact / legacy size: {results['compact']['file_bytes'] / results['legacy']['file_bytes']:.2f}")
+    print(f"migration: {results['migration_rows_per_sec']:.0f} rows/s")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'params': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
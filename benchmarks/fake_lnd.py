@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+ベンチマーク用のローカルの疑似 LND REST / Amboss GraphQL サーバー
+
+チャネル数と 1 リクエストごとの遅延を指定して、収集処理が呼び出す次のエンドポイントに応答する。
+  GET  /v1/channels            チャネル一覧 (listchannels)
+  GET  /v1/graph/edge/<chan>   エッジ情報 (getchaninfo)
+  GET  /v1/graph               グラフのスナップショット (describegraph、自ノードのチャネルのみ)
+  POST /graphql                Amboss の getNode (1 ノードまたはエイリアス n0..nN のバッチ)
+
+単体で起動して手動の計測に使うこともできる:
+
+    python benchmarks/fake_lnd.py --channels 500 --latency-ms 20 --port 8080
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+LOCAL_PUBKEY = '02' + 'ab' * 32
+
+
+def build_channels(channel_count, seed=0):
+    """listchannels 形式のチャネルと、chan_id -> エッジ情報 の辞書を生成する"""
+    rng = random.Random(seed)
+    channels = []
+    edges = {}
+    for i in range(channel_count):
+        chan_id = str((800000 + i) << 40 | i)
+        remote_pubkey = f"03{i:064x}"
+        capacity = rng.choice([1_000_000, 2_000_000, 5_000_000, 10_000_000])
+        local_balance = rng.randint(0, capacity)
+        channels.append({
+            'active': rng.random() > 0.05,
+            'remote_pubkey': remote_pubkey,
+            'channel_point': f'{i:064x}:0',
+            'chan_id': chan_id,
+            'capacity': str(capacity),
+            'local_balance': str(local_balance),
+            'remote_balance': str(capacity - local_balance),
+            'num_updates': str(rng.randint(0, 100000)),
+            'peer_alias': f'peer-{i}',
+        })
+
+        def policy():
+            return {
+                'time_lock_delta': 80,
+                'min_htlc': '1000',
+                'fee_base_msat': '1000',
+                'fee_rate_milli_msat': str(rng.randint(0, 3000)),
+                'disabled': False,
+                'max_htlc_msat': str(capacity * 990),
+                'last_update': 1700000000,
+                'inbound_fee_base_msat': 0,
+                'inbound_fee_rate_milli_msat': -rng.randint(0, 500),
+            }
+
+        edges[chan_id] = {
+            'channel_id': chan_id,
+            'chan_point': f'{i:064x}:0',
+            'last_update': 1700000000,
+            'node1_pub': remote_pubkey,
+            'node2_pub': LOCAL_PUBKEY,
+            'capacity': str(capacity),
+            'node1_policy': policy(),
+            'node2_policy': policy(),
+        }
+    return channels, edges
+
+
+def amboss_node(fee):
+    """Amboss の getNode の結果（collector が読み込むフィールドのみ）"""
+    return {'graph_info': {'channels': {'fee_info': {'remote': {'weighted_corrected': fee}}}}}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        path = self.path.split('?', 1)[0]
+        server.count('lnd')
+        time.sleep(server.latency)
+        if path == '/v1/channels':
+            body = server.channels_bytes
+        elif path == '/v1/graph':
+            body = server.graph_bytes
+        elif path.startswith('/v1/graph/edge/'):
+            edge = server.edges.get(path.rsplit('/', 1)[-1])
+            if edge is None:
+                self._send(404, b'{"code": 2, "message": "edge not found"}')
+                return
+            body = json.dumps(edge).encode('utf-8')
+        else:
+            self._send(404, b'{"code": 12, "message": "unknown path"}')
+            return
+        self._send(200, body)
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        if self.path.split('?', 1)[0] != '/graphql':
+            self._send(404, b'{}')
+            return
+        server.count('amboss')
+        time.sleep(server.amboss_latency)
+        variables = request.get('variables') or {}
+        if 'pubkey' in variables:
+            data = {'getNode': amboss_node(server.amboss_fee(variables['pubkey']))}
+        else:
+            # バッチクエリは $p0..$pN をエイリアス n0..nN で返す
+            data = {f"n{name[1:]}": amboss_node(server.amboss_fee(pubkey)) for name, pubkey in variables.items()}
+        self._send(200, json.dumps({'data': data}).encode('utf-8'))
+
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        for start in range(0, len(body), 1 << 16):
+            self.wfile.write(body[start:start + (1 << 16)])
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # クライアントが途中で接続を閉じた場合などは無視する
+        pass
+
+    def count(self, name):
+        with self.lock:
+            self.requests[name] += 1
+
+    def amboss_fee(self, pubkey):
+        return int(pubkey[-4:], 16) % 3000
+
+
+class FakeLndServer:
+    """
+    別スレッドで動く疑似 LND / Amboss サーバー
+
+        with FakeLndServer(channels=500, latency=0.02) as server:
+            config = server.config(tmpdir)
+            collect_once(db, config)
+    """
+
+    def __init__(self, channels=100, latency=0.0, amboss_latency=0.0, seed=0, host='127.0.0.1', port=0):
+        channel_list, edges = build_channels(channels, seed)
+        self.channels = channel_list
+        self._server = _Server((host, port), _Handler)
+        self._server.latency = latency
+        self._server.amboss_latency = amboss_latency
+        self._server.edges = edges
+        self._server.channels_bytes = json.dumps({'channels': channel_list}).encode('utf-8')
+        self._server.graph_bytes = json.dumps({'nodes': [], 'edges': list(edges.values())}).encode('utf-8')
+        self._server.lock = threading.Lock()
+        self._server.requests = {'lnd': 0, 'amboss': 0}
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def requests(self):
+        """エンドポイントの種類 ('lnd' / 'amboss') ごとの受け付けたリクエスト数"""
+        with self._server.lock:
+            return dict(self._server.requests)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def config(self, tmpdir, concurrency=8, edge_source='edge', amboss_batch_size=25, node_id='bench'):
+        """
+        このサーバーに接続する config.yaml 相当の辞書を返す
+        macaroon はダミーのファイルを tmpdir に作成する（http のため TLS 証明書は使われない）
+        """
+        macaroon_path = os.path.join(tmpdir, 'admin.macaroon')
+        if not os.path.exists(macaroon_path):
+            with open(macaroon_path, 'wb') as f:
+                f.write(b'\x00')
+        return {
+            'lightning': {
+                'node_id': node_id,
+                'api_url': self.url,
+                'macaroon_path': macaroon_path,
+                'tls_path': requests.certs.where(),
+            },
+            'collection': {'concurrency': concurrency, 'edge_source': edge_source},
+            'amboss': {'api_key': 'bench', 'api_url': self.url, 'batch_size': amboss_batch_size},
+            'rollups': {'enabled': True},
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake LND REST + Amboss GraphQL server")
+    parser.add_argument('--channels', type=int, default=500)
+    parser.add_argument('--latency-ms', type=float, default=20.0, help="Delay added to every LND request")
+    parser.add_argument('--amboss-latency-ms', type=float, default=100.0, help="Delay added to every Amboss request")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    args = parser.parse_args()
+
+    server = FakeLndServer(args.channels, args.latency_ms / 1000, args.amboss_latency_ms / 1000,
+                           host=args.host, port=args.port)
+    tmpdir = tempfile.mkdtemp()
+    config = server.config(tmpdir)
+    print(f"fake LND / Amboss on {server.url} ({args.channels} channels)")
+    print("config.yaml:")
+    print(json.dumps({key: config[key] for key in ('lightning', 'amboss')}, indent=2))
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+        print(f"requests: {server.requests}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+ベンチマーク用に、合成したサンプルを持つデータベースを生成する。
+
+現在時刻までの days 日分を interval_minutes 間隔で生成するため、保持期間による削除の対象になる古い行と
+新しい行の両方を含む。1000 チャネル x 90 日 (10 分間隔) で約 1300 万行になる。
+
+    python benchmarks/generate_dataset.py data/bench.db --channels 1000 --days 90
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from src.db.database import Database
+
+# 生成時はクラッシュ時の保護よりも書き込み速度を優先する
+GENERATE_PRAGMAS = {'journal_mode': 'WAL', 'synchronous': 'OFF', 'cache_size': -65536}
+
+# 1 回のコミットで書き込む行数の目安
+COMMIT_ROWS = 100000
+
+
+def channel_ids(count):
+    """scid 形式の chan_id を count 個返す（benchmarks/fake_lnd.py と同じ値）"""
+    return [str((800000 + i) << 40 | i) for i in range(count)]
+
+
+def iter_runs(channels, days, interval_minutes=10, end=None, seed=0):
+    """
+    end までの days 日分の収集結果を (日時, channel_datas 形式の行のリスト) として古い順に返す
+    行は (channel_id, date, local_balance, local_fee, local_infee, remote_balance, remote_fee,
+    remote_infee, num_updates, amboss_fee, active)
+    """
+    rng = random.Random(seed)
+    if end is None:
+        end = datetime.now().replace(second=0, microsecond=0)
+    runs = days * 24 * 60 // interval_minutes
+    start = end - timedelta(minutes=interval_minutes * runs)
+    balances = {chan_id: rng.randint(0, 10_000_000) for chan_id in channels}
+    fees = {chan_id: rng.randint(0, 3000) for chan_id in channels}
+    for i in range(runs):
+        date = (start + timedelta(minutes=interval_minutes * i)).strftime(Database.DATE_FORMAT)
+        rows = []
+        for chan_id in channels:
+            # 残高は 2 割、手数料は 1% の収集で変化する
+            if rng.random() < 0.2:
+                balances[chan_id] = max(0, balances[chan_id] + rng.randint(-100_000, 100_000))
+            if rng.random() < 0.01:
+                fees[chan_id] = rng.randint(0, 3000)
+            rows.append((chan_id, date, balances[chan_id], 500, -100, 10_000_000 - balances[chan_id],
+                         fees[chan_id], 0, i, 1200, 1))
+        yield date, rows
+
+
+def generate_dataset(path, channels=1000, days=90, interval_minutes=10, storage='legacy', nodes=1, seed=0,
+                     end=None, progress=True):
+    """
+    path に合成データのデータベースを作成する（既存のファイルは置き換える）
+    nodes を 2 以上にすると node-0..node-N のノードに同じ数のチャネルを作成する
+
+    Returns:
+        {'path', 'storage', 'node_ids', 'channels', 'rows', 'seconds'}
+    """
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    node_ids = [Database.DEFAULT_NODE_ID] if nodes == 1 else [f'node-{i}' for i in range(nodes)]
+    db = Database(path, storage=storage, pragmas=GENERATE_PRAGMAS, node_id=node_ids[0])
+    db.initialize()
+    chan_ids = channel_ids(channels)
+    for node_id in node_ids:
+        db.for_node(node_id).bulk_insert_channels([
+            {'chan_id': chan_id, 'peer_alias': f'peer-{chan_id[-4:]}', 'channel_point': f'{chan_id}:0',
+             'capacity': 10_000_000} for chan_id in chan_ids])
+    db.conn.commit()
+
+    started = time.perf_counter()
+    total = 0
+    pending = 0
+    for date, rows in iter_runs(chan_ids, days, interval_minutes, end, seed):
+        ts = Database._date_to_ts(date)
+        for node_id in node_ids:
+            if storage == 'delta':
+                db.for_node(node_id)._write_intervals([Database._delta_row(row) for row in rows], ts)
+            elif storage == 'compact':
+                db.conn.executemany(Database.CHANNEL_SAMPLES_INSERT_SQL,
+                                    [(node_id,) + Database._compact_row(row, ts) for row in rows])
+            else:
+                db.conn.executemany(Database.CHANNEL_DATAS_INSERT_SQL, [(node_id,) + row for row in rows])
+        total += len(rows) * len(node_ids)
+        pending += len(rows) * len(node_ids)
+        if pending >= COMMIT_ROWS:
+            db.conn.commit()
+            pending = 0
+            if progress:
+                print(f"\r{total:,} rows ({date})", end='', flush=True)
+    db.conn.commit()
+    seconds = time.perf_counter() - started
+    if progress:
+        print(f"\r{total:,} rows in {seconds:.1f} s ({total / max(seconds, 1e-9):,.0f} rows/s)")
+    db.close()
+    return {'path': path, 'storage': storage, 'node_ids': node_ids, 'channels': chan_ids, 'rows': total,
+            'seconds': seconds}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic lightning-node-db database")
+    parser.add_argument('path', help="Database file to create (replaced if it exists)")
+    parser.add_argument('--channels', type=int, default=1000, help="Channels per node")
+    parser.add_argument('--days', type=int, default=90, help="Days of history ending now")
+    parser.add_argument('--interval-minutes', type=int, default=10, help="Minutes between collection runs")
+    parser.add_argument('--storage', choices=Database.STORAGE_FORMATS, default='legacy')
+    parser.add_argument('--nodes', type=int, default=1, help="Number of nodes sharing the database")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    directory = os.path.dirname(os.path.abspath(args.path))
+    os.makedirs(directory, exist_ok=True)
+    result = generate_dataset(args.path, args.channels, args.days, args.interval_minutes, args.storage,
+                              args.nodes, args.seed)
+    print(f"{result['path']}: {result['rows']:,} rows, {os.path.getsize(result['path']) / 1e6:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
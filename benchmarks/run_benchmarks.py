@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+収集・チャネル一覧の同期・保持期間による削除・履歴の読み込みの所要時間を計測し、JSON に保存する。
+
+  collection    疑似 LND / Amboss サーバー (benchmarks/fake_lnd.py) に対する collect_once() 1 回
+  channel_sync  一部のチャネルが追加・削除・変更されたチャネル一覧での update_channel_lists()
+  retention     合成データ (benchmarks/generate_dataset.py) に対する delete_old_data()
+  history       ロールアップの更新と、生サンプル・hourly・daily の get_channel_history()
+  decode        /v1/channels と /v1/graph/edge の応答の解析（標準の json の辞書 / クライアントが使う src.api.decode の辞書）
+
+--baseline に以前の結果の JSON を指定すると、同じ項目の比 (今回 / 前回) を表示する。
+
+    python benchmarks/run_benchmarks.py --output results/after.json --baseline results/before.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from benchmarks.fake_lnd import FakeLndServer, build_channels
+from src.api import decode
+from src.api.fingerprint_cache import ChannelFingerprintCache
+from benchmarks.generate_dataset import channel_ids, generate_dataset
+from src.api.lightning_client import close_clients
+from src.db.database import Database
+from src.main import collect_once
+
+SCENARIOS = ('collection', 'channel_sync', 'retention', 'history', 'decode')
+
+
+def _timed(fn, repeat=1):
+    """fn を repeat 回実行し、(最後の戻り値, 各回の秒数のリスト) を返す"""
+    seconds = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        seconds.append(time.perf_counter() - started)
+    return result, seconds
+
+
+def _summary(seconds):
+    return {'median_seconds': statistics.median(seconds), 'min_seconds': min(seconds), 'runs': len(seconds)}
+
+
+def _open(path, storage='legacy'):
+    db = Database(path, storage=storage)
+    db.initialize()
+    return db
+
+
+def bench_collection(args, tmpdir):
+    """疑似サーバーのチャネルを collect_once() で 1 回分収集する時間（edge / graph / 指紋のキャッシュを使う graph）"""
+    results = {}
+    with FakeLndServer(args.channels, args.latency_ms / 1000, args.amboss_latency_ms / 1000) as server:
+        for edge_source in ('edge', 'graph'):
+            db = _open(os.path.join(tmpdir, f'collection_{edge_source}.db'), args.storage)
+            config = server.config(tmpdir, concurrency=args.concurrency, edge_source=edge_source)
+            before = server.requests
+            _, seconds = _timed(lambda: collect_once(db, config), args.repeat)
+            after = server.requests
+            results[edge_source] = dict(_summary(seconds),
+                                        channels_per_sec=args.channels / statistics.median(seconds),
+                                        lnd_requests=(after['lnd'] - before['lnd']) // args.repeat,
+                                        amboss_requests=(after['amboss'] - before['amboss']) // args.repeat)
+            db.close()
+            close_clients()
+
+        # 指紋のキャッシュを使う場合（1 回目で指紋を記録し、変わっていないチャネルだけの 2 回目以降を計測する）
+        db = _open(os.path.join(tmpdir, 'collection_fingerprints.db'), args.storage)
+        # 指紋はノードごとに記録するため、書き込むノードと同じ node_id にする
+        config = server.config(tmpdir, concurrency=args.concurrency, edge_source='graph', node_id=db.node_id)
+        fingerprints = ChannelFingerprintCache.from_config(config, db)
+        collect_once(db, config, fingerprints=fingerprints)
+        before = server.requests
+        _, seconds = _timed(lambda: collect_once(db, config, fingerprints=fingerprints), args.repeat)
+        after = server.requests
+        results['graph_fingerprints'] = dict(_summary(seconds),
+                                             channels_per_sec=args.channels / statistics.median(seconds),
+                                             lnd_requests=(after['lnd'] - before['lnd']) // args.repeat,
+                                             amboss_requests=(after['amboss'] - before['amboss']) // args.repeat)
+        db.close()
+        close_clients()
+    return results
+
+
+def _channel_list(chan_ids, version):
+    return [{'chan_id': chan_id, 'peer_alias': f'peer-{chan_id[-4:]}-{version}', 'channel_point': f'{chan_id}:0',
+             'capacity': 10_000_000} for chan_id in chan_ids]
+
+
+def bench_channel_sync(args, tmpdir):
+    """
+    一覧の同期時間（変更なし / 5% 追加・5% 削除・10% 変更）
+    毎回同じ状態から始めるため、同期前のデータベースをコピーしてから計測する
+    """
+    path = os.path.join(tmpdir, 'channel_sync.db')
+    current = channel_ids(args.channels)
+    db = _open(path)
+    db.update_channel_lists(_channel_list(current, 0))
+    db.close()
+
+    rng = random.Random(0)
+    removed = set(rng.sample(current, args.channels // 20))
+    changed = set(rng.sample([c for c in current if c not in removed], args.channels // 10))
+    added = channel_ids(args.channels + args.channels // 20)[args.channels:]
+    churned = [{**channel, 'peer_alias': channel['peer_alias'] + '-renamed'} if channel['chan_id'] in changed
+               else channel for channel in _channel_list([c for c in current if c not in removed], 0)]
+    churned += _channel_list(added, 0)
+
+    results = {}
+    for name, channels in (('unchanged', _channel_list(current, 0)), ('churn', churned)):
+        seconds = []
+        for i in range(args.repeat):
+            copy_path = os.path.join(tmpdir, f'channel_sync_{name}_{i}.db')
+            shutil.copyfile(path, copy_path)
+            db = _open(copy_path)
+            _, run_seconds = _timed(lambda: db.update_channel_lists(channels))
+            seconds += run_seconds
+            db.close()
+        results[name] = dict(_summary(seconds), channels=len(channels))
+    return results
+
+
+def _retained_bytes(fn):
+    """fn の戻り値が保持しているメモリ量（tracemalloc で計測したバイト数）"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = fn()
+        retained = tracemalloc.get_traced_memory()[0] - before
+        del result
+        return retained
+    finally:
+        tracemalloc.stop()
+
+
+def bench_decode(args, tmpdir):
+    """
+    チャネル一覧 1 回分とチャネルごとのエッジ情報の応答を解析する時間と、解析結果が保持するメモリ量
+    json: response.json() と同じ標準の json の辞書
+    client: クライアントが使う src.api.decode の関数の辞書（orjson がある場合は orjson）
+    """
+    channels, edges = build_channels(args.channels)
+    channels_body = json.dumps({'channels': channels}).encode('utf-8')
+    edge_bodies = [json.dumps(edge).encode('utf-8') for edge in edges.values()]
+
+    parsers = {
+        'json': (lambda: json.loads(channels_body).get('channels', []),
+                 lambda: [json.loads(body) for body in edge_bodies]),
+        'client': (lambda: decode.decode_channels(channels_body),
+                   lambda: [decode.decode_edge(body) for body in edge_bodies]),
+    }
+    results = {'orjson': decode.orjson is not None}
+    for name, (parse_channels, parse_edges) in parsers.items():
+        _, channel_seconds = _timed(parse_channels, args.repeat)
+        _, edge_seconds = _timed(parse_edges, args.repeat)
+        results[name] = {'channels': _summary(channel_seconds), 'edges': _summary(edge_seconds),
+                         'retained_bytes': _retained_bytes(lambda: (parse_channels(), parse_edges()))}
+    return results
+
+
+def _dataset(args, tmpdir, name):
+    """合成データのデータベースを作成し、そのパスを返す（--dataset を指定した場合はそのコピー）"""
+    path = os.path.join(tmpdir, f'{name}.db')
+    if args.dataset:
+        shutil.copyfile(args.dataset, path)
+    else:
+        generate_dataset(path, args.dataset_channels, args.dataset_days, storage=args.storage, progress=False)
+    return path
+
+
+def bench_retention(args, tmpdir):
+    """保持期間 (--retention-months) より古いサンプルのチャンク削除と、空き領域の解放の時間"""
+    db = Database(_dataset(args, tmpdir, 'retention'), storage=args.storage)
+    db.initialize()
+    total = db.conn.execute(f"SELECT COUNT(*) FROM {db._sample_table()};").fetchone()[0] \
+        if args.storage != 'delta' else None
+    deleted, seconds = _timed(lambda: db.delete_old_data(args.retention_months, pause_seconds=0))
+    _, reclaim_seconds = _timed(lambda: db.reclaim_free_pages(pause_seconds=0))
+    db.close()
+    return dict(_summary(seconds), rows_before=total, rows_deleted=deleted,
+                rows_per_sec=deleted / max(seconds[0], 1e-9), reclaim_seconds=reclaim_seconds[0])
+
+
+def bench_history(args, tmpdir):
+    """ロールアップの更新時間と、ランダムなチャネルの履歴を解像度ごとに読み込む速度"""
+    db = Database(_dataset(args, tmpdir, 'history'), storage=args.storage)
+    db.initialize()
+    results = {}
+    _, seconds = _timed(db.update_rollups)
+    results['update_rollups'] = _summary(seconds)
+
+    chan_ids = [row[0] for row in db.conn.execute("SELECT channel_id FROM channel_lists WHERE node_id = ?;",
+                                                  (db.node_id,))]
+    first, last = db.get_sample_date_range()
+    first, last = (datetime.strptime(date, Database.DATE_FORMAT) for date in (first, last))
+    rng = random.Random(1)
+    for resolution, days in (('raw', 1), ('hourly', 14), ('daily', 60)):
+        span = timedelta(days=days)
+        queries = []
+        for _ in range(args.queries):
+            latest = max(first, last - span)
+            start = first + (latest - first) * rng.random()
+            queries.append((rng.choice(chan_ids), start.strftime(Database.DATE_FORMAT),
+                            (start + span).strftime(Database.DATE_FORMAT)))
+
+        def run():
+            return sum(len(db.get_channel_history(*query, resolution=resolution)[1]) for query in queries)
+
+        rows, seconds = _timed(run)
+        results[resolution] = dict(_summary(seconds), queries=args.queries, rows=rows,
+                                   queries_per_sec=args.queries / max(seconds[0], 1e-9))
+    db.close()
+    return results
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpus': os.cpu_count(),
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+    }
+
+
+def _flatten(results, prefix=''):
+    """{'a': {'b': 1}} を {'a.b': 1} に変換する（数値のみ）"""
+    flat = {}
+    for key, value in results.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(results, baseline):
+    """今回と前回で共通する *_seconds / *_per_sec の項目を (名前, 前回, 今回, 比) のリストで返す"""
+    current, previous = _flatten(results), _flatten(baseline)
+    rows = []
+    for name, value in current.items():
+        if name not in previous or not name.endswith(('_seconds', '_per_sec')) or not previous[name]:
+            continue
+        rows.append((name, previous[name], value, value / previous[name]))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Collection / retention / history benchmarks")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help=f"Comma separated subset of {SCENARIOS}")
+    parser.add_argument('--storage', choices=Database.STORAGE_FORMATS, default='legacy')
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per timed operation (median is reported)")
+    parser.add_argument('--channels', type=int, default=500, help="Channels for collection / channel_sync")
+    parser.add_argument('--latency-ms', type=float, default=5.0, help="Fake LND per-request latency")
+    parser.add_argument('--amboss-latency-ms', type=float, default=50.0, help="Fake Amboss per-request latency")
+    parser.add_argument('--concurrency', type=int, default=8, help="collection.concurrency")
+    parser.add_argument('--dataset', help="Use a copy of this database (generate_dataset.py) for retention/history")
+    parser.add_argument('--dataset-channels', type=int, default=200, help="Channels in the generated dataset")
+    parser.add_argument('--dataset-days', type=int, default=60, help="Days in the generated dataset")
+    parser.add_argument('--retention-months', type=int, default=1)
+    parser.add_argument('--queries', type=int, default=200, help="History reads per resolution")
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    parser.add_argument('--baseline', help="Compare with a previous JSON result")
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    benches = {'collection': bench_collection, 'channel_sync': bench_channel_sync,
+               'retention': bench_retention, 'history': bench_history, 'decode': bench_decode}
+    tmpdir = tempfile.mkdtemp()
+    results = {}
+    try:
+        for name in scenarios:
+            print(f"== {name}")
+            results[name] = benches[name](args, tmpdir)
+            for key, value in _flatten(results[name]).items():
+                print(f"  {key:40} {value:>14.4f}" if isinstance(value, float) else f"  {key:40} {value:>14}")
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    report = {'params': vars(args), 'environment': environment(), 'results': results}
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"== compared with {args.baseline} (seconds: lower is better, per_sec: higher is better)")
+        for name, previous, current, ratio in compare(results, baseline.get('results', {})):
+            print(f"  {name:40} {previous:>12.4f} -> {current:>12.4f}  x{ratio:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from src.utils import metrics
+from src.api.lightning_client import (
+    get_channel_data,
+    get_graph_edges,
+    get_amboss_fee,
+    get_amboss_fees,
+    get_amboss_batch_size,
+)
+
+# チャネル数がこの値以上の場合、auto モードでは /v1/graph のスナップショットを使う
+DEFAULT_GRAPH_SNAPSHOT_THRESHOLD = 500
+
+# 1 回の収集で LND / Amboss からの取得にかける時間の上限（秒）
+DEFAULT_DEADLINE_SECONDS = 300
+
+
+def fetch_channel_snapshot(channel, config, fee_cache=None, channel_data=None):
+    """
+    1チャネル分のエッジ情報と Amboss 手数料を取得する
+    fee_cache を指定した場合は有効期限内のキャッシュ済み手数料を使う
+    channel_data を指定した場合（指紋が変わっていないチャネル）はエッジ情報を取得せずにそれを使う
+
+    Returns:
+        (channel_data, amboss_fee) のタプル
+        エッジ情報の取得に失敗した場合は Amboss を呼ばずに amboss_fee を None で返す
+    """
+    if channel_data is None:
+        channel_data = get_channel_data(channel['chan_id'], config)
+    if channel_data.get("error"):
+        return channel_data, None
+
+    amboss_fee = get_amboss_fee(channel['remote_pubkey'], config, fee_cache)
+    return channel_data, amboss_fee
+
+
+def get_concurrency(config):
+    """config.yaml の collection.concurrency を取得する（1 未満は 1 として扱う）"""
+    concurrency = config.get('collection', {}).get('concurrency', 1)
+    try:
+        return max(1, int(concurrency))
+    except (TypeError, ValueError):
+        print(f"collection.concurrency の値が不正です: {concurrency}。逐次実行します。")
+        return 1
+
+
+def get_deadline_seconds(config):
+    """config.yaml の collection.deadline_seconds を取得する（0 で期限なし）"""
+    seconds = config.get('collection', {}).get('deadline_seconds', DEFAULT_DEADLINE_SECONDS)
+    try:
+        return max(0.0, float(seconds or 0))
+    except (TypeError, ValueError):
+        print(f"collection.deadline_seconds の値が不正です: {seconds}。{DEFAULT_DEADLINE_SECONDS}秒とします。")
+        return DEFAULT_DEADLINE_SECONDS
+
+
+def get_edge_source(config, channel_count):
+    """
+    エッジ情報の取得方法を決める
+    collection.edge_source が auto の場合は、チャネル数が
+    collection.graph_snapshot_threshold 以上なら 'graph'、それ未満なら 'edge' を返す
+    """
+    collection = config.get('collection', {})
+    edge_source = collection.get('edge_source', 'auto')
+    if edge_source in ('edge', 'graph'):
+        return edge_source
+    if edge_source != 'auto':
+        print(f"collection.edge_source の値が不正です: {edge_source}。auto として扱います。")
+    threshold = collection.get('graph_snapshot_threshold', DEFAULT_GRAPH_SNAPSHOT_THRESHOLD)
+    return 'graph' if channel_count >= threshold else 'edge'
+
+
+def collect_channel_snapshots(channel_lists, config, concurrency=1, fee_cache=None, fingerprints=None):
+    """
+    各チャネルのデータを取得し、channel_lists と同じ順序で返すジェネレータ
+
+    concurrency が 2 以上の場合はスレッドプールで並列に取得する。
+    エッジ情報はチャネル数に応じて /v1/graph/edge をチャネルごとに呼ぶか、
+    /v1/graph のスナップショットから取り出す（get_edge_source() 参照）。
+    amboss.batch_size が 2 以上の場合は、エッジ情報を取得した後に
+    Amboss 手数料をバッチクエリでまとめて取得する。
+    fingerprints (ChannelFingerprintCache) を指定した場合、num_updates と active が前回と同じチャネルは
+    一定時間エッジ情報を取得せず、前回のポリシーから作り直したエッジを使う（collection.edge_refresh_minutes）。
+    取得エラーのチャネルはメッセージを表示してスキップする（逐次実行時と同じ動作）。
+    実行期限 (resilience.deadline) を過ぎた後のチャネルは問い合わせずにスキップし、実行中のメトリクスに記録する。
+
+    Yields:
+        (channel, channel_data, amboss_fee) のタプル
+    """
+    node_id = config.get('lightning', {}).get('node_id')
+    reused = fingerprints.reusable_edges(node_id, channel_lists) if fingerprints is not None else {}
+    if reused:
+        metrics.increment('edges_reused', len(reused))
+    stale = [channel for channel in channel_lists if channel['chan_id'] not in reused]
+    edge_source = get_edge_source(config, len(stale))
+    batch_size = get_amboss_batch_size(config)
+
+    if edge_source == 'edge' and batch_size <= 1:
+        # エッジ情報と手数料をチャネルごとに続けて取得する（フェーズは edges にまとめて記録する）
+        fetch = lambda channel: fetch_channel_snapshot(channel, config, fee_cache, reused.get(channel['chan_id']))
+        with metrics.phase('edges'):
+            results = list(_map_ordered(fetch, channel_lists, concurrency))
+        for channel, (channel_data, amboss_fee) in results:
+            if _report_error(channel, channel_data, node_id):
+                continue
+            yield channel, channel_data, amboss_fee
+        return
+
+    fetched = []
+    with metrics.phase('edges'):
+        edges = dict(reused)
+        if stale:
+            edges.update((channel['chan_id'], channel_data)
+                         for channel, channel_data in _fetch_edges(stale, config, concurrency, edge_source))
+        for channel in channel_lists:
+            channel_data = edges[channel['chan_id']]
+            if _report_error(channel, channel_data, node_id):
+                continue
+            fetched.append((channel, channel_data))
+
+    if batch_size > 1:
+        pubkeys = [channel['remote_pubkey'] for channel, _ in fetched]
+        with metrics.phase('amboss'):
+            fees = get_amboss_fees(pubkeys, config, fee_cache, batch_size)
+        for channel, channel_data in fetched:
+            yield channel, channel_data, fees[channel['remote_pubkey']]
+        return
+
+    fetch = lambda item: get_amboss_fee(item[0]['remote_pubkey'], config, fee_cache)
+    with metrics.phase('amboss'):
+        results = list(_map_ordered(fetch, fetched, concurrency))
+    for (channel, channel_data), amboss_fee in results:
+        yield channel, channel_data, amboss_fee
+
+
+def _fetch_edges(channel_lists, config, concurrency, edge_source):
+    """各チャネルのエッジ情報を (channel, channel_data) として channel_lists の順に返す"""
+    fetch = lambda channel: get_channel_data(channel['chan_id'], config)
+    if edge_source != 'graph':
+        return _map_ordered(fetch, channel_lists, concurrency)
+
+    try:
+        index = get_graph_edges([channel['chan_id'] for channel in channel_lists], config)
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"グラフスナップショットの取得中にエラーが発生しました: {e}。チャネルごとに取得します。")
+        return _map_ordered(fetch, channel_lists, concurrency)
+
+    # スナップショットに含まれないチャネルだけ個別に取得する
+    missing = [channel for channel in channel_lists if channel['chan_id'] not in index]
+    for channel, channel_data in _map_ordered(fetch, missing, concurrency):
+        index[channel['chan_id']] = channel_data
+
+    return [(channel, index[channel['chan_id']]) for channel in channel_lists]
+
+
+def _map_ordered(func, items, concurrency):
+    """func を各要素に適用し、(要素, 結果) を items の順に返す"""
+    if concurrency <= 1 or len(items) <= 1:
+        for item in items:
+            yield item, func(item)
+        return
+
+    workers = min(concurrency, len(items))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # executor.map は投入順に結果を返すため、チャネルの順序が保たれる
+        yield from zip(items, executor.map(func, items))
+
+
+def _report_error(channel, channel_data, node_id=None):
+    """
+    エッジ情報の取得エラーを表示し、エラーだった場合は True を返す
+    実行期限でスキップしたチャネルは表示せず、メトリクスにスキップとして記録する
+    """
+    if channel_data.get("skipped"):
+        metrics.record_skip(node_id, channel['chan_id'])
+        return True
+    if channel_data.get("error"):
+        print(f"チャンネル {channel['chan_id']} のデータ取得中にエラーが発生しました: {channel_data.get('message')}")
+        metrics.increment('edge_errors')
+        return True
+    return False
@@ -0,0 +1,26 @@
+# LND / Amboss の JSON 応答のデコード（orjson がある場合は orjson、無い場合は標準の json）
+# チャネル一覧・エッジ情報とも response.json() と同じ辞書のまま返す
+# （__slots__ のレコードに変換すると orjson の辞書より遅くなるため。benchmarks/run_benchmarks.py の decode）。
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson はオプション（poetry install -E fast-json）
+    orjson = None
+
+
+def loads(data):
+    """JSON の bytes / str をデコードする"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def decode_channels(data):
+    """/v1/channels の応答からチャネル（辞書）のリストを作る"""
+    return loads(data).get('channels') or []
+
+
+def decode_edge(data):
+    """/v1/graph/edge/{chan_id} の応答からエッジ（辞書）を作る"""
+    return loads(data)
@@ -0,0 +1,276 @@
+import base64
+import queue
+import threading
+import time
+
+import requests
+
+from src.api.lightning_client import (
+    get_client,
+    get_channel_data,
+    get_amboss_fee,
+)
+
+# 購読が切れた場合の再接続の待ち時間（秒、失敗するたびに倍にする）
+STREAM_RETRY_MIN_SECONDS = 1
+STREAM_RETRY_MAX_SECONDS = 60
+
+# 取りこぼしを補うための全件取得の間隔（秒）
+DEFAULT_RECONCILE_SECONDS = 3600
+
+
+def format_channel_point(point):
+    """
+    ChannelPoint ({funding_txid_bytes | funding_txid_str, output_index}) を
+    /v1/channels の channel_point と同じ 'txid:index' 形式に変換する
+    """
+    if isinstance(point, str):
+        return point
+    txid = point.get('funding_txid_str')
+    if not txid:
+        # funding_txid_bytes はバイト順が逆の txid を base64 エンコードしたもの
+        txid = base64.b64decode(point.get('funding_txid_bytes', ''))[::-1].hex()
+    return f"{txid}:{point.get('output_index', 0)}"
+
+
+def _policy_fees(policy):
+    """ポリシーのうち記録する (fee_rate_milli_msat, inbound_fee_rate_milli_msat)（未公開の場合は 0）"""
+    policy = policy or {}
+    return int(policy.get('fee_rate_milli_msat', 0) or 0), int(policy.get('inbound_fee_rate_milli_msat', 0) or 0)
+
+
+class ChannelState:
+    """
+    イベントを反映するための自ノードのチャネルの状態
+    (chan_id -> /v1/channels のチャネル情報の辞書, chan_id -> /v1/graph/edge のエッジ情報の辞書)
+    """
+
+    def __init__(self):
+        self.channels = {}
+        self.edges = {}
+        self._points = {}
+
+    def load(self, channel_lists, edges=None):
+        """全件取得の結果で状態を置き換える"""
+        self.channels = {channel['chan_id']: channel for channel in channel_lists}
+        self._points = {channel.get('channel_point'): channel['chan_id'] for channel in channel_lists}
+        self.edges = {chan_id: edge for chan_id, edge in (edges or {}).items() if chan_id in self.channels}
+
+    def apply_channel_event(self, update):
+        """
+        /v1/channels/subscribe のイベントを反映する
+
+        Returns:
+            (行を書き込むチャネルの chan_id の集合, チャネル一覧が変わった場合 True)
+        """
+        event_type = update.get('type')
+        if event_type == 'OPEN_CHANNEL':
+            channel = update.get('open_channel') or {}
+            if not channel.get('chan_id'):
+                return set(), False
+            self.channels[channel['chan_id']] = channel
+            self._points[channel.get('channel_point')] = channel['chan_id']
+            return {channel['chan_id']}, True
+
+        if event_type == 'CLOSED_CHANNEL':
+            closed = update.get('closed_channel') or {}
+            chan_id = closed.get('chan_id') or self._points.get(closed.get('channel_point'))
+            if chan_id not in self.channels:
+                return set(), False
+            channel = self.channels.pop(chan_id)
+            self._points.pop(channel.get('channel_point'), None)
+            self.edges.pop(chan_id, None)
+            return set(), True
+
+        if event_type in ('ACTIVE_CHANNEL', 'INACTIVE_CHANNEL'):
+            point = update.get('active_channel' if event_type == 'ACTIVE_CHANNEL' else 'inactive_channel')
+            chan_id = self._points.get(format_channel_point(point or {}))
+            if chan_id is None:
+                return set(), False
+            active = event_type == 'ACTIVE_CHANNEL'
+            if self.channels[chan_id].get('active') == active:
+                return set(), False
+            self.channels[chan_id]['active'] = active
+            return {chan_id}, False
+
+        # PENDING_OPEN_CHANNEL / FULLY_RESOLVED_CHANNEL などは記録するデータが変わらない
+        return set(), False
+
+    def apply_graph_update(self, update):
+        """
+        /v1/graph/subscribe の更新のうち自ノードのチャネルのポリシー変更を反映する
+
+        Returns:
+            行を書き込むチャネルの chan_id の集合
+        """
+        changed = set()
+        for channel_update in update.get('channel_updates') or []:
+            chan_id = channel_update.get('chan_id')
+            if chan_id not in self.channels:
+                continue
+            edge = self.edges.get(chan_id)
+            if edge is None:
+                # エッジ情報が未取得の場合は書き込み時に取得する（取得結果に新しいポリシーが含まれる）
+                changed.add(chan_id)
+                continue
+            advertising_node = channel_update.get('advertising_node')
+            if advertising_node == edge.get('node1_pub'):
+                key = 'node1_policy'
+            elif advertising_node == edge.get('node2_pub'):
+                key = 'node2_policy'
+            else:
+                continue
+            policy = channel_update.get('routing_policy') or {}
+            # last_update など記録しないフィールドだけが変わった場合は書き込まない
+            if _policy_fees(edge.get(key)) != _policy_fees(policy):
+                changed.add(chan_id)
+            edge[key] = policy
+        return changed
+
+
+class EventCapture:
+    """
+    LND のストリーミング API を購読し、イベントが届いたチャネルの行だけを書き込む
+
+    購読はストリームごとのスレッドで行い、イベントはキューを通してこのオブジェクトを
+    実行しているスレッドで処理する（SQLite の接続はスレッド間で共有しない）。
+    続けて届いたイベントはまとめて反映し、チャネルごとに 1 行だけ書き込む。
+    チャネルの残高は購読するイベントでは通知されないため、reconcile_seconds ごとに
+    reconcile() で全件を取得し直して取りこぼしを補う。
+    """
+
+    def __init__(self, db, config, reconcile, fee_cache=None, reconcile_seconds=DEFAULT_RECONCILE_SECONDS,
+                 read_timeout=None):
+        """
+        Args:
+            reconcile: 全件取得を行い、(channel, channel_data, amboss_fee) のリストを返す関数
+        """
+        self.db = db
+        self.config = config
+        self.fee_cache = fee_cache
+        self.reconcile_seconds = reconcile_seconds
+        self.read_timeout = read_timeout
+        self.state = ChannelState()
+        self._reconcile = reconcile
+        self._queue = queue.Queue()
+        self._stop_event = threading.Event()
+        self._threads = []
+
+    @classmethod
+    def from_config(cls, db, config, reconcile, fee_cache=None):
+        """config.yaml の events 設定から生成する"""
+        events = config.get('events', {})
+        return cls(db, config, reconcile, fee_cache,
+                   reconcile_seconds=events.get('reconcile_seconds', DEFAULT_RECONCILE_SECONDS),
+                   read_timeout=events.get('read_timeout'))
+
+    def stop(self):
+        """処理中のイベントを書き込んだ後に停止する"""
+        self._stop_event.set()
+
+    @property
+    def stopped(self):
+        return self._stop_event.is_set()
+
+    def start_streams(self):
+        """チャネルイベントとグラフ更新の購読スレッドを開始する"""
+        client = get_client(self.config)
+        streams = (
+            ('channels', lambda: client.subscribe_channel_events(self.read_timeout)),
+            ('graph', lambda: client.subscribe_graph(self.read_timeout)),
+        )
+        for name, subscribe in streams:
+            # 読み込み中のストリームは中断できないため、終了時に待たないデーモンスレッドにする
+            thread = threading.Thread(target=self._stream_worker, args=(name, subscribe),
+                                      name=f'lnd-subscribe-{name}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _stream_worker(self, name, subscribe):
+        """ストリームを購読してイベントをキューに入れる（切断時は待ち時間を延ばしながら再接続する）"""
+        delay = STREAM_RETRY_MIN_SECONDS
+        while not self.stopped:
+            try:
+                for update in subscribe():
+                    self._queue.put((name, update))
+                    delay = STREAM_RETRY_MIN_SECONDS
+                print(f"{name} の購読が終了しました。再接続します...")
+            except (requests.exceptions.RequestException, ValueError) as e:
+                print(f"{name} の購読中にエラーが発生しました: {e}。{delay}秒後に再接続します。")
+            self._stop_event.wait(delay)
+            delay = min(delay * 2, STREAM_RETRY_MAX_SECONDS)
+
+    def reconcile(self):
+        """全件を取得して書き込み、チャネルの状態を取得結果で置き換える"""
+        snapshots = self._reconcile()
+        self.state.load([channel for channel, _, _ in snapshots],
+                        {channel['chan_id']: edge for channel, edge, _ in snapshots})
+
+    def handle(self, events):
+        """
+        (ストリーム名, イベント) のリストを反映し、変更があったチャネルの行を書き込む
+
+        Returns:
+            書き込んだ行数
+        """
+        changed = set()
+        list_changed = False
+        for name, update in events:
+            if name == 'channels':
+                chan_ids, channel_list_changed = self.state.apply_channel_event(update)
+                changed |= chan_ids
+                list_changed = list_changed or channel_list_changed
+            else:
+                changed |= self.state.apply_graph_update(update)
+
+        if list_changed:
+            self.db.update_channel_lists(list(self.state.channels.values()))
+
+        snapshots = []
+        for chan_id in sorted(changed):
+            channel = self.state.channels.get(chan_id)
+            if channel is None:
+                continue
+            edge = self.state.edges.get(chan_id)
+            if edge is None:
+                edge = get_channel_data(chan_id, self.config)
+                if edge.get("error"):
+                    print(f"チャンネル {chan_id} のデータ取得中にエラーが発生しました: {edge.get('message')}")
+                    continue
+                self.state.edges[chan_id] = edge
+            amboss_fee = get_amboss_fee(channel['remote_pubkey'], self.config, self.fee_cache)
+            snapshots.append((channel, edge, amboss_fee))
+
+        if not snapshots:
+            return 0
+        # 変更があったチャネルだけの書き込み
+        result = self.db.insert_channel_datas(snapshots, partial=True)
+        print(f"イベントにより {self.db.storage_table()} に {result['inserted']}件 のサンプルを書き込みました ({result['date']})")
+        return result['inserted']
+
+    def run(self):
+        """
+        購読を開始し、stop() が呼ばれるまでイベントの書き込みと定期的な全件取得を行う
+        """
+        self.reconcile()
+        next_reconcile = time.monotonic() + self.reconcile_seconds
+        self.start_streams()
+        while not self.stopped:
+            timeout = max(0, min(1.0, next_reconcile - time.monotonic()))
+            try:
+                events = [self._queue.get(timeout=timeout)]
+            except queue.Empty:
+                events = []
+            # 続けて届いているイベントはまとめて反映する
+            while True:
+                try:
+                    events.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if events:
+                self.handle(events)
+            if time.monotonic() >= next_reconcile:
+                started = time.monotonic()
+                self.reconcile()
+                print(f"全件取得による照合が完了しました ({time.monotonic() - started:.2f}秒)")
+                next_reconcile = time.monotonic() + self.reconcile_seconds
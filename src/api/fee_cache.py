@@ -0,0 +1,93 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class AmbossFeeCache:
+    """
+    リモートノードの pubkey をキーにした Amboss 手数料の TTL キャッシュ
+
+    実行中はメモリ上（LRU）で保持し、db を指定した場合は
+    amboss_fee_cache テーブルに保存して次回の実行に引き継ぐ。
+    get()/put() はワーカースレッドから呼び出してよいが、
+    load()/save() はデータベース接続を持つスレッドから呼び出すこと。
+    """
+
+    def __init__(self, ttl_seconds=3600, max_entries=5000, db=None):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.db = db
+        self._entries = OrderedDict()  # pubkey -> (fee, fetched_at)
+        self._dirty = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_config(cls, config, db=None):
+        """config.yaml の amboss.cache_ttl_minutes / cache_max_entries から生成する（TTL が 0 なら None）"""
+        amboss = config.get('amboss', {})
+        ttl_minutes = amboss.get('cache_ttl_minutes', 60)
+        if not ttl_minutes or ttl_minutes <= 0:
+            return None
+        cache = cls(ttl_seconds=int(ttl_minutes * 60),
+                    max_entries=int(amboss.get('cache_max_entries', 5000)),
+                    db=db)
+        cache.load()
+        return cache
+
+    def _is_fresh(self, fetched_at, now):
+        return now - fetched_at < self.ttl_seconds
+
+    def get(self, pubkey, allow_stale=False):
+        """
+        有効期限内の手数料を返す（期限切れ・未登録の場合は None）
+        allow_stale を指定すると、Amboss を呼べない場合の代わりとして期限切れの値も返す
+        （期限切れのエントリは上限を超えるまで残しておく）
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(pubkey)
+            if entry is None:
+                self.misses += 1
+                return None
+            fee, fetched_at = entry
+            if not allow_stale and not self._is_fresh(fetched_at, now):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(pubkey)
+            self.hits += 1
+            return fee
+
+    def put(self, pubkey, fee, fetched_at=None):
+        """手数料をキャッシュに登録する（上限を超えた場合は古いものから削除）"""
+        if fetched_at is None:
+            fetched_at = time.time()
+        with self._lock:
+            self._entries[pubkey] = (fee, fetched_at)
+            self._entries.move_to_end(pubkey)
+            self._dirty[pubkey] = (fee, fetched_at)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def load(self):
+        """データベースから有効期限内のエントリを読み込む"""
+        if self.db is None:
+            return 0
+        min_fetched_at = int(time.time() - self.ttl_seconds)
+        rows = self.db.load_amboss_fee_cache(min_fetched_at, self.max_entries)
+        with self._lock:
+            for pubkey, fee, fetched_at in rows:
+                self._entries[pubkey] = (fee, fetched_at)
+        return len(rows)
+
+    def save(self):
+        """今回取得したエントリをデータベースに保存し、期限切れ・上限超過分を削除する"""
+        if self.db is None:
+            return 0
+        with self._lock:
+            dirty = [(pubkey, fee, int(fetched_at)) for pubkey, (fee, fetched_at) in self._dirty.items()]
+            self._dirty.clear()
+        self.db.save_amboss_fee_cache(dirty)
+        self.db.prune_amboss_fee_cache(int(time.time() - self.ttl_seconds), self.max_entries)
+        return len(dirty)
@@ -0,0 +1,172 @@
+import threading
+import time
+import zlib
+
+# 指紋が変わっていないチャネルのエッジ情報を取得せずに使い回す期間（分）
+DEFAULT_EDGE_REFRESH_MINUTES = 60
+
+
+def _policy_values(policy):
+    """ポリシーの (last_update, fee_rate_milli_msat, inbound_fee_rate_milli_msat)（未公開の場合は 0）"""
+    if policy is None:
+        return 0, 0, 0
+    return (int(policy.get('last_update', 0) or 0), int(policy.get('fee_rate_milli_msat', 0) or 0),
+            int(policy.get('inbound_fee_rate_milli_msat', 0) or 0))
+
+
+def channel_fingerprint(channel, edge):
+    """
+    チャネルの指紋 (num_updates, active, node1 の last_update, node2 の last_update, ポリシーのハッシュ) を返す
+    残高は num_updates が、手数料は last_update とポリシーのハッシュが同じなら変わっていないとみなす
+    """
+    node1 = _policy_values(edge.get('node1_policy'))
+    node2 = _policy_values(edge.get('node2_policy'))
+    policy_hash = zlib.crc32(repr((node1[1:], node2[1:])).encode())
+    return (int(channel.get('num_updates', 0) or 0), int(bool(channel.get('active', False))), node1[0], node2[0],
+            policy_hash)
+
+
+def edge_policies(channel, edge):
+    """エッジを作り直すための (node1 がリモートか, node1 の手数料, node1 のインバウンド手数料, node2 の手数料, node2 のインバウンド手数料)"""
+    node1 = _policy_values(edge.get('node1_policy'))
+    node2 = _policy_values(edge.get('node2_policy'))
+    return (int(channel.get('remote_pubkey') == edge.get('node1_pub')),) + node1[1:] + node2[1:]
+
+
+def cached_edge(channel, fingerprint, policies):
+    """
+    指紋と edge_policies() の値から、書き込みに使うエッジを /v1/graph/edge と同じ形の辞書で作り直す
+    （int64 の fee_rate_milli_msat は LND と同じく文字列にする。ローカルの pubkey は持たない）
+    """
+    node1_remote, node1_fee, node1_infee, node2_fee, node2_infee = policies
+    remote_pubkey = channel.get('remote_pubkey')
+    return {
+        'channel_id': channel.get('chan_id'),
+        'node1_pub': remote_pubkey if node1_remote else None,
+        'node2_pub': None if node1_remote else remote_pubkey,
+        'node1_policy': {'fee_rate_milli_msat': str(node1_fee), 'inbound_fee_rate_milli_msat': node1_infee,
+                         'last_update': fingerprint[2]},
+        'node2_policy': {'fee_rate_milli_msat': str(node2_fee), 'inbound_fee_rate_milli_msat': node2_infee,
+                         'last_update': fingerprint[3]},
+    }
+
+
+class ChannelFingerprintCache:
+    """
+    ノードの各チャネルの指紋と、その時に書き込んだ手数料のキャッシュ
+
+    起動時に channel_fingerprints テーブルをすべてメモリに読み込み、書き込みに成功したチャネルの指紋を保存する。
+    num_updates と active が前回と同じチャネルは、エッジ情報を取得した時刻から edge_refresh_seconds の間、
+    保存しておいたポリシーからエッジを作り直して /v1/graph/edge の呼び出しを省く（reusable_edges()）。
+    リモートのポリシーの変更は num_updates を変えないため、その間の手数料の変更は次に取得するまで記録されない。
+    指紋と Amboss 手数料が前回と同じチャネルは、書き込みで変更の無いチャネルとして扱う
+    （Database.insert_channel_datas() の unchanged）。
+    Amboss 手数料の使い回しは AmbossFeeCache（amboss.cache_ttl_minutes）に任せ、ここでは行わない。
+    load()/update()/save() はデータベース接続を持つスレッドから呼び出すこと。
+    """
+
+    def __init__(self, write_unchanged=True, db=None, edge_refresh_seconds=DEFAULT_EDGE_REFRESH_MINUTES * 60):
+        self.write_unchanged = write_unchanged
+        self.db = db
+        self.edge_refresh_seconds = edge_refresh_seconds
+        # (node_id, chan_id) -> (fingerprint, amboss_fee, policies, edge_fetched_at)
+        self._entries = {}
+        self._dirty = {}
+        # 今回作り直したエッジ (node_id, chan_id) -> edge（指紋の計算を省き、取得時刻を引き継ぐ）
+        self._reused = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, db=None):
+        """
+        config.yaml の collection.fingerprints / write_unchanged / edge_refresh_minutes から生成する
+        （fingerprints が false なら None、edge_refresh_minutes が 0 ならエッジ情報を毎回取得する）
+        """
+        collection = config.get('collection', {})
+        if not collection.get('fingerprints', True):
+            return None
+        refresh_minutes = collection.get('edge_refresh_minutes', DEFAULT_EDGE_REFRESH_MINUTES)
+        cache = cls(write_unchanged=bool(collection.get('write_unchanged', True)), db=db,
+                    edge_refresh_seconds=max(0, int((refresh_minutes or 0) * 60)))
+        cache.load()
+        return cache
+
+    def __len__(self):
+        return len(self._entries)
+
+    def reusable_edges(self, node_id, channels):
+        """
+        num_updates と active が前回と同じで、エッジ情報の取得から edge_refresh_seconds 以内のチャネルの
+        作り直したエッジを {chan_id: edge} で返す（このチャネルのエッジ情報は取得しなくてよい）
+        """
+        now = time.time()
+        reused = {}
+        with self._lock:
+            for key in [key for key in self._reused if key[0] == node_id]:
+                del self._reused[key]
+            if self.edge_refresh_seconds <= 0:
+                return reused
+            for channel in channels:
+                key = (node_id, channel['chan_id'])
+                entry = self._entries.get(key)
+                if entry is None or now - entry[3] >= self.edge_refresh_seconds:
+                    continue
+                fingerprint = entry[0]
+                if fingerprint[:2] != (int(channel.get('num_updates', 0) or 0), int(bool(channel.get('active', False)))):
+                    continue
+                edge = cached_edge(channel, fingerprint, entry[2])
+                self._reused[key] = edge
+                reused[channel['chan_id']] = edge
+        return reused
+
+    def unchanged_channels(self, node_id, snapshots):
+        """(channel, channel_data, amboss_fee) のうち、指紋と Amboss 手数料が前回と同じチャネルの chan_id の集合"""
+        unchanged = set()
+        with self._lock:
+            for channel, channel_data, amboss_fee in snapshots:
+                key = (node_id, channel['chan_id'])
+                entry = self._entries.get(key)
+                if entry is None or entry[1] != amboss_fee:
+                    continue
+                # 作り直したエッジは reusable_edges() で num_updates と active を比較済み
+                if self._reused.get(key) is channel_data or entry[0] == channel_fingerprint(channel, channel_data):
+                    unchanged.add(channel['chan_id'])
+        return unchanged
+
+    def update(self, node_id, snapshots):
+        """書き込んだ (channel, channel_data, amboss_fee) の指紋を記録する"""
+        now = int(time.time())
+        with self._lock:
+            for channel, channel_data, amboss_fee in snapshots:
+                key = (node_id, channel['chan_id'])
+                previous = self._entries.get(key)
+                if previous is not None and self._reused.get(key) is channel_data:
+                    # 作り直したエッジはポリシーと取得時刻を引き継ぐ
+                    entry = previous[:1] + (amboss_fee,) + previous[2:]
+                else:
+                    entry = (channel_fingerprint(channel, channel_data), amboss_fee,
+                             edge_policies(channel, channel_data), now)
+                if entry != previous:
+                    self._entries[key] = entry
+                    self._dirty[key] = entry
+
+    def load(self):
+        """データベースからすべての指紋を読み込む"""
+        if self.db is None:
+            return 0
+        rows = self.db.load_channel_fingerprints()
+        with self._lock:
+            for row in rows:
+                node_id, chan_id = row[:2]
+                self._entries[(node_id, chan_id)] = (tuple(row[2:7]), row[7], tuple(row[8:13]), row[13])
+        return len(rows)
+
+    def save(self):
+        """今回変わった指紋をデータベースに保存する"""
+        if self.db is None:
+            return 0
+        with self._lock:
+            dirty = [key + fingerprint + (fee,) + policies + (fetched_at,)
+                     for key, (fingerprint, fee, policies, fetched_at) in self._dirty.items()]
+            self._dirty.clear()
+        return self.db.save_channel_fingerprints(dirty)
@@ -0,0 +1,160 @@
+import codecs
+import json
+
+_WHITESPACE = ' \t\n\r'
+
+
+class JsonStreamReader:
+    """
+    バイト列のチャンクから JSON を少しずつ読み込むリーダー
+
+    配列の要素を 1 つずつ取り出せるため、巨大な JSON（describegraph など）でも
+    メモリ上に保持するのは読み込み中の要素とチャンク分のバッファだけになる。
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json_decoder = json.JSONDecoder()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self):
+        """次のチャンクをバッファに追加する（読み込み済みの部分は捨てる）"""
+        while not self._eof:
+            try:
+                chunk = next(self._chunks)
+            except StopIteration:
+                self._eof = True
+                text = self._text_decoder.decode(b'', final=True)
+            else:
+                text = self._text_decoder.decode(chunk)
+            if text or self._eof:
+                self._buf = self._buf[self._pos:] + text
+                self._pos = 0
+                return bool(text)
+        return False
+
+    def peek(self):
+        """空白を読み飛ばして次の文字を返す（終端の場合は空文字）"""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char):
+        """次の文字が char であることを確認して読み進める"""
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"JSON の解析に失敗しました: '{char}' が必要ですが '{found}' がありました")
+        self._pos += 1
+
+    def read_value(self):
+        """次の JSON 値を 1 つ読み込んで返す"""
+        self.peek()
+        while True:
+            try:
+                value, end = self._json_decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # 数値などはバッファ末尾で途切れている可能性があるため続きを読んでから確定する
+            if end == len(self._buf) and not self._eof and self._buf[self._pos] not in '{["':
+                self._fill()
+                continue
+            self._pos = end
+            return value
+
+    def iter_array(self):
+        """配列の要素を 1 つずつ返すジェネレータ"""
+        self.expect('[')
+        if self.peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self.read_value()
+            separator = self.peek()
+            self._pos += 1
+            if separator == ']':
+                return
+            if separator != ',':
+                raise ValueError(f"JSON の解析に失敗しました: 配列内に不正な文字 '{separator}' があります")
+
+    def iter_values(self):
+        """連続した JSON 値（改行区切りのストリームなど）を 1 つずつ返すジェネレータ"""
+        while self.peek():
+            yield self.read_value()
+
+    def iter_object(self):
+        """
+        オブジェクトの (キー, 値) を返すジェネレータ
+        値が配列の場合は要素のジェネレータを返す（読み飛ばす場合も消費すること）
+        """
+        self.expect('{')
+        if self.peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            key = self.read_value()
+            self.expect(':')
+            if self.peek() == '[':
+                items = self.iter_array()
+                yield key, items
+                for _ in items:
+                    pass
+            else:
+                yield key, self.read_value()
+            separator = self.peek()
+            self._pos += 1
+            if separator == '}':
+                return
+            if separator != ',':
+                raise ValueError(f"JSON の解析に失敗しました: オブジェクト内に不正な文字 '{separator}' があります")
+
+
+def iter_graph_edges(chunks):
+    """
+    /v1/graph (describegraph) のレスポンスから edges の要素を 1 つずつ返す
+    nodes など他のキーは要素単位で読み飛ばす
+    """
+    reader = JsonStreamReader(chunks)
+    for key, value in reader.iter_object():
+        if key == 'edges':
+            yield from value
+
+
+def build_edge_index(edges, channel_ids):
+    """
+    エッジのストリームから channel_ids に含まれるチャネルだけの chan_id -> edge 辞書を作る
+    すべて見つかった時点で読み込みを打ち切る
+    """
+    wanted = set(channel_ids)
+    index = {}
+    for edge in edges:
+        channel_id = edge.get('channel_id')
+        if channel_id in wanted:
+            index[channel_id] = edge
+            if len(index) == len(wanted):
+                break
+    return index
+
+
+def iter_stream_results(chunks):
+    """
+    LND REST のストリーミング API (grpc-gateway) のレスポンスから、
+    {"result": ...} の中身を 1 件ずつ返す
+
+    Raises:
+        ValueError: {"error": ...} が返された場合
+    """
+    reader = JsonStreamReader(chunks)
+    for message in reader.iter_values():
+        if 'error' in message:
+            error = message['error'] or {}
+            raise ValueError(f"ストリームでエラーが返されました: {error.get('message', error)}")
+        yield message.get('result', {})
@@ -1,108 +1,376 @@
 import requests
+from requests.adapters import HTTPAdapter
 import codecs
-import json
-import os
-from datetime import datetime, timedelta
-import sqlite3
+import ssl
+import threading
+import time
 
-def get_channel_lists(config=None):
+from src.api.graph_stream import iter_graph_edges, build_edge_index, iter_stream_results
+from src.api import resilience
+from src.api.decode import decode_channels, decode_edge, loads
+from src.api.resilience import CircuitBreaker, CircuitOpenError, DeadlineExceeded
+from src.utils import metrics
+
+# /v1/graph をストリーミングで読み込む際のチャンクサイズ
+GRAPH_CHUNK_SIZE = 64 * 1024
+
+# 接続・読み取りタイムアウトのデフォルト値（秒）
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 30
+DEFAULT_AMBOSS_READ_TIMEOUT = 15
+
+# 一時的なエラー（接続エラー・タイムアウト・429・5xx）の再試行回数と待ち時間の基準値（秒）
+DEFAULT_RETRIES = 2
+DEFAULT_AMBOSS_RETRIES = 1
+DEFAULT_RETRY_BACKOFF_SECONDS = 0.5
+
+# Amboss のサーキットブレーカー: 連続して失敗した回数と、呼び出しを止める時間（秒）
+DEFAULT_AMBOSS_BREAKER_FAILURES = 5
+DEFAULT_AMBOSS_BREAKER_RESET_SECONDS = 300
+
+# Amboss から手数料が取得できなかった場合のデフォルト値
+AMBOSS_DEFAULT_FEE = 2000
+
+# メトリクスに記録する Amboss のエンドポイント名
+AMBOSS_ENDPOINT = 'amboss:/graphql'
+
+
+class _LndTLSAdapter(HTTPAdapter):
+    """事前に作成した SSLContext を全コネクションで共有する HTTPAdapter"""
+
+    def __init__(self, ssl_context, **kwargs):
+        self.ssl_context = ssl_context
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['ssl_context'] = self.ssl_context
+        return super().init_poolmanager(*args, **kwargs)
+
+    def cert_verify(self, conn, url, verify, cert):
+        # CA は ssl_context に読み込み済みのため、コネクションごとの再読み込みを行わない
+        conn.cert_reqs = "CERT_REQUIRED"
+        conn.ca_certs = None
+        conn.ca_cert_dir = None
+
+
+class LightningClient:
+    """
+    LND REST API クライアント
+
+    macaroon と TLS 証明書は生成時に一度だけ読み込み、
+    keep-alive の接続プールを持つ Session を使い回す。
+    一時的なエラーは lightning.retries 回まで再試行し、実行期限 (resilience.deadline) がある場合は
+    タイムアウトを残り時間以下に切り詰める。
+    """
+
+    def __init__(self, config=None, pool_size=None):
+        if not config:
+            raise ValueError("Configuration is required")
+
+        lightning = config.get('lightning', {})
+        self.rest_host = lightning.get('api_url')
+        macaroon_path = lightning.get('macaroon_path')
+        tls_path = lightning.get('tls_path')
+
+        if not all([self.rest_host, macaroon_path, tls_path]):
+            raise ValueError("Missing required Lightning configuration")
+
+        with open(macaroon_path, 'rb') as f:
+            macaroon = codecs.encode(f.read(), 'hex')
+
+        self.timeout = (
+            lightning.get('connect_timeout', DEFAULT_CONNECT_TIMEOUT),
+            lightning.get('read_timeout', DEFAULT_READ_TIMEOUT),
+        )
+        self.retries = int(lightning.get('retries', DEFAULT_RETRIES))
+        self.retry_backoff_seconds = lightning.get('retry_backoff_seconds', DEFAULT_RETRY_BACKOFF_SECONDS)
+
+        if pool_size is None:
+            pool_size = config.get('collection', {}).get('concurrency', 1)
+        pool_size = max(1, int(pool_size))
+
+        ssl_context = ssl.create_default_context(cafile=tls_path)
+        adapter = _LndTLSAdapter(ssl_context, pool_connections=1, pool_maxsize=pool_size)
+
+        self.session = requests.Session()
+        self.session.headers.update({'Grpc-Metadata-macaroon': macaroon})
+        self.session.mount('https://', adapter)
+
+    def _get(self, path, params=None, endpoint=None):
+        """
+        GET して応答を返す（所要時間は endpoint (省略時は path) ごとに実行中のメトリクスに記録する）
+
+        Raises:
+            DeadlineExceeded: 実行期限を過ぎている場合
+            requests.exceptions.RequestException: 再試行しても失敗した場合
+        """
+        def request():
+            timeout = resilience.request_timeout(self.timeout)
+            started = time.perf_counter()
+            try:
+                response = self.session.get(f'{self.rest_host}{path}', params=params, timeout=timeout)
+                response.raise_for_status()
+            except requests.exceptions.RequestException:
+                metrics.observe_http(f'lnd:{endpoint or path}', time.perf_counter() - started, error=True)
+                raise
+            metrics.observe_http(f'lnd:{endpoint or path}', time.perf_counter() - started)
+            return response
+
+        return resilience.call_with_retries(request, self.retries, self.retry_backoff_seconds)
+
+    def get_channel_lists(self):
+        """/v1/channels からチャネル一覧を取得する（エラー時は空のリスト）"""
+        # alias
+        params = {
+            "peer_alias_lookup": "true"
+        }
+
+        try:
+            response = self._get('/v1/channels', params=params)
+            # APIレスポンスから必要なデータを抽出
+            return decode_channels(response.content)
+        except requests.exceptions.RequestException as e:
+            # エラー発生時は、空のリストを返す
+            print(f"チャネル一覧の取得中にエラーが発生しました: {e}")
+            metrics.increment('channel_list_errors')
+            return []
+        except ValueError as e:
+            print(f"チャネル一覧の解析中にエラーが発生しました: {e}")
+            metrics.increment('channel_list_errors')
+            return []
+
+    def get_channel_data(self, channel_id):
+        """
+        /v1/graph/edge/{channel_id} からエッジ情報を取得する
+        実行期限を過ぎていた（または期限までに応答が無かった）場合は skipped を付けたエラー情報を返す
+        """
+        try:
+            response = self._get(f'/v1/graph/edge/{channel_id}', endpoint='/v1/graph/edge')
+            return decode_edge(response.content)
+        except requests.exceptions.RequestException as e:
+            if isinstance(e, DeadlineExceeded) or resilience.expired():
+                return {"error": True, "skipped": True, "message": str(e)}
+            # エラー発生時は、エラー情報を含むディクショナリを返す
+            return {"error": True, "message": str(e)}
+        except ValueError as e:
+            return {"error": True, "message": f"エッジ情報の解析に失敗しました: {e}"}
+
+    def get_graph_edges(self, channel_ids):
+        """
+        /v1/graph (describegraph) をストリーミングで読み込み、
+        channel_ids に含まれるチャネルの chan_id -> エッジ情報 の辞書を返す
+        グラフ全体はメモリに保持せず、エッジを 1 件ずつ解析する
+
+        Raises:
+            requests.exceptions.RequestException: グラフの取得に失敗した場合
+        """
+        params = {
+            "include_unannounced": "true"
+        }
+        url = f'{self.rest_host}/v1/graph'
+
+        def request():
+            timeout = resilience.request_timeout(self.timeout)
+            # ストリーミングで解析するため、読み込みと解析を合わせた時間を記録する
+            started = time.perf_counter()
+            try:
+                with self.session.get(url, params=params, timeout=timeout, stream=True) as response:
+                    response.raise_for_status()
+                    edges = iter_graph_edges(response.iter_content(chunk_size=GRAPH_CHUNK_SIZE))
+                    index = build_edge_index(edges, channel_ids)
+            except (requests.exceptions.RequestException, ValueError):
+                metrics.observe_http('lnd:/v1/graph', time.perf_counter() - started, error=True)
+                raise
+            metrics.observe_http('lnd:/v1/graph', time.perf_counter() - started)
+            return index
+
+        return resilience.call_with_retries(request, self.retries, self.retry_backoff_seconds)
+
+    def _subscribe(self, path, read_timeout):
+        """ストリーミング API を購読し、届いたメッセージを 1 件ずつ返すジェネレータ"""
+        timeout = (self.timeout[0], read_timeout or None)
+        with self.session.get(f'{self.rest_host}{path}', timeout=timeout, stream=True) as response:
+            response.raise_for_status()
+            # chunk_size=None で、届いたチャンクをそのまま解析する（バッファが溜まるのを待たない）
+            yield from iter_stream_results(response.iter_content(chunk_size=None))
+
+    def subscribe_channel_events(self, read_timeout=None):
+        """
+        /v1/channels/subscribe を購読し、チャネルのイベント (ChannelEventUpdate) を 1 件ずつ返す
+        read_timeout を指定しない場合、イベントが届くまで無期限に待つ
+
+        Raises:
+            requests.exceptions.RequestException: 接続が切れた場合
+            ValueError: ストリームでエラーが返された場合
+        """
+        return self._subscribe('/v1/channels/subscribe', read_timeout)
+
+    def subscribe_graph(self, read_timeout=None):
+        """/v1/graph/subscribe を購読し、グラフの更新 (GraphTopologyUpdate) を 1 件ずつ返す"""
+        return self._subscribe('/v1/graph/subscribe', read_timeout)
+
+    def close(self):
+        """接続プールを閉じる"""
+        self.session.close()
+
+
+# 接続先ごとに LightningClient を共有する
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(config):
+    """config の接続先に対応する LightningClient を返す（初回のみ生成）"""
     if not config:
         raise ValueError("Configuration is required")
 
-    # 通常の実行時はAPI呼び出し
-    # configを使用してLightningネットワークの接続設定を取得
-    rest_host = config.get('lightning', {}).get('api_url')
-    macaroon_path = config.get('lightning', {}).get('macaroon_path')
-    tls_path = config.get('lightning', {}).get('tls_path')
-    
-    if not all([rest_host, macaroon_path, tls_path]):
-        raise ValueError("Missing required Lightning configuration")
-
-    url = f'{rest_host}/v1/channels'
-    macaroon = codecs.encode(open(macaroon_path, 'rb').read(), 'hex')
-    headers = {'Grpc-Metadata-macaroon': macaroon}
-    
-    # alias
-    params = {
-        "peer_alias_lookup": "true"
-    }
+    lightning = config.get('lightning', {})
+    key = (lightning.get('api_url'), lightning.get('macaroon_path'), lightning.get('tls_path'))
+
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = LightningClient(config)
+            _clients[key] = client
+        return client
+
+
+def close_clients():
+    """共有している LightningClient をすべて閉じる"""
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+# Amboss の接続先ごとのサーキットブレーカー（実行をまたいで状態を保持する）
+_amboss_breakers = {}
+
+
+def get_amboss_breaker(config):
+    """config の Amboss の接続先に対応する CircuitBreaker を返す（初回のみ生成）"""
+    amboss = config.get('amboss', {})
+    key = amboss.get('api_url', 'api.amboss.space')
+    with _clients_lock:
+        breaker = _amboss_breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(amboss.get('breaker_failures', DEFAULT_AMBOSS_BREAKER_FAILURES),
+                                     amboss.get('breaker_reset_seconds', DEFAULT_AMBOSS_BREAKER_RESET_SECONDS))
+            _amboss_breakers[key] = breaker
+        return breaker
+
+
+def reset_amboss_breakers():
+    """Amboss のサーキットブレーカーの状態をすべて破棄する"""
+    with _clients_lock:
+        _amboss_breakers.clear()
+
+
+def _amboss_unavailable(config):
+    """実行期限を過ぎているか、サーキットブレーカーが開いているため Amboss を呼ばない場合は True"""
+    if resilience.expired():
+        return True
+    return bool(config) and get_amboss_breaker(config).state == 'open'
+
+
+def _fallback_amboss_fee(remote_pubkey, fee_cache=None):
+    """Amboss から取得できない場合の手数料（期限切れを含むキャッシュ済みの値、無ければデフォルト値）"""
+    metrics.increment('amboss_fallbacks')
+    fee = fee_cache.get(remote_pubkey, allow_stale=True) if fee_cache is not None else None
+    return AMBOSS_DEFAULT_FEE if fee is None else fee
+
+
+def _post_amboss(url, payload, headers, config):
+    """
+    Amboss に GraphQL のリクエストを送信する
+    一時的なエラーは amboss.retries 回まで再試行し、失敗した場合はサーキットブレーカーに記録する
+
+    Raises:
+        CircuitOpenError: サーキットブレーカーが開いている場合
+        DeadlineExceeded: 実行期限を過ぎている場合
+        requests.exceptions.RequestException: 再試行しても失敗した場合
+    """
+    amboss = config.get('amboss', {})
+    timeout = (amboss.get('connect_timeout', DEFAULT_CONNECT_TIMEOUT),
+               amboss.get('read_timeout', DEFAULT_AMBOSS_READ_TIMEOUT))
+    breaker = get_amboss_breaker(config)
+    if not breaker.allow():
+        raise CircuitOpenError("Amboss circuit breaker is open")
+
+    def request():
+        request_timeout = resilience.request_timeout(timeout)
+        started = time.perf_counter()
+        try:
+            response = requests.post(url, json=payload, headers=headers, timeout=request_timeout)
+            response.raise_for_status()
+        except requests.exceptions.RequestException:
+            metrics.observe_http(AMBOSS_ENDPOINT, time.perf_counter() - started, error=True)
+            raise
+        metrics.observe_http(AMBOSS_ENDPOINT, time.perf_counter() - started)
+        return response
 
     try:
-        response = requests.get(url, headers=headers, verify=tls_path, params=params)
-        response.raise_for_status()
-        
-        # APIレスポンスから必要なデータを抽出
-        channel_lists_data = response.json().get('channels', [])
-        return channel_lists_data
-    except requests.exceptions.RequestException as e:
-        # エラー発生時は、空のリストを返す
-        return []
+        response = resilience.call_with_retries(request, int(amboss.get('retries', DEFAULT_AMBOSS_RETRIES)),
+                                                amboss.get('retry_backoff_seconds', DEFAULT_RETRY_BACKOFF_SECONDS))
+    except DeadlineExceeded:
+        raise
+    except requests.exceptions.RequestException:
+        # 実行期限で打ち切ったタイムアウトは Amboss の障害として数えない
+        if not resilience.expired():
+            breaker.record_failure()
+        raise
+    breaker.record_success()
+    return response
+
+
+def get_channel_lists(config=None):
+    return get_client(config).get_channel_lists()
+
 
 def get_channel_data(channel_id, config=None):
-    if not config:
-        raise ValueError("Configuration is required")
+    return get_client(config).get_channel_data(channel_id)
 
-    # 通常の実行時はAPI呼び出し
-    # configを使用してLightningネットワークの接続設定を取得
-    rest_host = config.get('lightning', {}).get('api_url')
-    macaroon_path = config.get('lightning', {}).get('macaroon_path')
-    tls_path = config.get('lightning', {}).get('tls_path')
-    
-    if not all([rest_host, macaroon_path, tls_path]):
-        raise ValueError("Missing required Lightning configuration")
 
-    url = f'{rest_host}/v1/graph/edge/{channel_id}'
-    macaroon = codecs.encode(open(macaroon_path, 'rb').read(), 'hex')
-    headers = {'Grpc-Metadata-macaroon': macaroon}
+def get_graph_edges(channel_ids, config=None):
+    return get_client(config).get_graph_edges(channel_ids)
 
-    try:
-        response = requests.get(url, headers=headers, verify=tls_path)
-        response.raise_for_status()
-        channel_data = response.json()
-        return channel_data
-    except requests.exceptions.RequestException as e:
-        # エラー発生時は、エラー情報を含むディクショナリを返す
-        return {"error": True, "message": str(e)}
-
-def update_channel_list(db_connection, channel_data):
-    cursor = db_connection.cursor()
-    for channel in channel_data:
-        cursor.execute("""
-            INSERT INTO channel_lists (channel_name, channel_id, capacity)
-            VALUES (?, ?, ?)
-            ON CONFLICT(channel_id) DO UPDATE SET
-                channel_name = excluded.channel_name,
-                capacity = excluded.capacity
-        """, (channel['channel_name'], channel['channel_id'], channel['capacity']))
-    db_connection.commit()
-
-def update_channel_data(db_connection, channel_id, data):
-    cursor = db_connection.cursor()
-    cursor.execute("""
-        INSERT INTO channel_datas (id, date, local_balance, local_fee, local_infee, remote_balance, remote_fee, remote_infee)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    """, (channel_id, datetime.now(), data['local_balance'], data['local_fee'], data['local_infee'], data['remote_balance'], data['remote_fee'], data['remote_infee']))
-    db_connection.commit()
-
-def delete_old_data(db_connection, months):
-    cursor = db_connection.cursor()
-    cutoff_date = datetime.now().replace(day=1) - timedelta(days=months*30)
-    cursor.execute("DELETE FROM channel_datas WHERE date < ?", (cutoff_date,))
-    db_connection.commit()
-
-def get_amboss_fee(remote_pubkey, config=None):
+
+def get_amboss_fee(remote_pubkey, config=None, fee_cache=None):
     """
     Amboss APIから指定されたノードの手数料情報を取得する
     整数値に変換して返す
     エラーが発生した場合はデフォルト値を返す
+    fee_cache を指定すると有効期限内のキャッシュ値を優先し、取得できた値をキャッシュに保存する
+    実行期限を過ぎた場合とサーキットブレーカーが開いている場合は、API を呼ばずに
+    期限切れを含むキャッシュ済みの値（無ければデフォルト値）を返す
+    """
+    if fee_cache is not None:
+        fee = fee_cache.get(remote_pubkey)
+        if fee is not None:
+            return fee
+
+    if _amboss_unavailable(config):
+        return _fallback_amboss_fee(remote_pubkey, fee_cache)
+
+    fee = _fetch_amboss_fee(remote_pubkey, config)
+    if fee is None:
+        metrics.increment('amboss_errors')
+        return _fallback_amboss_fee(remote_pubkey, fee_cache)
+
+    if fee_cache is not None:
+        fee_cache.put(remote_pubkey, fee)
+    return fee
+
+
+def _fetch_amboss_fee(remote_pubkey, config=None):
+    """
+    Amboss APIから手数料を取得する
+    取得できなかった場合は None を返す（デフォルト値はキャッシュしない）
     """
-    # デフォルト値を設定
-    default_fee = 2000
-    
     try:
         if not config:
             print("configがありません。デフォルト値を返します。")
-            return default_fee
+            return None
 
         # 通常の実行時はAPI呼び出し
         # configを使用してAmboss APIの接続設定を取得
@@ -111,7 +379,7 @@ def get_amboss_fee(remote_pubkey, config=None):
         
         if not api_key:
             print("Amboss API キーが設定されていません。デフォルト値を返します。")
-            return default_fee
+            return None
 
         url = f'{rest_host}/graphql'
 
@@ -143,33 +411,156 @@ def get_amboss_fee(remote_pubkey, config=None):
             'Content-Type': 'application/json'
         }
 
-        # リクエストを送信
-        response = requests.post(url, json={"query": query, "variables": variables}, headers=headers)
-
-        # 例外処理
-        response.raise_for_status()
+        # リクエストを送信（タイムアウト・再試行・サーキットブレーカーは _post_amboss で扱う）
+        try:
+            response = _post_amboss(url, {"query": query, "variables": variables}, headers, config)
+        except (CircuitOpenError, DeadlineExceeded):
+            return None
 
         # レスポンスからデータを抽出
-        response_data = response.json()
-        #print("#### response data = ", response_data)
-
-        # データを解析して手数料を取得
         try:
-            fee_info = response_data.get('data', {}).get('getNode', {}).get('graph_info', {})
-            channels = fee_info.get('channels', [])
-            
-            fee = channels.get('fee_info', {}).get('remote', {}).get('weighted_corrected')
-            if fee is not None:
-                # 浮動小数点数を整数に変換（小数点以下切り捨て）
-                return int(float(fee))
-            
-            print(f"ノード {remote_pubkey} の手数料情報が取得できませんでした。デフォルト値を返します。")
-            return default_fee
-            
-        except (KeyError, IndexError, ValueError) as e:
+            response_data = loads(response.content)
+        except ValueError as e:
             print(f"手数料情報のパース中にエラーが発生しました: {e}")
-            return default_fee
+            return None
+
+        # getNode.graph_info.channels はオブジェクト（リストではない）
+        fee = _parse_amboss_node_fee((response_data.get('data') or {}).get('getNode'))
+        if fee is not None:
+            return fee
+
+        print(f"ノード {remote_pubkey} の手数料情報が取得できませんでした。デフォルト値を返します。")
+        return None
 
     except Exception as e:
         print(f"Amboss API呼び出し中にエラーが発生しました: {e}")
-        return default_fee
\ No newline at end of file
+        return None
+
+# バッチクエリで 1 ノードごとに取得するフィールド
+_AMBOSS_NODE_FEE_FIELDS = """
+    graph_info {
+      channels {
+        fee_info {
+          remote {
+            weighted_corrected
+          }
+        }
+      }
+    }"""
+
+DEFAULT_AMBOSS_BATCH_SIZE = 25
+
+
+def get_amboss_batch_size(config):
+    """config.yaml の amboss.batch_size を取得する（1 以下ならバッチ化しない）"""
+    batch_size = config.get('amboss', {}).get('batch_size', DEFAULT_AMBOSS_BATCH_SIZE)
+    try:
+        return max(1, int(batch_size))
+    except (TypeError, ValueError):
+        print(f"amboss.batch_size の値が不正です: {batch_size}。バッチ化せずに取得します。")
+        return 1
+
+
+def build_amboss_batch_query(count):
+    """エイリアス n0..n{count-1} を付けた getNode を並べた GraphQL クエリを生成する"""
+    variables = ", ".join(f"$p{i}: String!" for i in range(count))
+    selections = "\n".join(
+        f"  n{i}: getNode(pubkey: $p{i}) {{{_AMBOSS_NODE_FEE_FIELDS}\n  }}" for i in range(count)
+    )
+    return f"query Query({variables}) {{\n{selections}\n}}"
+
+
+def _parse_amboss_node_fee(node):
+    """getNode の結果から weighted_corrected を整数で取り出す（取得できなければ None）"""
+    try:
+        fee = node['graph_info']['channels']['fee_info']['remote']['weighted_corrected']
+        if fee is None:
+            return None
+        # 浮動小数点数を整数に変換（小数点以下切り捨て）
+        return int(float(fee))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def get_amboss_fees(remote_pubkeys, config=None, fee_cache=None, batch_size=None):
+    """
+    複数ノードの Amboss 手数料をまとめて取得する
+    エイリアス付きの getNode を batch_size 件ずつ 1 回の GraphQL リクエストで問い合わせ、
+    取得・パースに失敗したノードと、実行期限・サーキットブレーカーで問い合わせなかったノードは
+    期限切れを含むキャッシュ済みの値（無ければデフォルト値）を返す
+
+    Returns:
+        pubkey -> 手数料 の辞書
+    """
+    fees = {}
+    pending = []
+    for pubkey in dict.fromkeys(remote_pubkeys):
+        fee = fee_cache.get(pubkey) if fee_cache is not None else None
+        if fee is not None:
+            fees[pubkey] = fee
+        else:
+            pending.append(pubkey)
+
+    if not pending:
+        return fees
+
+    if not config:
+        print("configがありません。デフォルト値を返します。")
+        fees.update((pubkey, AMBOSS_DEFAULT_FEE) for pubkey in pending)
+        return fees
+
+    api_key = config.get('amboss', {}).get('api_key')
+    rest_host = config.get('amboss', {}).get('api_url', 'api.amboss.space')
+    if not api_key:
+        print("Amboss API キーが設定されていません。デフォルト値を返します。")
+        fees.update((pubkey, AMBOSS_DEFAULT_FEE) for pubkey in pending)
+        return fees
+
+    if batch_size is None:
+        batch_size = get_amboss_batch_size(config)
+
+    url = f'{rest_host}/graphql'
+    headers = {
+        'Authorization': f'Bearer {api_key}',
+        'Content-Type': 'application/json'
+    }
+
+    for start in range(0, len(pending), batch_size):
+        chunk = pending[start:start + batch_size]
+        if _amboss_unavailable(config):
+            fees.update((pubkey, _fallback_amboss_fee(pubkey, fee_cache)) for pubkey in chunk)
+            continue
+        nodes = _fetch_amboss_nodes(url, headers, chunk, config)
+        if nodes is None:
+            fees.update((pubkey, _fallback_amboss_fee(pubkey, fee_cache)) for pubkey in chunk)
+            continue
+        for i, pubkey in enumerate(chunk):
+            fee = _parse_amboss_node_fee(nodes.get(f"n{i}"))
+            if fee is None:
+                print(f"ノード {pubkey} の手数料情報が取得できませんでした。キャッシュ済みの値かデフォルト値を返します。")
+                metrics.increment('amboss_errors')
+                fees[pubkey] = _fallback_amboss_fee(pubkey, fee_cache)
+                continue
+            fees[pubkey] = fee
+            if fee_cache is not None:
+                fee_cache.put(pubkey, fee)
+
+    return fees
+
+
+def _fetch_amboss_nodes(url, headers, pubkeys, config):
+    """
+    1 チャンク分のバッチクエリを送信し、エイリアス -> getNode 結果 の辞書を返す
+    失敗した場合は空の辞書、実行期限・サーキットブレーカーで送信しなかった場合は None を返す
+    """
+    query = build_amboss_batch_query(len(pubkeys))
+    variables = {f"p{i}": pubkey for i, pubkey in enumerate(pubkeys)}
+    try:
+        response = _post_amboss(url, {"query": query, "variables": variables}, headers, config)
+        # 一部のノードでエラーがあっても data には他のノードの結果が入る
+        return loads(response.content).get('data') or {}
+    except (CircuitOpenError, DeadlineExceeded):
+        return None
+    except Exception as e:
+        print(f"Amboss API呼び出し中にエラーが発生しました: {e}")
+        return {}
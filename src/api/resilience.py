@@ -0,0 +1,175 @@
+# LND / Amboss への HTTP リクエストの実行期限・再試行・サーキットブレーカー
+# 実行期限は 1 回の収集で 1 つだけ有効にし、ワーカースレッドのリクエストもその残り時間で打ち切る
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+# 再試行の待ち時間の上限 (秒)
+MAX_BACKOFF_SECONDS = 10.0
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """実行期限を過ぎたためリクエストを送らなかった（または打ち切った）"""
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """サーキットブレーカーが開いているためリクエストを送らなかった"""
+
+
+class Deadline:
+    """1 回の収集の実行期限"""
+
+    def __init__(self, seconds, clock=time.monotonic):
+        self.seconds = seconds
+        self._clock = clock
+        self._expires_at = clock() + seconds
+
+    def remaining(self):
+        return max(0.0, self._expires_at - self._clock())
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+    def timeout(self, timeout):
+        """
+        (接続, 読み取り) のタイムアウトを残り時間以下に切り詰めて返す
+
+        Raises:
+            DeadlineExceeded: 期限を過ぎている場合
+        """
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"deadline of {self.seconds}s exceeded")
+        if isinstance(timeout, tuple):
+            return tuple(remaining if value is None else min(value, remaining) for value in timeout)
+        return remaining if timeout is None else min(timeout, remaining)
+
+
+# 実行中の Deadline（無い場合は期限なし）
+_active = None
+_active_lock = threading.Lock()
+
+
+@contextmanager
+def deadline(seconds):
+    """
+    with ブロックの間、seconds 秒の実行期限を有効にする（0 以下なら期限なし）
+    既に期限が有効な場合（collect_nodes() から collect_once() を呼ぶ場合など）は外側の期限を使う
+    """
+    global _active
+    with _active_lock:
+        outer = _active
+        if outer is None and seconds and seconds > 0:
+            _active = Deadline(seconds)
+        current_deadline = _active
+    try:
+        yield current_deadline
+    finally:
+        if outer is None:
+            with _active_lock:
+                _active = None
+
+
+def current():
+    """実行中の Deadline を返す（無い場合は None）"""
+    return _active
+
+
+def expired():
+    """実行期限があり、それを過ぎている場合は True"""
+    active = _active
+    return active is not None and active.expired
+
+
+def request_timeout(timeout):
+    """実行期限がある場合は timeout を残り時間以下に切り詰める（期限切れなら DeadlineExceeded）"""
+    active = _active
+    return timeout if active is None else active.timeout(timeout)
+
+
+def is_transient(error):
+    """再試行すれば成功する可能性があるエラー（接続エラー・タイムアウト・429・5xx）か"""
+    if isinstance(error, DeadlineExceeded):
+        return False
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return False
+
+
+def call_with_retries(func, retries=2, backoff_seconds=0.5, sleep=time.sleep, jitter_fn=random.uniform):
+    """
+    func() を呼び、一時的なエラーの場合は最大 retries 回まで再試行する
+    待ち時間は backoff_seconds * 2^n を上限とするランダムな値（full jitter）で、
+    実行期限までに待ち切れない場合は再試行せずに最後のエラーを送出する
+    """
+    attempt = 0
+    while True:
+        try:
+            return func()
+        except requests.exceptions.RequestException as e:
+            if attempt >= retries or not is_transient(e):
+                raise
+            delay = jitter_fn(0, min(MAX_BACKOFF_SECONDS, backoff_seconds * 2 ** attempt))
+            active = _active
+            if active is not None and active.remaining() <= delay:
+                raise
+            sleep(delay)
+            attempt += 1
+
+
+class CircuitBreaker:
+    """
+    連続して failure_threshold 回失敗したら reset_seconds 秒間呼び出しを止めるサーキットブレーカー
+
+    reset_seconds が経過すると 1 回だけ試し (half-open)、成功すれば再開、失敗すれば再び止める。
+    ワーカースレッドから呼び出してよい。
+    """
+
+    def __init__(self, failure_threshold=5, reset_seconds=300, clock=time.monotonic):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_seconds = reset_seconds
+        self._clock = clock
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if self._trial or self._clock() - self._opened_at < self.reset_seconds:
+                return 'open'
+            return 'half-open'
+
+    def allow(self):
+        """呼び出してよいか（half-open の場合は試しの 1 回だけ True）"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial or self._clock() - self._opened_at < self.reset_seconds:
+                return False
+            self._trial = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._trial:
+                    print(f"連続 {self._failures} 回失敗したため、{self.reset_seconds}秒間呼び出しを停止します。")
+                self._opened_at = self._clock()
+                self._trial = False
@@ -1,27 +1,121 @@
 import sqlite3
 from sqlite3 import Error
-from datetime import datetime
+from datetime import datetime, timedelta
+import copy
+import glob
+import json
+import math
 import os
+import re
+import time
+from pathlib import Path
+
+from src.db.rollups import (
+    ROLLUP_TABLES,
+    ROLLUP_COLUMNS,
+    rollup_table_sql,
+    rollup_samples,
+    rollup_rollups,
+    hour_bucket,
+    day_bucket,
+)
+from src.db.timeseries import (
+    SERIES_COLUMNS,
+    DEFAULT_CHUNK_SIZE,
+    rows_to_columns,
+    make_grid,
+    resample,
+)
+from src.utils import metrics
 
 class Database:
     """SQLite3 database manager for Lightning Network node channel data."""
     
-    def __init__(self, db_path):
+    # channel_datas の date カラムの書式
+    DATE_FORMAT = '%Y-%m-%d %H:%M'
+
+    # サンプルの保存形式
+    #   legacy : channel_datas (TEXT の日時と scid、rowid テーブル)
+    #   compact: channel_samples (エポック秒と整数の chan_id、(channel_id, ts) をキーにした WITHOUT ROWID テーブル)
+    #   delta  : channel_intervals (値が変わったときだけ行を追加し、変わらない間は valid_to を延ばす)
+    STORAGE_FORMATS = ('legacy', 'compact', 'delta')
+
+    # サンプルのファイル分割
+    #   none   : すべてのサンプルを db_path に保存する
+    #   monthly: サンプルを月ごとのファイル (<db_path の拡張子の前>_YYYY-MM.db) に保存する
+    #            書き込む月のファイルだけを読み書き可能で ATTACH し、それ以外の月は読み込み時に読み込み専用で ATTACH する
+    #            channel_lists・ロールアップ・手数料キャッシュは db_path に保存する（delta 形式では使えない）
+    PARTITIONING = ('none', 'monthly')
+
+    # 同時に ATTACH しておく月ごとのファイルの数（SQLite の ATTACH の上限は既定で 10）
+    MAX_ATTACHED_PARTITIONS = 8
+
+    # チャネル一覧・サンプル・ロールアップはノード (node_id) ごとに保存する
+    # node_id を指定しない場合、およびノード別にする前のデータベースの既存の行のノード
+    DEFAULT_NODE_ID = 'default'
+
+    # 接続時に設定する PRAGMA のデフォルト値（config.yaml の database.pragmas で上書き可能）
+    DEFAULT_PRAGMAS = {
+        'journal_mode': 'WAL',      # 読み込み側と書き込み側が互いにブロックしない
+        'synchronous': 'NORMAL',    # WAL では NORMAL でも破損しない（電源断時に直近のコミットが失われる可能性のみ）
+        'cache_size': -16000,       # ページキャッシュ 16MB (負の値は KiB 単位)
+        'mmap_size': 268435456,     # 256MB までメモリマップで読み込む
+        'temp_store': 'MEMORY',     # ソートなどの一時データをメモリに置く
+        'busy_timeout': 5000,       # ロック中は最大 5 秒待つ (ミリ秒)
+    }
+
+    def __init__(self, db_path, storage='legacy', pragmas=None, partitioning='none', node_id=DEFAULT_NODE_ID,
+                 log_dir=None):
         """Initialize with database file path."""
+        if storage not in self.STORAGE_FORMATS:
+            raise ValueError(f"Unknown storage format: {storage}")
+        if partitioning not in self.PARTITIONING:
+            raise ValueError(f"Unknown partitioning: {partitioning}")
+        if partitioning != 'none' and storage == 'delta':
+            raise ValueError("Partitioning is not supported with the delta storage format")
+        if partitioning != 'none' and db_path == ':memory:':
+            raise ValueError("Partitioning requires a database file")
         self.db_path = db_path
+        self.storage = storage
+        self.partitioning = partitioning
+        # チャネル一覧・サンプルを読み書きするノード（for_node() で別のノードを扱う）
+        self.node_id = node_id
+        # チャネルの変更ログ (channel_changes.log) を書き込むディレクトリ（None の場合はコンソールにのみ表示）
+        # 相対パスは実行時のカレントディレクトリではなく、データベースファイルのディレクトリを基準にする
+        if log_dir and not os.path.isabs(log_dir) and db_path != ':memory:':
+            log_dir = os.path.join(os.path.dirname(os.path.abspath(db_path)), log_dir)
+        self.log_dir = log_dir
+        # ATTACH している月 ('YYYY-MM') -> 読み書き可能なら True（最近使った順）
+        self._attached = {}
+        self.pragmas = dict(self.DEFAULT_PRAGMAS)
+        for name, value in (pragmas or {}).items():
+            if name not in self.DEFAULT_PRAGMAS:
+                raise ValueError(f"Unsupported pragma: {name}")
+            if not re.fullmatch(r'-?\w+', str(value)):
+                raise ValueError(f"Invalid value for pragma {name}: {value}")
+            self.pragmas[name] = value
+        self.effective_pragmas = {}
         self.conn = None
     
     def connect(self):
         """Create a database connection to the SQLite database with UTF-8 support."""
         try:
             # SQLite データベースに接続する際に UTF-8 をデフォルトとして設定
-            self.conn = sqlite3.connect(self.db_path)
+            # 月ごとのファイルを読み込み専用 (file:...?mode=ro) で ATTACH するため URI を有効にする
+            self.conn = sqlite3.connect(self.db_path, uri=self.partitioning != 'none')
             
             # テキストの読み取り/書き込み時に UTF-8 を使用するよう設定
             self.conn.text_factory = str  # Python 3 では UTF-8 がデフォルト
             
             # 外部キー制約を有効にする
             self.conn.execute("PRAGMA foreign_keys = ON")
+
+            # 新規のデータベースは journal_mode の変更やテーブル作成の前に auto_vacuum を INCREMENTAL にしておく
+            if self.conn.execute("SELECT COUNT(*) FROM sqlite_master;").fetchone()[0] == 0:
+                self.conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
+            # パフォーマンス関連の PRAGMA を設定し、実際に有効になった値を記録
+            self.apply_pragmas()
             
             # クエリ結果を辞書形式で取得できるように設定（オプション）
             self.conn.row_factory = sqlite3.Row
@@ -31,12 +125,44 @@ class Database:
             print(f"Database connection error: {e}")
             return False
     
+    def for_node(self, node_id):
+        """
+        同じ接続を共有し、node_id のノードのチャネル一覧・サンプルを読み書きする Database を返します。
+        接続を閉じる close() は元の Database で呼び出してください。
+        """
+        view = copy.copy(self)
+        view.node_id = node_id
+        return view
+
+    def apply_pragmas(self):
+        """self.pragmas を接続に設定し、有効になった値を self.effective_pragmas に保存します。"""
+        for name, value in self.pragmas.items():
+            self.conn.execute(f"PRAGMA {name} = {value}")
+            row = self.conn.execute(f"PRAGMA {name}").fetchone()
+            self.effective_pragmas[name] = row[0] if row else None
+        return self.effective_pragmas
+
+    def report_pragmas(self):
+        """有効になっている PRAGMA の値を表示します。"""
+        values = ', '.join(f"{name}={value}" for name, value in self.effective_pragmas.items())
+        print(f"SQLite 設定: {values}")
+
     def initialize(self, update_channel=False):
-        """必要なテーブルを作成してデータベースを初期化します。"""
+        """
+        必要なテーブルを作成してデータベースを初期化します。
+        ノード別にする前のテーブルがある場合は何もせずに False を返します（migrate_to_node_scope() で移行します）。
+        """
         if not self.conn:
             if not self.connect():
                 return False
         
+        # ノード別にする前のテーブルは書き込まない（大きなテーブルを作り直すため、移行は明示的に実行する）
+        pending = self.unmigrated_node_tables()
+        if pending:
+            print(f"ノード別にする前のテーブルがあります ({', '.join(pending)})。収集を止めて、既存の行のノードを指定して"
+                  f"移行してください: python src/main.py --migrate_node_scope --node_id <node_id>")
+            return False
+
         # update_channel フラグが True の場合、channel_lists テーブルを再構築
         if update_channel:
             self.rebuild_channel_lists_table()
@@ -44,6 +170,15 @@ class Database:
             self.create_channel_lists_table()
             
         self.create_channel_datas_table()
+        self.create_channel_datas_indexes()
+        if self.storage == 'compact':
+            self.create_channel_samples_table()
+        elif self.storage == 'delta':
+            self.create_channel_intervals_tables()
+        self.create_amboss_fee_cache_table()
+        self.create_channel_fingerprints_table()
+        self.create_rollup_tables()
+        self.create_runs_table()
         return True
 
     def rebuild_channel_lists_table(self):
@@ -92,10 +227,12 @@ class Database:
         """channel_lists テーブルを作成します。"""
         sql = '''CREATE TABLE IF NOT EXISTS channel_lists (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    node_id TEXT NOT NULL,
                     channel_name TEXT NOT NULL,
-                    channel_id TEXT NOT NULL UNIQUE,
+                    channel_id TEXT NOT NULL,
                     channel_point TEXT,
-                    capacity INTEGER NOT NULL
+                    capacity INTEGER NOT NULL,
+                    UNIQUE (node_id, channel_id)
                   );'''
         try:
             cursor = self.conn.cursor()
@@ -103,9 +240,16 @@ class Database:
         except Error as e:
             print(f"channel_lists テーブル作成中にエラー発生: {e}")
     
-    def create_channel_datas_table(self):
-        """Create the channel_datas table with channel_id as foreign key."""
-        sql = '''CREATE TABLE IF NOT EXISTS channel_datas (
+    def create_channel_datas_table(self, schema='main'):
+        """
+        Create the channel_datas table with channel_id as foreign key.
+        月ごとのファイル (schema) では channel_lists が別のファイルにあるため外部キーを付けません。
+        """
+        foreign_key = ''
+        if schema == 'main':
+            foreign_key = ',\n                    FOREIGN KEY (node_id, channel_id) REFERENCES channel_lists (node_id, channel_id)'
+        sql = f'''CREATE TABLE IF NOT EXISTS {schema}.channel_datas (
+                    node_id TEXT NOT NULL,
                     channel_id TEXT NOT NULL,
                     date TEXT NOT NULL,
                     local_balance INTEGER,
@@ -116,8 +260,7 @@ class Database:
                     remote_infee INTEGER,
                     num_updates INTEGER,
                     amboss_fee INTEGER,
-                    active INTEGER,
-                    FOREIGN KEY (channel_id) REFERENCES channel_lists (channel_id)
+                    active INTEGER{foreign_key}
                   );'''
         try:
             cursor = self.conn.cursor()
@@ -125,136 +268,774 @@ class Database:
         except Error as e:
             print(f"Error creating channel_datas table: {e}")
     
-    def update_channel_lists(self, channels):
-        """バルクアップデートのためのトランザクション最適化を実装"""
-        if not self.conn:
-            self.connect()
-        
+    # channel_datas のインデックス（名前 -> カラム）
+    #   チャネルごとの範囲検索と、日時の範囲で全ノードをまとめて読む問い合わせ（エクスポートなど）用
+    CHANNEL_DATAS_INDEXES = {
+        'idx_channel_datas_node_channel_date': '(node_id, channel_id, date)',
+        'idx_channel_datas_date_node': '(date, node_id, channel_id)',
+    }
+
+    def create_channel_datas_indexes(self, schema='main'):
+        """channel_datas のインデックスを作成します（既存のデータベースにも冪等に作成）。"""
         try:
-            # トランザクションを開始
-            self.conn.execute("BEGIN TRANSACTION")
-            
-            # 現在のチャンネルデータを取得
-            current_channels = self._get_current_channels()
-            current_channel_ids = {channel['channel_id'] for channel in current_channels}
-            
-            # API から取得したチャンネル ID のセットを作成
-            api_channel_ids = set()
-            inserted_channels = []
-            updated_channels = []
-            
-            # チャンネルを更新またはインサート
-            for channel in channels:
-                channel_id = channel.get('chan_id', '')
-                if not channel_id:
+            cursor = self.conn.cursor()
+            cursor.execute(f"SELECT name FROM {schema}.sqlite_master WHERE type = 'index' AND tbl_name = 'channel_datas';")
+            existing = {row[0] for row in cursor.fetchall()}
+            for name, columns in self.CHANNEL_DATAS_INDEXES.items():
+                if name in existing:
                     continue
-                    
-                api_channel_ids.add(channel_id)
-                
-                #debug
-                #print("##### channel #####")
-                #print(channel)
-
-                # チャンネルを更新またはインサート
-                result = self.update_channel(
-                    channel.get('peer_alias', ''), 
-                    channel_id,
-                    channel.get('channel_point', ''),  # channel_point を追加
-                    channel.get('capacity', 0)
-                )
-                
-                # 新規追加か更新かを判定
-                if channel_id in current_channel_ids:
-                    updated_channels.append(channel)
-                else:
-                    inserted_channels.append(channel)
-            
-            # API に存在しない古いチャンネルを削除
-            deleted_channels = self._delete_removed_channels(current_channels, api_channel_ids)
-            
-            # トランザクションをコミット
+                # 既存の大きなテーブルでは初回のみ時間がかかる
+                print(f"channel_datas にインデックス {name} {columns} を作成しています...")
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS {schema}.{name} ON channel_datas {columns};")
             self.conn.commit()
-            
-            # ログ出力（トランザクション外で行う）
-            self._log_channel_changes(inserted_channels, updated_channels, deleted_channels)
-            
-            return {
-                'inserted': len(inserted_channels),
-                'updated': len(updated_channels),
-                'deleted': len(deleted_channels)
-            }
-        except Exception as e:
-            # エラーが発生した場合はロールバック
+        except Error as e:
+            print(f"channel_datas のインデックス作成中にエラー発生: {e}")
+
+    # 同じノード・チャネル・日時の channel_datas の行のうち、最後に書き込んだ行以外
+    CHANNEL_DATAS_DUPLICATES_SQL = '''FROM {table} WHERE rowid NOT IN (
+                                          SELECT MAX(rowid) FROM {table} GROUP BY node_id, channel_id, date)'''
+
+    def remove_duplicate_channel_datas(self, dry_run=False):
+        """
+        同じノード・チャネル・日時の channel_datas の行を、最後に書き込んだ 1 行だけにします（月ごとのファイルも対象）。
+        テーブル全体を読むため、収集を止めて一度だけ実行してください（--dedupe_channel_datas）。
+        削除する前にファイル・ノードごとの件数を表示し、dry_run の場合は表示だけで削除しません。
+
+        Returns:
+            削除した（dry_run の場合は削除する）行の数
+        """
+        sources = [(None, 'main')]
+        if self.partitioning != 'none' and self.storage == 'legacy':
+            sources += [(month, self._partition_schema(month)) for month in self.list_partitions()]
+        removed = 0
+        try:
+            for month, schema in sources:
+                if month is not None:
+                    self._attach_partition(month, writable=not dry_run)
+                name = month or self.db_path
+                duplicates = self.CHANNEL_DATAS_DUPLICATES_SQL.format(table=f"{schema}.channel_datas")
+                counts = self.conn.execute(
+                    f"SELECT node_id, COUNT(*) {duplicates} GROUP BY node_id ORDER BY node_id;").fetchall()
+                for node_id, count in counts:
+                    print(f"{name}: ノード {node_id} の重複した行 {count}件")
+                total = sum(count for _, count in counts)
+                if total == 0 or dry_run:
+                    removed += total
+                    continue
+                cursor = self.conn.execute(f"DELETE {duplicates};")
+                self.conn.commit()
+                removed += cursor.rowcount
+                print(f"{name}: 重複した行を {cursor.rowcount}件 削除しました")
+        except Error as e:
             self.conn.rollback()
-            print(f"データベース更新中にエラーが発生しました: {e}")
-            return {'error': str(e)}
+            print(f"channel_datas の重複した行の削除中にエラーが発生しました: {e}")
+        return removed
 
-    def _get_current_channels(self):
-        """現在のデータベースに存在するすべてのチャンネル情報を取得"""
-        if not self.conn:
-            self.connect()
-            
-        sql = "SELECT id, channel_id, channel_name, channel_point, capacity FROM channel_lists;"
+    def create_channel_samples_table(self, schema='main'):
+        """コンパクト形式のサンプルを保存する channel_samples テーブルを作成します。"""
+        sql = f'''CREATE TABLE IF NOT EXISTS {schema}.channel_samples (
+                    node_id TEXT NOT NULL,
+                    channel_id INTEGER NOT NULL,
+                    ts INTEGER NOT NULL,
+                    local_balance INTEGER,
+                    local_fee INTEGER,
+                    local_infee INTEGER,
+                    remote_balance INTEGER,
+                    remote_fee INTEGER,
+                    remote_infee INTEGER,
+                    num_updates INTEGER,
+                    amboss_fee INTEGER,
+                    active INTEGER,
+                    PRIMARY KEY (node_id, channel_id, ts)
+                  ) WITHOUT ROWID;'''
         try:
             cursor = self.conn.cursor()
             cursor.execute(sql)
-            rows = cursor.fetchall()
-            return [{
-                'id': row[0],
-                'channel_id': row[1],
-                'channel_name': row[2],
-                'channel_point': row[3],
-                'capacity': row[4]
-            } for row in rows]
-        except Error as e:
-            print(f"Error retrieving channels: {e}")
+            # 日時の範囲で全ノードをまとめて読む問い合わせ用（主キーのカラムはインデックスに含まれる）
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_channel_samples_ts ON channel_samples (ts);")
+        except Error as e:
+            print(f"channel_samples テーブル作成中にエラー発生: {e}")
+
+    def create_channel_intervals_tables(self):
+        """
+        差分形式の channel_intervals テーブルと、ノードごとのサンプルを記録した日時の一覧 channel_interval_times を作成します。
+        channel_intervals の 1 行は、valid_from から valid_to までのそのノードの記録日時で値が同じだったことを表します。
+        channel_interval_times の complete は、ノードのすべてのチャネルを記録した（イベントでの一部の書き込みでない）日時を表します。
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('''CREATE TABLE IF NOT EXISTS channel_intervals (
+                                node_id TEXT NOT NULL,
+                                channel_id INTEGER NOT NULL,
+                                valid_from INTEGER NOT NULL,
+                                valid_to INTEGER NOT NULL,
+                                local_balance INTEGER,
+                                local_fee INTEGER,
+                                local_infee INTEGER,
+                                remote_balance INTEGER,
+                                remote_fee INTEGER,
+                                remote_infee INTEGER,
+                                num_updates INTEGER,
+                                amboss_fee INTEGER,
+                                active INTEGER,
+                                PRIMARY KEY (node_id, channel_id, valid_from)
+                              ) WITHOUT ROWID;''')
+            # 保持期間による削除のため
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_channel_intervals_valid_to ON channel_intervals (valid_to);")
+            cursor.execute('''CREATE TABLE IF NOT EXISTS channel_interval_times (
+                                node_id TEXT NOT NULL,
+                                ts INTEGER NOT NULL,
+                                complete INTEGER NOT NULL DEFAULT 1,
+                                PRIMARY KEY (node_id, ts)
+                              ) WITHOUT ROWID;''')
+        except Error as e:
+            print(f"channel_intervals テーブル作成中にエラー発生: {e}")
+
+    def create_rollup_tables(self):
+        """時間単位・日単位のロールアップテーブルと、集約済みの位置を記録する rollup_state を作成します。"""
+        try:
+            cursor = self.conn.cursor()
+            for table in ROLLUP_TABLES.values():
+                cursor.execute(rollup_table_sql(table))
+                # 範囲の再集約と保持期間による削除のため
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_bucket ON {table} (bucket);")
+            cursor.execute('''CREATE TABLE IF NOT EXISTS rollup_state (
+                                tier TEXT PRIMARY KEY,
+                                watermark TEXT NOT NULL
+                              );''')
+        except Error as e:
+            print(f"ロールアップテーブル作成中にエラー発生: {e}")
+
+    def _add_node_column(self, table, create, schema='main'):
+        """
+        node_id カラムの無い（ノード別にする前の）table を、create() で作成する node_id を含むスキーマで作り直します。
+        既存の行は self.node_id のノードの行として移します。コミットは呼び出し側で行います。
+
+        Returns:
+            作り直した場合は True（テーブルが無いか移行済みの場合は False）
+        """
+        cursor = self.conn.cursor()
+        columns = [row[1] for row in cursor.execute(f"PRAGMA {schema}.table_info({table});").fetchall()]
+        if not columns or 'node_id' in columns:
+            return False
+        print(f"{table} にノードのカラム (node_id) を追加しています（初回のみ、既存の行は {self.node_id} とします）...")
+        old_table = f"{table}_before_nodes"
+        cursor.execute(f"ALTER TABLE {schema}.{table} RENAME TO {old_table};")
+        # インデックスは名前ごと古いテーブルに残るため、作り直す前に削除する
+        cursor.execute(f"SELECT name FROM {schema}.sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL;",
+                       (old_table,))
+        for (name,) in cursor.fetchall():
+            cursor.execute(f"DROP INDEX {schema}.{name};")
+        create()
+        names = ', '.join(columns)
+        cursor.execute(f"INSERT INTO {schema}.{table} (node_id, {names}) SELECT ?, {names} FROM {schema}.{old_table};",
+                       (self.node_id,))
+        cursor.execute(f"DROP TABLE {schema}.{old_table};")
+        return True
+
+    def _add_node_to_interval_times(self):
+        """
+        ノードの区別が無い channel_interval_times を、ノードごとの (node_id, ts) の記録日時に作り直します。
+        既存の記録日時は、その日時を含む区間を持つノードの記録日時とします。コミットは呼び出し側で行います。
+
+        Returns:
+            作り直した場合は True（テーブルが無いか移行済みの場合は False）
+        """
+        cursor = self.conn.cursor()
+        columns = [row[1] for row in cursor.execute("PRAGMA table_info(channel_interval_times);").fetchall()]
+        if not columns or 'node_id' in columns:
+            return False
+        print("channel_interval_times をノードごとの記録日時に作り直しています（初回のみ）...")
+        cursor.execute("ALTER TABLE channel_interval_times RENAME TO channel_interval_times_before_nodes;")
+        self.create_channel_intervals_tables()
+        cursor.execute('''INSERT INTO channel_interval_times (node_id, ts)
+                          SELECT DISTINCT i.node_id, t.ts FROM channel_interval_times_before_nodes t
+                          JOIN channel_intervals i ON t.ts BETWEEN i.valid_from AND i.valid_to;''')
+        cursor.execute("DROP TABLE channel_interval_times_before_nodes;")
+        return True
+
+    def _node_scoped_tables(self):
+        """ノードごとに保存するテーブルの (テーブル名, 作成する関数) のリスト"""
+        return [
+            ('channel_lists', self.create_channel_lists_table),
+            ('channel_datas', self.create_channel_datas_table),
+            ('channel_samples', self.create_channel_samples_table),
+            ('channel_intervals', self.create_channel_intervals_tables),
+        ] + [(table, lambda table=table: self.conn.execute(rollup_table_sql(table)))
+             for table in ROLLUP_TABLES.values()]
+
+    def unmigrated_node_tables(self):
+        """node_id カラムの無い（ノード別にする前の）テーブルの名前のリストを返します（db_path のみ確認します）。"""
+        pending = []
+        for table in [table for table, _ in self._node_scoped_tables()] + ['channel_interval_times']:
+            columns = [row[1] for row in self.conn.execute(f"PRAGMA table_info({table});").fetchall()]
+            if columns and 'node_id' not in columns:
+                pending.append(table)
+        return pending
+
+    def migrate_to_node_scope(self):
+        """
+        ノード別にする前のデータベースのチャネル一覧・サンプル・ロールアップのテーブルに node_id を追加し、
+        主キーと外部キーに node_id を含めます。既存の行は self.node_id のノードの行になります。
+        テーブルを作り直すため、収集を止めて一度だけ実行してください（--migrate_node_scope --node_id）。
+        移行済みのテーブルは何もしません。月ごとのファイルも同様に移行します。
+
+        Returns:
+            作り直したテーブルの数
+        """
+        tables = self._node_scoped_tables()
+        migrated = 0
+        try:
+            # テーブルを作り直す間は外部キー制約を無効にし、名前の変更で他のテーブルの外部キーを書き換えないようにする
+            self.conn.execute("PRAGMA foreign_keys = OFF")
+            self.conn.execute("PRAGMA legacy_alter_table = ON")
+            self.conn.execute("BEGIN TRANSACTION")
+            for table, create in tables:
+                migrated += self._add_node_column(table, create)
+            migrated += self._add_node_to_interval_times()
+            self.conn.commit()
+
+            if migrated and self.partitioning != 'none':
+                for month in self.list_partitions():
+                    self.conn.execute("ATTACH DATABASE ? AS node_migration;", (self.partition_path(month),))
+                    try:
+                        table = self._sample_table()
+                        if table == 'channel_samples':
+                            create = lambda: self.create_channel_samples_table('node_migration')
+                        else:
+                            create = lambda: self.create_channel_datas_table('node_migration')
+                        self.conn.execute("BEGIN TRANSACTION")
+                        if self._add_node_column(table, create, 'node_migration'):
+                            migrated += 1
+                        self.conn.commit()
+                        if table == 'channel_datas':
+                            self.create_channel_datas_indexes('node_migration')
+                    finally:
+                        self.conn.execute("DETACH DATABASE node_migration;")
+        except Error as e:
+            self.conn.rollback()
+            print(f"ノード別のテーブルへの移行中にエラーが発生しました: {e}")
+        finally:
+            self.conn.execute("PRAGMA legacy_alter_table = OFF")
+            self.conn.execute("PRAGMA foreign_keys = ON")
+        return migrated
+
+    def _sample_table(self):
+        """保存形式に応じたサンプルのテーブル名を返します（delta 形式以外）。"""
+        return 'channel_samples' if self.storage == 'compact' else 'channel_datas'
+
+    def storage_table(self):
+        """サンプルを書き込むテーブル名 (channel_datas / channel_samples / channel_intervals) を返します。"""
+        return 'channel_intervals' if self.storage == 'delta' else self._sample_table()
+
+    def partition_path(self, month):
+        """月 ('YYYY-MM') のサンプルを保存するファイルのパスを返します。"""
+        base, ext = os.path.splitext(self.db_path)
+        return f"{base}_{month}{ext or '.db'}"
+
+    def list_partitions(self):
+        """月ごとのファイルがある月 ('YYYY-MM') を古い順に返します。"""
+        base, ext = os.path.splitext(self.db_path)
+        pattern = glob.escape(base) + '_[0-9][0-9][0-9][0-9]-[0-9][0-9]' + glob.escape(ext or '.db')
+        prefix = len(os.path.basename(base)) + 1
+        return sorted(os.path.basename(path)[prefix:prefix + 7] for path in glob.glob(pattern))
+
+    @staticmethod
+    def _partition_schema(month):
+        return 'p_' + month.replace('-', '_')
+
+    @staticmethod
+    def _next_month(month):
+        """'YYYY-MM' の次の月を返します。"""
+        year, number = map(int, month.split('-'))
+        return f"{year + number // 12:04d}-{number % 12 + 1:02d}"
+
+    def _attach_partition(self, month, writable=False):
+        """
+        月のファイルを ATTACH してスキーマ名を返します（ATTACH 済みの場合はそのまま返します）。
+
+        writable の場合は読み書き可能で ATTACH し、ファイルやテーブルが無ければ作成します。
+        読み書き可能で ATTACH するのは書き込む 1 か月分だけで、それ以外の月は読み込み専用です。
+        ATTACH / DETACH はトランザクション中にはできないため、トランザクションの外で呼び出してください。
+        """
+        if not re.fullmatch(r'\d{4}-\d{2}', month):
+            raise ValueError(f"Invalid partition month: {month}")
+        schema = self._partition_schema(month)
+        attached = self._attached.pop(month, None)
+        if attached is not None and (attached or not writable):
+            # 最近使った順の最後に移す
+            self._attached[month] = attached
+            return schema
+        if attached is not None:
+            self.conn.execute(f"DETACH DATABASE {schema};")
+        if writable:
+            # 前に書き込んでいた月のファイルは読み込み専用に戻す
+            for other in [other for other, other_writable in self._attached.items() if other_writable]:
+                self._detach_partition(other)
+        while len(self._attached) >= self.MAX_ATTACHED_PARTITIONS:
+            self._detach_partition(next(iter(self._attached)))
+
+        path = self.partition_path(month)
+        if writable:
+            is_new = not os.path.exists(path)
+            self.conn.execute(f"ATTACH DATABASE ? AS {schema};", (path,))
+            if is_new:
+                self.conn.execute(f"PRAGMA {schema}.auto_vacuum = INCREMENTAL")
+            # journal_mode と synchronous はファイルごとの設定
+            for name in ('journal_mode', 'synchronous'):
+                self.conn.execute(f"PRAGMA {schema}.{name} = {self.pragmas[name]}")
+            if self.storage == 'compact':
+                self.create_channel_samples_table(schema)
+            else:
+                self.create_channel_datas_table(schema)
+                self.create_channel_datas_indexes(schema)
+        else:
+            self.conn.execute(f"ATTACH DATABASE ? AS {schema};", (Path(path).resolve().as_uri() + '?mode=ro',))
+        self._attached[month] = writable
+        return schema
+
+    def _detach_partition(self, month):
+        if self._attached.pop(month, None) is not None:
+            self.conn.execute(f"DETACH DATABASE {self._partition_schema(month)};")
+
+    def drop_partition(self, month):
+        """月のファイルを削除します（DETACH してからファイルを削除するだけなので、行ごとの削除は不要です）。"""
+        self._detach_partition(month)
+        path = self.partition_path(month)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    def _write_schema(self, date):
+        """date ('%Y-%m-%d %H:%M') のサンプルを書き込むスキーマを返します（分割しない場合は None）。"""
+        if self.partitioning == 'none':
+            return None
+        return self._attach_partition(date[:7], writable=True)
+
+    def _sample_sources(self, start=None, end=None):
+        """
+        start 以上 end 未満 ('%Y-%m-%d %H:%M') のサンプルを含むテーブルを日時の順に返すジェネレータ
+        月ごとのファイルに分割している場合は、対象の月のファイルを順に ATTACH して '<スキーマ>.<テーブル>' を返す
+        """
+        table = self._sample_table()
+        if self.partitioning == 'none':
+            yield table
+            return
+        for month in self.list_partitions():
+            if (start and month < start[:7]) or (end and f"{month}-01 00:00" >= end):
+                continue
+            yield f"{self._attach_partition(month)}.{table}"
+
+    def _query_samples(self, build_sql, params, start=None, end=None, batch_size=10000):
+        """
+        build_sql(テーブル名) の SQL をサンプルのテーブルに対して実行し、結果の行を返します。
+        月ごとのファイルに分割している場合は start 以上 end 未満を含むファイルを日時の順に問い合わせ、
+        結果をつなげたイテレータを返します（分割しない場合はカーソル）。
+        """
+        if self.partitioning == 'none':
+            return self.conn.execute(build_sql(self._sample_table()), params)
+        return self._iter_partition_rows(build_sql, params, start, end, batch_size)
+
+    def _iter_partition_rows(self, build_sql, params, start, end, batch_size=10000):
+        for table in self._sample_sources(start, end):
+            # 次の月を ATTACH する前に読み終える（読み込み中のファイルは DETACH できない）
+            cursor = self.conn.execute(build_sql(table), params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+
+    # 保存形式ごとの頻繁に実行されるクエリ（名前 -> (SQL, パラメータ例)）
+    HOT_QUERIES = {
+        'legacy': {
+            'delete_old_data': (
+                "DELETE FROM channel_datas WHERE rowid IN (SELECT rowid FROM channel_datas WHERE date < ? LIMIT ?);",
+                ('2000-01-01', 5000)),
+            'delete_removed_channels': (
+                "DELETE FROM channel_datas WHERE node_id = ? AND channel_id IN (?, ?);",
+                ('default', '0', '0')),
+            'channel_history': (
+                "SELECT * FROM channel_datas WHERE node_id = ? AND channel_id = ? AND date >= ? AND date < ? ORDER BY date;",
+                ('default', '0', '2000-01-01 00:00', '2000-01-02 00:00')),
+            'nodes_range': (
+                "SELECT node_id, channel_id, local_balance FROM channel_datas WHERE date >= ? AND date < ? "
+                "ORDER BY date, node_id, channel_id;",
+                ('2000-01-01 00:00', '2000-01-02 00:00')),
+        },
+        'compact': {
+            'delete_old_data': (
+                "DELETE FROM channel_samples WHERE node_id = ? AND channel_id = ? AND ts IN ("
+                "SELECT ts FROM channel_samples WHERE node_id = ? AND channel_id = ? AND ts < ? LIMIT ?);",
+                ('default', 0, 'default', 0, 946652400, 5000)),
+            # delete_old_data で次に削除するチャネル（主キーをたどり、全件を走査しない）
+            'next_sample_channel': (
+                "SELECT node_id, channel_id FROM channel_samples WHERE (node_id, channel_id) > (?, ?) "
+                "ORDER BY node_id, channel_id LIMIT 1;",
+                ('default', 0)),
+            'delete_removed_channels': (
+                "DELETE FROM channel_samples WHERE node_id = ? AND channel_id IN (?, ?);",
+                ('default', 0, 0)),
+            'channel_history': (
+                "SELECT * FROM channel_samples WHERE node_id = ? AND channel_id = ? AND ts >= ? AND ts < ? ORDER BY ts;",
+                ('default', 0, 946652400, 946738800)),
+            'nodes_range': (
+                "SELECT node_id, channel_id, local_balance FROM channel_samples WHERE ts >= ? AND ts < ? "
+                "ORDER BY ts, node_id, channel_id;",
+                (946652400, 946738800)),
+        },
+        'delta': {
+            'delete_old_data': (
+                "DELETE FROM channel_intervals WHERE (node_id, channel_id, valid_from) IN ("
+                "SELECT node_id, channel_id, valid_from FROM channel_intervals WHERE valid_to < ? LIMIT ?);",
+                (946652400, 5000)),
+            'delete_removed_channels': (
+                "DELETE FROM channel_intervals WHERE node_id = ? AND channel_id IN (?, ?);",
+                ('default', 0, 0)),
+            # 区間の展開（実際の問い合わせの別名 i / t は実行計画でテーブル名を確認できるように使わない）
+            'channel_history': (
+                "SELECT channel_interval_times.ts, channel_intervals.local_balance FROM channel_intervals "
+                "JOIN channel_interval_times ON channel_interval_times.node_id = channel_intervals.node_id "
+                "AND channel_interval_times.ts BETWEEN channel_intervals.valid_from AND channel_intervals.valid_to "
+                "WHERE channel_intervals.node_id = ? AND channel_intervals.channel_id = ? "
+                "AND channel_intervals.valid_to >= ? AND channel_interval_times.ts >= ? AND channel_interval_times.ts < ? "
+                "ORDER BY channel_intervals.channel_id, channel_interval_times.ts;",
+                ('default', 0, 946652400, 946652400, 946738800)),
+            'nodes_range': (
+                "SELECT channel_interval_times.ts, channel_intervals.node_id, channel_intervals.channel_id, "
+                "channel_intervals.local_balance FROM channel_interval_times "
+                "JOIN channel_intervals ON channel_intervals.node_id = channel_interval_times.node_id "
+                "AND channel_interval_times.ts BETWEEN channel_intervals.valid_from AND channel_intervals.valid_to "
+                "WHERE channel_interval_times.ts >= ? AND channel_interval_times.ts < ? AND channel_intervals.valid_to >= ? "
+                "ORDER BY channel_interval_times.ts, channel_intervals.node_id, channel_intervals.channel_id;",
+                (946652400, 946738800, 946652400)),
+        },
+    }
+
+    def check_query_plans(self):
+        """
+        EXPLAIN QUERY PLAN で保存形式 (self.storage) の頻繁に実行されるクエリを確認し、
+        サンプルのテーブル（channel_datas / channel_samples / channel_intervals）の全件スキャン
+        （インデックス全体の走査を含む）になっているものがあれば警告を表示します。
+
+        Returns:
+            全件スキャンになっているクエリの (名前, 実行計画) のリスト
+        """
+        table = self.storage_table()
+        # SEARCH はインデックスでの範囲検索、SCAN はテーブルまたはインデックス全体の走査
+        full_scan = re.compile(rf'^SCAN (TABLE )?{table}\b')
+        warnings = []
+        try:
+            cursor = self.conn.cursor()
+            for name, (sql, params) in self.HOT_QUERIES[self.storage].items():
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+                for row in cursor.fetchall():
+                    detail = row[-1]
+                    if full_scan.match(detail):
+                        warnings.append((name, detail))
+        except Error as e:
+            print(f"クエリ実行計画の確認中にエラー発生: {e}")
+            return warnings
+
+        for name, detail in warnings:
+            print(f"警告: クエリ {name} が全件スキャンになっています: {detail}")
+        return warnings
+
+    def create_amboss_fee_cache_table(self):
+        """Amboss 手数料キャッシュ用の amboss_fee_cache テーブルを作成します。"""
+        sql = '''CREATE TABLE IF NOT EXISTS amboss_fee_cache (
+                    pubkey TEXT PRIMARY KEY,
+                    fee INTEGER NOT NULL,
+                    fetched_at INTEGER NOT NULL
+                  );'''
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(sql)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_amboss_fee_cache_fetched_at "
+                           "ON amboss_fee_cache (fetched_at);")
+        except Error as e:
+            print(f"amboss_fee_cache テーブル作成中にエラー発生: {e}")
+
+    # channel_fingerprints に後から追加したカラム（既存のテーブルには ALTER TABLE で追加する）
+    #   エッジを作り直すためのポリシーと、エッジ情報を取得した時刻（0 の行はエッジを使い回さない）
+    CHANNEL_FINGERPRINT_EDGE_COLUMNS = {
+        'node1_remote': 'INTEGER NOT NULL DEFAULT 0',
+        'node1_fee': 'INTEGER NOT NULL DEFAULT 0',
+        'node1_infee': 'INTEGER NOT NULL DEFAULT 0',
+        'node2_fee': 'INTEGER NOT NULL DEFAULT 0',
+        'node2_infee': 'INTEGER NOT NULL DEFAULT 0',
+        'edge_fetched_at': 'INTEGER NOT NULL DEFAULT 0',
+    }
+
+    def create_channel_fingerprints_table(self):
+        """チャネルの指紋 (src/api/fingerprint_cache.py) を保存する channel_fingerprints テーブルを作成します。"""
+        sql = '''CREATE TABLE IF NOT EXISTS channel_fingerprints (
+                    node_id TEXT NOT NULL,
+                    channel_id TEXT NOT NULL,
+                    num_updates INTEGER NOT NULL,
+                    active INTEGER NOT NULL,
+                    node1_last_update INTEGER NOT NULL,
+                    node2_last_update INTEGER NOT NULL,
+                    policy_hash INTEGER NOT NULL,
+                    amboss_fee INTEGER,
+                    PRIMARY KEY (node_id, channel_id)
+                  ) WITHOUT ROWID;'''
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(sql)
+            # 新しいテーブルにも既存のテーブルにも同じ方法で追加する
+            columns = {row[1] for row in cursor.execute("PRAGMA table_info(channel_fingerprints);").fetchall()}
+            for name, definition in self.CHANNEL_FINGERPRINT_EDGE_COLUMNS.items():
+                if name not in columns:
+                    cursor.execute(f"ALTER TABLE channel_fingerprints ADD COLUMN {name} {definition};")
+            self.conn.commit()
+        except Error as e:
+            print(f"channel_fingerprints テーブル作成中にエラー発生: {e}")
+
+    def create_runs_table(self):
+        """実行ごとのメトリクス (src/utils/metrics.py の RunMetrics) を保存する runs テーブルを作成します。"""
+        sql = '''CREATE TABLE IF NOT EXISTS runs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    mode TEXT NOT NULL,
+                    started_at TEXT NOT NULL,
+                    finished_at TEXT,
+                    duration_seconds REAL,
+                    status TEXT NOT NULL,
+                    rows_written INTEGER NOT NULL DEFAULT 0,
+                    errors INTEGER NOT NULL DEFAULT 0,
+                    metrics TEXT NOT NULL
+                  );'''
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(sql)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_runs_started_at ON runs (started_at);")
+        except Error as e:
+            print(f"runs テーブル作成中にエラー発生: {e}")
+
+    def insert_run(self, run):
+        """
+        終了した実行のメトリクスを runs テーブルに保存します。
+        フェーズ・カウンター・HTTP のヒストグラムは metrics カラムに JSON で保存します。
+
+        Returns:
+            追加した行の id（エラーの場合は None）
+        """
+        data = run.to_dict()
+        sql = '''INSERT INTO runs (mode, started_at, finished_at, duration_seconds, status, rows_written, errors,
+                                   metrics)
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?);'''
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(sql, (data['mode'], data['started_at'], data['finished_at'], data['duration_seconds'],
+                                 data['status'], data['counters'].get('rows_written', 0), run.errors,
+                                 json.dumps(data, ensure_ascii=False)))
+            self.conn.commit()
+            return cursor.lastrowid
+        except Error as e:
+            self.conn.rollback()
+            print(f"実行のメトリクスの保存中にエラー発生: {e}")
+            return None
+
+    def get_recent_runs(self, limit=20, mode=None):
+        """新しい順に最大 limit 件の実行を、metrics を辞書に戻して返します。"""
+        sql = "SELECT id, metrics FROM runs"
+        params = []
+        if mode is not None:
+            sql += " WHERE mode = ?"
+            params.append(mode)
+        sql += " ORDER BY id DESC LIMIT ?;"
+        params.append(limit)
+        try:
+            return [dict(json.loads(row[1]), id=row[0]) for row in self.conn.execute(sql, params)]
+        except Error as e:
+            print(f"実行のメトリクスの読み込み中にエラー発生: {e}")
             return []
 
-    def _delete_removed_channels(self, current_channels, api_channel_ids):
+    def load_amboss_fee_cache(self, min_fetched_at, limit):
+        """fetched_at が min_fetched_at 以降のキャッシュを新しい順に最大 limit 件取得します。"""
+        sql = '''SELECT pubkey, fee, fetched_at FROM amboss_fee_cache
+                 WHERE fetched_at >= ?
+                 ORDER BY fetched_at DESC
+                 LIMIT ?;'''
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(sql, (min_fetched_at, limit))
+            return [tuple(row) for row in cursor.fetchall()]
+        except Error as e:
+            print(f"Amboss 手数料キャッシュの読み込み中にエラー発生: {e}")
+            return []
+
+    def save_amboss_fee_cache(self, entries):
+        """(pubkey, fee, fetched_at) のリストをキャッシュテーブルに保存します。"""
+        if not entries:
+            return 0
+        sql = '''INSERT INTO amboss_fee_cache (pubkey, fee, fetched_at)
+                 VALUES (?, ?, ?)
+                 ON CONFLICT(pubkey) DO UPDATE SET
+                 fee=excluded.fee,
+                 fetched_at=excluded.fetched_at;'''
+        try:
+            cursor = self.conn.cursor()
+            cursor.executemany(sql, entries)
+            self.conn.commit()
+            return len(entries)
+        except Error as e:
+            self.conn.rollback()
+            print(f"Amboss 手数料キャッシュの保存中にエラー発生: {e}")
+            return 0
+
+    CHANNEL_FINGERPRINT_COLUMNS = ('node_id', 'channel_id', 'num_updates', 'active', 'node1_last_update',
+                                   'node2_last_update', 'policy_hash', 'amboss_fee', 'node1_remote', 'node1_fee',
+                                   'node1_infee', 'node2_fee', 'node2_infee', 'edge_fetched_at')
+
+    def load_channel_fingerprints(self):
+        """すべてのノードのチャネルの指紋を CHANNEL_FINGERPRINT_COLUMNS の順で取得します。"""
+        sql = f"SELECT {', '.join(self.CHANNEL_FINGERPRINT_COLUMNS)} FROM channel_fingerprints;"
+        try:
+            return [tuple(row) for row in self.conn.execute(sql)]
+        except Error as e:
+            print(f"チャネルの指紋の読み込み中にエラー発生: {e}")
+            return []
+
+    def save_channel_fingerprints(self, entries):
+        """CHANNEL_FINGERPRINT_COLUMNS の順の値のリストを channel_fingerprints に保存します。"""
+        if not entries:
+            return 0
+        sql = f'''INSERT OR REPLACE INTO channel_fingerprints ({', '.join(self.CHANNEL_FINGERPRINT_COLUMNS)})
+                  VALUES ({', '.join(['?'] * len(self.CHANNEL_FINGERPRINT_COLUMNS))});'''
+        try:
+            cursor = self.conn.cursor()
+            cursor.executemany(sql, entries)
+            self.conn.commit()
+            return len(entries)
+        except Error as e:
+            self.conn.rollback()
+            print(f"チャネルの指紋の保存中にエラー発生: {e}")
+            return 0
+
+    def prune_amboss_fee_cache(self, min_fetched_at, max_entries):
+        """期限切れのキャッシュと、新しい順で max_entries 件を超えたキャッシュを削除します。"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("DELETE FROM amboss_fee_cache WHERE fetched_at < ?;", (min_fetched_at,))
+            deleted = cursor.rowcount
+            cursor.execute('''DELETE FROM amboss_fee_cache WHERE pubkey NOT IN (
+                                SELECT pubkey FROM amboss_fee_cache
+                                ORDER BY fetched_at DESC LIMIT ?);''', (max_entries,))
+            deleted += cursor.rowcount
+            self.conn.commit()
+            return deleted
+        except Error as e:
+            self.conn.rollback()
+            print(f"Amboss 手数料キャッシュの削除中にエラー発生: {e}")
+            return 0
+
+    # update_channel_lists() で API のチャネル一覧を読み込む一時テーブル（接続ごと）
+    CHANNEL_STAGING_TABLE = 'channel_lists_staging'
+
+    def update_channel_lists(self, channels):
         """
-        API に存在しないチャンネルをデータベースから削除
-        
-        Args:
-            current_channels: 現在のデータベースに存在するチャンネル情報のリスト
-            api_channel_ids: API から取得したチャンネル ID のセット
-        
+        API から取得したチャネル一覧をこのノードの channel_lists に同期します。
+
+        一覧を一時テーブル (channel_lists_staging) にまとめて読み込み、値が変わった行だけを 1 回の UPSERT で
+        追加・更新し、一覧に無いチャネル（とそのサンプル）を anti-join で削除します。すべて 1 トランザクションで行い、
+        件数は SQL の結果から求めます。
+
         Returns:
-            deleted_channels: 削除されたチャンネル情報のリスト
+            {'inserted', 'updated', 'deleted'} の件数（エラーの場合は {'error'}）
         """
         if not self.conn:
             self.connect()
-        
-        # 削除するチャンネルを特定
-        channels_to_delete = []
-        for channel in current_channels:
-            if channel['channel_id'] not in api_channel_ids:
-                channels_to_delete.append(channel)
-        
-        if not channels_to_delete:
-            return []  # 削除するものがない
-        
+
+        staging = self.CHANNEL_STAGING_TABLE
+        # 一覧に無い（閉じられた）このノードのチャネル
+        removed = f"""SELECT c.channel_id FROM channel_lists c
+                      WHERE c.node_id = ? AND NOT EXISTS (SELECT 1 FROM temp.{staging} s
+                                                          WHERE s.channel_id = c.channel_id)"""
         try:
             cursor = self.conn.cursor()
-            
-            # チャンネルIDリストを作成
-            channel_ids_to_delete = [channel['channel_id'] for channel in channels_to_delete]
-            placeholders = ', '.join(['?'] * len(channel_ids_to_delete))
-            
-            # チャンネルデータを削除 (外部キー制約のため先に削除)
-            # 修正: channel_datasテーブルのカラムはidではなくchannel_idを参照する
-            sql_delete_data = f"""DELETE FROM channel_datas 
-                                 WHERE channel_id IN ({placeholders});"""
-            cursor.execute(sql_delete_data, channel_ids_to_delete)
-            
-            # チャンネル自体を削除
-            sql_delete_channel = f"DELETE FROM channel_lists WHERE channel_id IN ({placeholders});"
-            cursor.execute(sql_delete_channel, channel_ids_to_delete)
-            
+            cursor.execute(f"""CREATE TEMP TABLE IF NOT EXISTS {staging} (
+                                   channel_id TEXT PRIMARY KEY,
+                                   channel_name TEXT NOT NULL,
+                                   channel_point TEXT,
+                                   capacity INTEGER NOT NULL
+                               ) WITHOUT ROWID;""")
+            # トランザクションを開始
+            self.conn.execute("BEGIN TRANSACTION")
+            cursor.execute(f"DELETE FROM temp.{staging};")
+            # 同じ chan_id が複数ある場合は後のものを使う（1 件ずつ UPSERT していた場合と同じ）
+            cursor.executemany(f"INSERT OR REPLACE INTO temp.{staging} VALUES (?, ?, ?, ?);",
+                               ((channel['chan_id'], channel.get('peer_alias', ''), channel.get('channel_point', ''),
+                                 channel.get('capacity', 0)) for channel in channels if channel.get('chan_id')))
+
+            # ログ用に新規追加・削除されるチャネルを先に読み込む
+            inserted_channels = [{'channel_id': row[0], 'channel_name': row[1], 'capacity': row[2]}
+                                 for row in cursor.execute(
+                f"""SELECT s.channel_id, s.channel_name, s.capacity FROM temp.{staging} s
+                    WHERE NOT EXISTS (SELECT 1 FROM channel_lists c WHERE c.node_id = ? AND c.channel_id = s.channel_id)
+                    ORDER BY s.channel_id;""", (self.node_id,))]
+            deleted_channels = [{'channel_id': row[0], 'channel_name': row[1], 'capacity': row[2]}
+                                for row in cursor.execute(
+                f"""SELECT channel_id, channel_name, capacity FROM channel_lists
+                    WHERE node_id = ? AND channel_id IN ({removed}) ORDER BY channel_id;""",
+                (self.node_id, self.node_id))]
+
+            # 新規のチャネルと値が変わったチャネルだけを追加・更新する
+            cursor.execute(f"""INSERT INTO channel_lists (node_id, channel_name, channel_id, channel_point, capacity)
+                               SELECT ?, s.channel_name, s.channel_id, s.channel_point, s.capacity
+                               FROM temp.{staging} s
+                               WHERE NOT EXISTS (SELECT 1 FROM channel_lists c
+                                                 WHERE c.node_id = ? AND c.channel_id = s.channel_id
+                                                   AND c.channel_name IS s.channel_name
+                                                   AND c.channel_point IS s.channel_point
+                                                   AND c.capacity IS s.capacity)
+                               ON CONFLICT(node_id, channel_id) DO UPDATE SET
+                               channel_name=excluded.channel_name,
+                               channel_point=excluded.channel_point,
+                               capacity=excluded.capacity;""", (self.node_id, self.node_id))
+            updated = cursor.rowcount - len(inserted_channels)
+
+            if deleted_channels:
+                # チャンネルデータを削除してから、チャンネル自体を削除（他のノードの同じチャンネルは残す）
+                cursor.execute(f"DELETE FROM channel_datas WHERE node_id = ? AND channel_id IN ({removed});",
+                               (self.node_id, self.node_id))
+                if self.storage == 'compact':
+                    cursor.execute(f"""DELETE FROM channel_samples
+                                       WHERE node_id = ? AND channel_id IN (SELECT CAST(channel_id AS INTEGER)
+                                                                            FROM ({removed}));""",
+                                   (self.node_id, self.node_id))
+                elif self.storage == 'delta':
+                    cursor.execute(f"""DELETE FROM channel_intervals
+                                       WHERE node_id = ? AND channel_id IN (SELECT CAST(channel_id AS INTEGER)
+                                                                            FROM ({removed}));""",
+                                   (self.node_id, self.node_id))
+                cursor.execute(f"DELETE FROM channel_fingerprints WHERE node_id = ? AND channel_id IN ({removed});",
+                               (self.node_id, self.node_id))
+                cursor.execute(f"DELETE FROM channel_lists WHERE node_id = ? AND channel_id IN ({removed});",
+                               (self.node_id, self.node_id))
+            deleted = cursor.rowcount if deleted_channels else 0
+            cursor.execute(f"DELETE FROM temp.{staging};")
+
+            # トランザクションをコミット
             self.conn.commit()
-            return channels_to_delete
-        except Error as e:
-            print(f"チャンネル削除中にエラーが発生しました: {e}")
-            return []
+
+            # 月ごとのファイルのサンプルは ATTACH が必要なため、コミットの後にファイルごとに削除する
+            if deleted_channels and self.partitioning != 'none':
+                self._delete_partition_channels([channel['channel_id'] for channel in deleted_channels])
+
+            # ログ出力（トランザクション外で行う）
+            self._log_channel_changes(inserted_channels, updated, deleted_channels)
+
+            return {
+                'inserted': len(inserted_channels),
+                'updated': updated,
+                'deleted': deleted
+            }
+        except Exception as e:
+            # エラーが発生した場合はロールバック
+            self.conn.rollback()
+            print(f"データベース更新中にエラーが発生しました: {e}")
+            return {'error': str(e)}
 
     def _log_channel_changes(self, inserted, updated, deleted):
         """
@@ -262,16 +1043,25 @@ class Database:
         
         Args:
             inserted: 新規追加されたチャンネルのリスト
-            updated: 更新されたチャンネルのリスト
+            updated: 値が変わって更新されたチャンネルの件数
             deleted: 削除されたチャンネルのリスト
         """
         timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        
-        # ログファイルパスを設定
-        #log_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'logs')
-        log_dir = "D:\LightningNetwork\lightning-node-db\logs"
-        os.makedirs(log_dir, exist_ok=True)
-        log_file = os.path.join(log_dir, 'channel_changes.log')
+        metrics.increment('channels_added', len(inserted))
+        metrics.increment('channels_updated', updated)
+        metrics.increment('channels_removed', len(deleted))
+
+        # コンソールにも出力
+        print(f"\nチャンネル更新ログ: {timestamp}")
+        print(f"- 新規追加: {len(inserted)}件")
+        print(f"- 更新: {updated}件")
+        print(f"- 削除: {len(deleted)}件")
+
+        # ログファイルパスを設定（database.channel_log_dir）
+        if not self.log_dir:
+            return
+        os.makedirs(self.log_dir, exist_ok=True)
+        log_file = os.path.join(self.log_dir, 'channel_changes.log')
         
         with open(log_file, 'a', encoding='utf-8') as f:
             # ヘッダー
@@ -283,99 +1073,1013 @@ class Database:
                 for channel in inserted:
                     f.write(f"ID: {channel.get('channel_id')}, 名前: {channel.get('channel_name')}, 容量: {channel.get('capacity')}\n")
             
-            # 更新されたチャンネル
-            #if updated:
-            #    f.write(f"\n--- 更新されたチャンネル ({len(updated)}件) ---\n")
-            #    for channel in updated:
-            #        f.write(f"ID: {channel.get('channel_id')}, 名前: {channel.get('channel_name')}, 容量: {channel.get('capacity')}\n")
-         
             # 削除されたチャンネル
             if deleted:
                 f.write(f"\n--- 削除されたチャンネル ({len(deleted)}件) ---\n")
                 for channel in deleted:
-                    f.write(f"ID: {channel.get('chan_id')}, 名前: {channel.get('peer_alias')}, 容量: {channel.get('capacity')}\n")
-        
-        # コンソールにも出力
-        print(f"\nチャンネル更新ログ: {timestamp}")
-        print(f"- 新規追加: {len(inserted)}件")
-        print(f"- 更新: {len(updated)}件")
-        print(f"- 削除: {len(deleted)}件")
+                    f.write(f"ID: {channel.get('channel_id')}, 名前: {channel.get('channel_name')}, 容量: {channel.get('capacity')}\n")
         print(f"詳細ログは {log_file} に保存されました。")
 
-    def update_channel(self, channel_name, channel_id, channel_point, capacity):
-        """UTF-8エンコーディングを使用してchannel_listsテーブルにチャンネルを更新または挿入します。"""
-        sql = '''INSERT INTO channel_lists (channel_name, channel_id, channel_point, capacity)
-                 VALUES (?, ?, ?, ?)
-                 ON CONFLICT(channel_id) DO UPDATE SET
+    def update_channel(self, channel_name, channel_id, channel_point, capacity, commit=True):
+        """
+        UTF-8エンコーディングを使用してchannel_listsテーブルにチャンネルを更新または挿入します。
+        commit=False の場合は呼び出し側のトランザクション内で実行し、コミットしません。
+        """
+        sql = '''INSERT INTO channel_lists (node_id, channel_name, channel_id, channel_point, capacity)
+                 VALUES (?, ?, ?, ?, ?)
+                 ON CONFLICT(node_id, channel_id) DO UPDATE SET
                  channel_name=excluded.channel_name,
                  channel_point=excluded.channel_point,
                  capacity=excluded.capacity;'''
         try:
             cursor = self.conn.cursor()
-            cursor.execute(sql, (channel_name, channel_id, channel_point, capacity))
-            self.conn.commit()
+            cursor.execute(sql, (self.node_id, channel_name, channel_id, channel_point, capacity))
+            if commit:
+                self.conn.commit()
             return cursor.lastrowid
         except Error as e:
             print(f"チャンネル更新中にエラー発生: {e}")
             return None
     
-    def update_channel_data(self, channel, data, amboss_fee):
-        """Insert channel data for a specific channel."""
-        sql = '''INSERT INTO channel_datas 
-                 (channel_id, date, local_balance, local_fee, local_infee, 
+    CHANNEL_DATAS_INSERT_SQL = '''INSERT INTO channel_datas 
+                 (node_id, channel_id, date, local_balance, local_fee, local_infee, 
                   remote_balance, remote_fee, remote_infee, num_updates, amboss_fee, active)
-                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);'''
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);'''
+
+    CHANNEL_SAMPLES_INSERT_SQL = '''INSERT OR REPLACE INTO channel_samples
+                 (node_id, channel_id, ts, local_balance, local_fee, local_infee,
+                  remote_balance, remote_fee, remote_infee, num_updates, amboss_fee, active)
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);'''
+
+    @classmethod
+    def _date_to_ts(cls, date):
+        """channel_datas の日時文字列（ローカル時刻）をエポック秒に変換します。"""
+        return int(datetime.strptime(date, cls.DATE_FORMAT).timestamp())
+
+    @staticmethod
+    def _compact_row(row, ts):
+        """channel_datas 形式の行をコンパクト形式 (整数の chan_id とエポック秒) に変換します。"""
+        return (int(row[0]), ts) + tuple(row[2:])
+
+    # 差分形式で変更を検出するカラム（channel_datas の値のカラムすべて）
+    INTERVAL_VALUE_COLUMNS = ('local_balance', 'local_fee', 'local_infee', 'remote_balance', 'remote_fee',
+                              'remote_infee', 'num_updates', 'amboss_fee', 'active')
+
+    @staticmethod
+    def _delta_row(row):
+        """
+        channel_datas 形式の行を差分形式の (整数の chan_id, 値のタプル) に変換します。
+        保存済みの値と比較できるように、文字列で返ってくる数値を整数にそろえます。
+        """
+        return int(row[0]), tuple(None if value is None else int(value) for value in row[2:])
+
+    def _write_intervals(self, rows, ts, unchanged=(), partial=False):
+        """
+        ts に記録した self.node_id のノードのサンプル (_delta_row() の結果) を channel_intervals に書き込みます。
+        直前の記録日時から値が変わっていないチャネルは、最後の区間の valid_to を ts に延ばすだけです。
+        ノードの直前の全チャネルの記録に含まれていなかった（取得エラーなど）チャネルは、欠損を埋めないように新しい区間を始めます。
+        partial が True の書き込み（イベントで変わったチャネルだけの書き込みなど）は、含まれないチャネルを欠損とみなしません。
+        unchanged の channel_id は、最後の区間を読み込まずに値が同じ場合だけ延ばす UPDATE を先に試します。
+        ノードごとに記録日時の昇順に呼び出してください。コミットは呼び出し側で行います。
+
+        Returns:
+            新しく追加した区間の数
+        """
+        columns = ', '.join(self.INTERVAL_VALUE_COLUMNS)
+        head_sql = f'''SELECT valid_from, valid_to, {columns} FROM channel_intervals
+                       WHERE node_id = ? AND channel_id = ? ORDER BY valid_from DESC LIMIT 1;'''
+        insert_sql = f'''INSERT INTO channel_intervals (node_id, channel_id, valid_from, valid_to, {columns})
+                         VALUES (?, ?, ?, ?, {', '.join(['?'] * len(self.INTERVAL_VALUE_COLUMNS))});'''
+        replace_sql = f'''UPDATE channel_intervals SET {', '.join(f'{c} = ?' for c in self.INTERVAL_VALUE_COLUMNS)}
+                          WHERE node_id = ? AND channel_id = ? AND valid_from = ?;'''
+        extend_sql = "UPDATE channel_intervals SET valid_to = ? WHERE node_id = ? AND channel_id = ? AND valid_from = ?;"
+        # 最後の区間が直前の全チャネルの記録日時以降まで続いていて値が同じ場合だけ延ばす
+        extend_same_sql = f'''UPDATE channel_intervals SET valid_to = ?
+                              WHERE node_id = ? AND channel_id = ?
+                                AND valid_from = (SELECT MAX(valid_from) FROM channel_intervals
+                                                  WHERE node_id = ? AND channel_id = ?)
+                                AND valid_to >= ?
+                                AND {' AND '.join(f'{c} IS ?' for c in self.INTERVAL_VALUE_COLUMNS)};'''
+        node_id = self.node_id
+
+        cursor = self.conn.cursor()
+        cursor.execute('''INSERT INTO channel_interval_times (node_id, ts, complete) VALUES (?, ?, ?)
+                          ON CONFLICT (node_id, ts) DO UPDATE SET complete = MAX(complete, excluded.complete);''',
+                       (node_id, ts, int(not partial)))
+        # 区間を閉じる日時（ノードの直前の記録日時）と、欠損の判定に使う日時（ノードの直前の全チャネルの記録日時）
+        previous_ts, complete_ts = cursor.execute(
+            "SELECT MAX(ts), MAX(CASE WHEN complete THEN ts END) FROM channel_interval_times WHERE node_id = ? AND ts < ?;",
+            (node_id, ts)).fetchone()
+
+        inserted = 0
+        for channel_id, values in rows:
+            if complete_ts is not None and channel_id in unchanged:
+                cursor.execute(extend_same_sql, (ts, node_id, channel_id, node_id, channel_id, complete_ts) + values)
+                if cursor.rowcount:
+                    continue
+            head = cursor.execute(head_sql, (node_id, channel_id)).fetchone()
+            if head is not None:
+                valid_from, valid_to = head[0], head[1]
+                if tuple(head[2:]) == values and (valid_to == ts or complete_ts is not None and valid_to >= complete_ts):
+                    if valid_to != ts:
+                        cursor.execute(extend_sql, (ts, node_id, channel_id, valid_from))
+                    continue
+                if valid_from == ts:
+                    # 同じ日時の再書き込みは値を置き換える
+                    cursor.execute(replace_sql, values + (node_id, channel_id, valid_from))
+                    continue
+                if valid_to == ts:
+                    # 同じ日時に別の値が書き込まれた場合は、最後の区間を直前の記録日時で閉じる
+                    cursor.execute(extend_sql, (previous_ts, node_id, channel_id, valid_from))
+            cursor.execute(insert_sql, (node_id, channel_id, ts, ts) + values)
+            inserted += 1
+        return inserted
+
+    def _iter_interval_samples(self, since_ts, until_ts=None, channel_id=None, batch_size=10000):
+        """
+        channel_intervals を記録日時ごとのサンプルに展開し、
+        (node_id, channel_id, ts, local_balance, remote_balance, local_fee, remote_fee, active) を
+        node_id, channel_id, ts の順に返すジェネレータ（channel_id を指定した場合は self.node_id のノードのチャネルのみ）
+        """
+        sql = '''SELECT i.node_id, i.channel_id, t.ts, i.local_balance, i.remote_balance, i.local_fee, i.remote_fee,
+                 i.active
+                 FROM channel_intervals i
+                 JOIN channel_interval_times t ON t.node_id = i.node_id AND t.ts BETWEEN i.valid_from AND i.valid_to
+                 WHERE i.valid_to >= ? AND t.ts >= ? AND t.ts < ?'''
+        params = [since_ts, since_ts, until_ts if until_ts is not None else 2 ** 62]
+        if channel_id is not None:
+            sql += " AND i.node_id = ? AND i.channel_id = ?"
+            params += [self.node_id, int(channel_id)]
+        sql += " ORDER BY i.node_id, i.channel_id, t.ts;"
+        cursor = self.conn.cursor()
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            for row in rows:
+                yield tuple(row)
+
+    def get_channel_samples(self, channel_id, start, end):
+        """
+        self.node_id のノードのチャネルの start 以上 end 未満 ('%Y-%m-%d %H:%M') の生サンプルを、保存形式に関係なく
+        記録日時ごとの時系列として取得します（差分形式の場合は区間を展開します）。
+
+        Returns:
+            [{'date', 'local_balance', 'remote_balance', 'local_fee', 'remote_fee', 'active'}, ...]
+        """
+        keys = ('date', 'local_balance', 'remote_balance', 'local_fee', 'remote_fee', 'active')
         try:
-            if channel.get('remote_pubkey', '') == data.get('node1_pub', ''):
-                remote_fee = data.get('node1_policy', {}).get('fee_rate_milli_msat', 0)
-                remote_infee = data.get('node1_policy', {}).get('inbound_fee_rate_milli_msat', 0)
-                local_fee = data.get('node2_policy', {}).get('fee_rate_milli_msat', 0)
-                local_infee = data.get('node2_policy', {}).get('inbound_fee_rate_milli_msat', 0)
+            if self.storage == 'delta':
+                rows = self._iter_interval_samples(self._date_to_ts(start), self._date_to_ts(end), channel_id)
+                rows = [(datetime.fromtimestamp(row[2]).strftime(self.DATE_FORMAT),) + row[3:] for row in rows]
+            elif self.storage == 'compact':
+                rows = self._query_samples(
+                    lambda table: f'''SELECT ts, local_balance, remote_balance, local_fee, remote_fee, active
+                                      FROM {table} WHERE node_id = ? AND channel_id = ? AND ts >= ? AND ts < ?
+                                      ORDER BY ts;''',
+                    (self.node_id, int(channel_id), self._date_to_ts(start), self._date_to_ts(end)), start, end)
+                rows = [(datetime.fromtimestamp(row[0]).strftime(self.DATE_FORMAT),) + tuple(row[1:]) for row in rows]
             else:
-                remote_fee = data.get('node2_policy', {}).get('fee_rate_milli_msat', 0)
-                remote_infee = data.get('node2_policy', {}).get('inbound_fee_rate_milli_msat', 0)
-                local_fee = data.get('node1_policy', {}).get('fee_rate_milli_msat', 0)
-                local_infee = data.get('node1_policy', {}).get('inbound_fee_rate_milli_msat', 0)
-            
-            active_stat = int(channel.get('active', False))
+                rows = self._query_samples(
+                    lambda table: f'''SELECT date, local_balance, remote_balance, local_fee, remote_fee, active
+                                      FROM {table} WHERE node_id = ? AND channel_id = ? AND date >= ? AND date < ?
+                                      ORDER BY date;''',
+                    (self.node_id, channel_id, start, end), start, end)
+            return [dict(zip(keys, row)) for row in rows]
+        except (Error, ValueError) as e:
+            print(f"サンプルの取得中にエラーが発生しました: {e}")
+            return []
 
+    def _insert_sql(self, schema=None):
+        """保存形式に応じたサンプルの INSERT 文を返します（schema を指定した場合はそのスキーマのテーブル）。"""
+        sql = self.CHANNEL_SAMPLES_INSERT_SQL if self.storage == 'compact' else self.CHANNEL_DATAS_INSERT_SQL
+        if schema:
+            table = self._sample_table()
+            sql = sql.replace(f"INTO {table}", f"INTO {schema}.{table}", 1)
+        return sql
+
+    @staticmethod
+    def _channel_data_row(channel, data, amboss_fee, date):
+        """
+        チャネル情報（/v1/channels の辞書）とエッジ情報から channel_datas の 1 行分の値を作成します。
+        エッジ情報は /v1/graph/edge（または /v1/graph の edges）の辞書です。
+        """
+        # 未公開のポリシーは null で返ってくるため空の辞書として扱う
+        node1_policy = data.get('node1_policy') or {}
+        node2_policy = data.get('node2_policy') or {}
+        if channel.get('remote_pubkey', '') == data.get('node1_pub', ''):
+            remote_policy, local_policy = node1_policy, node2_policy
+        else:
+            remote_policy, local_policy = node2_policy, node1_policy
+
+        return (
+            channel.get('chan_id', ''),
+            date,
+            channel.get('local_balance', 0),
+            local_policy.get('fee_rate_milli_msat', 0),
+            local_policy.get('inbound_fee_rate_milli_msat', 0),
+            channel.get('remote_balance', 0),
+            remote_policy.get('fee_rate_milli_msat', 0),
+            remote_policy.get('inbound_fee_rate_milli_msat', 0),
+            channel.get('num_updates', 0),
+            amboss_fee,
+            int(channel.get('active', False))
+        )
+
+    def update_channel_data(self, channel, data, amboss_fee):
+        """Insert channel data for a specific channel."""
+        try:
+            date = datetime.now().strftime(self.DATE_FORMAT)
+            row = self._channel_data_row(channel, data, amboss_fee, date)
+            if self.storage == 'delta':
+                self._write_intervals([self._delta_row(row)], self._date_to_ts(date), partial=True)
+                self.conn.commit()
+                return
+            if self.storage == 'compact':
+                row = self._compact_row(row, self._date_to_ts(date))
+            schema = self._write_schema(date)
             cursor = self.conn.cursor()
-            cursor.execute(sql, (
-                channel.get('chan_id', ''),
-                datetime.now().strftime('%Y-%m-%d %H:%M'),
-                channel.get('local_balance', 0),
-                local_fee,
-                local_infee,
-                channel.get('remote_balance', 0),
-                remote_fee,
-                remote_infee,
-                channel.get('num_updates', 0),
-                amboss_fee,
-                active_stat
-            ))
+            cursor.execute(self._insert_sql(schema), (self.node_id,) + row)
             self.conn.commit()
-        except Error as e:
+        except (Error, ValueError) as e:
             print(f"Error updating channel data: {e}")
-    
-    def delete_old_data(self, months):
-        """Delete old channel data older than specified months."""
-        sql = '''DELETE FROM channel_datas
-                 WHERE date < date('now', ?);'''
+
+    def insert_channel_datas(self, snapshots, date=None, unchanged=None, partial=False):
+        """
+        1 回分の収集結果を 1 トランザクションでまとめて保存形式のテーブル (storage_table()) に書き込みます（self.node_id のノードの行）。
+        すべての行に同じ日時を設定し、書き込みは全件成功か全件ロールバックのどちらかになります。
+
+        Args:
+            snapshots: (channel, channel_data, amboss_fee) のイテラブル
+            date: 記録する日時（省略時は現在時刻）
+            unchanged: 前回の記録から値が変わっていないと分かっているチャネルの chan_id の集合
+                       （差分形式では、最後の区間を比較せずに延ばします）
+            partial: ノードの一部のチャネルだけの書き込み（イベントなど）の場合は True
+                     （差分形式では、含まれないチャネルを取得エラーによる欠損とみなしません）
+
+        Returns:
+            {'inserted': 書き込んだ行数, 'skipped': 値を作成できずに除外した行数, 'date': 日時}
+        """
+        if date is None:
+            date = datetime.now().strftime(self.DATE_FORMAT)
+        ts = self._date_to_ts(date)
+
+        rows = []
+        skipped = 0
+        for channel, data, amboss_fee in snapshots:
+            try:
+                row = self._channel_data_row(channel, data, amboss_fee, date)
+                if self.storage == 'compact':
+                    row = (self.node_id,) + self._compact_row(row, ts)
+                elif self.storage == 'delta':
+                    row = self._delta_row(row)
+                else:
+                    row = (self.node_id,) + row
+                rows.append(row)
+            except (AttributeError, TypeError, ValueError) as e:
+                print(f"チャンネル {channel.get('chan_id')} のデータ変換中にエラーが発生しました: {e}")
+                skipped += 1
+
+        if not rows:
+            return {'inserted': 0, 'skipped': skipped, 'date': date}
+
         try:
-            cursor = self.conn.cursor()
-            cursor.execute(sql, (f'-{months} months',))
+            # 月ごとのファイルに分割している場合は、トランザクションの前に書き込む月のファイルを ATTACH する
+            schema = self._write_schema(date)
+            self.conn.execute("BEGIN TRANSACTION")
+            if self.storage == 'delta':
+                # 'inserted' は記録したサンプル数（新しく追加した区間の数ではない）
+                self._write_intervals(rows, ts, {int(chan_id) for chan_id in unchanged or ()}, partial)
+            else:
+                self.conn.executemany(self._insert_sql(schema), rows)
             self.conn.commit()
-            return cursor.rowcount
+            return {'inserted': len(rows), 'skipped': skipped, 'date': date}
         except Error as e:
+            self.conn.rollback()
+            print(f"channel_datas の一括書き込み中にエラーが発生しました: {e}")
+            return {'inserted': 0, 'skipped': skipped + len(rows), 'date': date, 'error': str(e)}
+
+    def delete_old_data(self, months, chunk_size=5000, chunk_seconds=0.5, pause_seconds=0.05):
+        """
+        保持期間 (months) より古いサンプルをチャンク単位で削除します。
+
+        チャンクごとにコミットし、チャンクの間に pause_seconds 待つため、
+        削除中も収集処理が書き込みできます。1 チャンクの処理時間が chunk_seconds に
+        収まるようにチャンクサイズを自動で調整します。
+
+        月ごとのファイルに分割している場合は、保持期間より前に終わった月のファイルを削除します。
+
+        Returns:
+            削除した行数
+        """
+        if self.partitioning != 'none':
+            return self._drop_old_partitions(months)
+        cursor = self.conn.cursor()
+        try:
+            if self.storage in ('compact', 'delta'):
+                cutoff = cursor.execute("SELECT CAST(strftime('%s', 'now', ?) AS INTEGER);",
+                                        (f'-{months} months',)).fetchone()[0]
+                if self.storage == 'compact':
+                    chunks = self._delete_old_samples_chunks(cutoff)
+                else:
+                    chunks = self._delete_old_intervals_chunks(cutoff)
+            else:
+                cutoff = cursor.execute("SELECT date('now', ?);", (f'-{months} months',)).fetchone()[0]
+                chunks = self._delete_old_datas_chunks(cutoff)
+
+            total = 0
+            next(chunks)
+            while True:
+                started = time.monotonic()
+                deleted = chunks.send(chunk_size)
+                if deleted is None:
+                    # 最後の空のチャンク（delta 形式では記録日時の削除）のトランザクションを閉じる
+                    self.conn.commit()
+                    break
+                self.conn.commit()
+                elapsed = time.monotonic() - started
+                total += deleted
+                print(f"古いデータを削除中: {total}件 (チャンク {deleted}件 / {elapsed:.2f}秒)")
+
+                # 処理時間に合わせてチャンクサイズを調整する
+                if elapsed > chunk_seconds:
+                    chunk_size = max(100, chunk_size // 2)
+                elif elapsed < chunk_seconds / 4:
+                    chunk_size = min(200000, chunk_size * 2)
+                time.sleep(pause_seconds)
+            return total
+        except Error as e:
+            self.conn.rollback()
             print(f"Error deleting old data: {e}")
             return 0
-    
+
+    def _drop_old_partitions(self, months):
+        """
+        保持期間 (months) より前に終わった月のファイルを削除し、含まれていた行数を返します。
+        保持期間の境界を含む月のファイルは、月全体が保持期間を過ぎるまで残します。
+        """
+        total = 0
+        try:
+            cutoff_month = self.conn.execute("SELECT strftime('%Y-%m', 'now', ?);",
+                                             (f'-{months} months',)).fetchone()[0]
+            for month in self.list_partitions():
+                if month >= cutoff_month:
+                    break
+                schema = self._attach_partition(month)
+                rows = self.conn.execute(f"SELECT COUNT(*) FROM {schema}.{self._sample_table()};").fetchone()[0]
+                self.drop_partition(month)
+                total += rows
+                print(f"古いデータを削除中: {month} のファイルを削除しました ({rows}件)")
+        except (Error, OSError) as e:
+            print(f"Error deleting old data: {e}")
+        return total
+
+    def _delete_partition_channels(self, channel_ids, batch_size=500):
+        """
+        月ごとのファイルから、このノードの channel_ids のチャネル（閉じられたチャネル）のサンプルを削除します。
+        ファイルを 1 つずつ読み書き可能で ATTACH し、ファイルごとにコミットします。
+
+        Returns:
+            削除した行数
+        """
+        table = self._sample_table()
+        if table == 'channel_samples':
+            channel_ids = [int(channel_id) for channel_id in channel_ids]
+        total = 0
+        for month in self.list_partitions():
+            try:
+                schema = self._attach_partition(month, writable=True)
+                self.conn.execute("BEGIN TRANSACTION")
+                for start in range(0, len(channel_ids), batch_size):
+                    chunk = channel_ids[start:start + batch_size]
+                    cursor = self.conn.execute(
+                        f"DELETE FROM {schema}.{table} WHERE node_id = ? AND channel_id IN ({', '.join('?' * len(chunk))});",
+                        [self.node_id] + chunk)
+                    total += cursor.rowcount
+                self.conn.commit()
+            except (Error, OSError) as e:
+                self.conn.rollback()
+                print(f"{month} のファイルから閉じられたチャネルのサンプルを削除中にエラーが発生しました: {e}")
+        return total
+
+    def retention_cutoff(self, months):
+        """
+        delete_old_data(months) で削除される可能性のあるサンプルを含む日時の上限 ('%Y-%m-%d %H:%M'、この日時未満) を返します。
+        削除前のアーカイブの範囲に使います。
+        """
+        return self.conn.execute("SELECT strftime('%Y-%m-%d %H:%M', 'now', ?, '+1 minute', 'localtime');",
+                                 (f'-{months} months',)).fetchone()[0]
+
+    def _delete_old_datas_chunks(self, cutoff):
+        """
+        channel_datas から cutoff より古い行を削除するジェネレータ
+        send() で受け取った件数ずつ削除して削除件数を返し、削除対象がなくなると None を返す
+        """
+        sql = self.HOT_QUERIES['legacy']['delete_old_data'][0]
+        cursor = self.conn.cursor()
+        limit = yield
+        while True:
+            cursor.execute(sql, (cutoff, limit))
+            if cursor.rowcount == 0:
+                break
+            limit = yield cursor.rowcount
+        yield None
+
+    def _delete_old_samples_chunks(self, cutoff):
+        """
+        channel_samples から cutoff より古い行を削除するジェネレータ
+        主キー (node_id, channel_id, ts) の範囲検索が使えるようにノードのチャネルごとに削除する
+        （チャネルは主キーを 1 件ずつたどって求め、SELECT DISTINCT でテーブル全体を走査しない）
+        """
+        sql = self.HOT_QUERIES['compact']['delete_old_data'][0]
+        next_sql = self.HOT_QUERIES['compact']['next_sample_channel'][0]
+        cursor = self.conn.cursor()
+        limit = yield
+        deleted = 0
+        row = cursor.execute("SELECT node_id, channel_id FROM channel_samples "
+                             "ORDER BY node_id, channel_id LIMIT 1;").fetchone()
+        while row is not None:
+            node_id, channel_id = row
+            while True:
+                cursor.execute(sql, (node_id, channel_id, node_id, channel_id, cutoff, limit - deleted))
+                deleted += cursor.rowcount
+                if deleted < limit:
+                    break
+                limit = yield deleted
+                deleted = 0
+            row = cursor.execute(next_sql, (node_id, channel_id)).fetchone()
+        if deleted:
+            yield deleted
+        yield None
+
+    def _delete_old_intervals_chunks(self, cutoff):
+        """
+        channel_intervals から cutoff より前に終わった区間を削除するジェネレータ
+        cutoff をまたぐ区間は残し、展開時に cutoff より前の記録日時が出ないように channel_interval_times も削除する
+        """
+        sql = '''DELETE FROM channel_intervals WHERE (node_id, channel_id, valid_from) IN (
+                    SELECT node_id, channel_id, valid_from FROM channel_intervals WHERE valid_to < ? LIMIT ?);'''
+        cursor = self.conn.cursor()
+        limit = yield
+        while True:
+            cursor.execute(sql, (cutoff, limit))
+            if cursor.rowcount == 0:
+                break
+            limit = yield cursor.rowcount
+        cursor.execute("DELETE FROM channel_interval_times WHERE ts < ?;", (cutoff,))
+        yield None
+
+    def enable_incremental_vacuum(self):
+        """
+        auto_vacuum が INCREMENTAL でない既存のデータベースを VACUUM で INCREMENTAL に変換します。
+        データベース全体を再構築するため、収集を止めて一度だけ実行してください（--enable_incremental_vacuum）。
+
+        Returns:
+            変換した場合は True（変換済みの場合とエラーの場合は False）
+        """
+        try:
+            cursor = self.conn.cursor()
+            if cursor.execute("PRAGMA auto_vacuum;").fetchone()[0] == 2:
+                print("auto_vacuum は既に INCREMENTAL です。")
+                return False
+            # auto_vacuum の変更は VACUUM で再構築するまで反映されない
+            print("auto_vacuum を INCREMENTAL に変更しています（データベース全体を再構築します）...")
+            cursor.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+            self.vacuum()
+            return cursor.execute("PRAGMA auto_vacuum;").fetchone()[0] == 2
+        except Error as e:
+            print(f"auto_vacuum の変更中にエラーが発生しました: {e}")
+            return False
+
+    def reclaim_free_pages(self, pages_per_step=2000, pause_seconds=0.05):
+        """
+        削除で空いたページを incremental_vacuum で少しずつ解放します。
+        auto_vacuum が INCREMENTAL でないデータベースは何もしません（enable_incremental_vacuum() で変換します）。
+
+        Returns:
+            解放したページ数
+        """
+        try:
+            cursor = self.conn.cursor()
+            if cursor.execute("PRAGMA auto_vacuum;").fetchone()[0] != 2:
+                print("auto_vacuum が INCREMENTAL でないため、空きページを解放できません"
+                      "（--enable_incremental_vacuum で一度だけ変換してください）。")
+                return 0
+
+            freed = 0
+            while True:
+                free_pages = cursor.execute("PRAGMA freelist_count;").fetchone()[0]
+                if free_pages == 0:
+                    break
+                step = min(pages_per_step, free_pages)
+                # incremental_vacuum は 1 ステップで 1 ページずつ解放するため、execute() では 1 ページしか解放されない
+                # executescript() は最後まで実行する（実行前にコミットされる）
+                self.conn.executescript(f"PRAGMA incremental_vacuum({step});")
+                remaining = cursor.execute("PRAGMA freelist_count;").fetchone()[0]
+                freed += free_pages - remaining
+                print(f"空きページを解放中: {freed}ページ (残り {remaining}ページ)")
+                if remaining >= free_pages:
+                    break
+                time.sleep(pause_seconds)
+            return freed
+        except Error as e:
+            print(f"空きページの解放中にエラーが発生しました: {e}")
+            return 0
+
+    def _iter_raw_samples(self, since, batch_size=10000, end=None):
+        """
+        since 以降の全ノードの生サンプルを
+        (node_id, channel_id, date, local_balance, remote_balance, local_fee, remote_fee, active)
+        として node_id, channel_id, date の順に返すジェネレータ
+        月ごとのファイルに分割している場合は end 未満のファイルだけを読み込み、ファイルごとに node_id, channel_id, date の順になる
+        """
+        if self.storage == 'delta':
+            since_ts = self._date_to_ts(since) if since else 0
+            for row in self._iter_interval_samples(since_ts, batch_size=batch_size):
+                yield (row[0], str(row[1]), datetime.fromtimestamp(row[2]).strftime(self.DATE_FORMAT)) + row[3:]
+            return
+
+        if self.storage == 'compact':
+            since_ts = self._date_to_ts(since) if since else 0
+            rows = self._query_samples(
+                lambda table: f'''SELECT node_id, channel_id, ts, local_balance, remote_balance, local_fee, remote_fee,
+                                         active
+                                  FROM {table} WHERE ts >= ? ORDER BY node_id, channel_id, ts;''', (since_ts,), since,
+                end, batch_size)
+            for row in rows:
+                yield (row[0], str(row[1]), datetime.fromtimestamp(row[2]).strftime(self.DATE_FORMAT)) + tuple(row[3:])
+        else:
+            rows = self._query_samples(
+                lambda table: f'''SELECT node_id, channel_id, date, local_balance, remote_balance, local_fee, remote_fee,
+                                         active
+                                  FROM {table} WHERE date >= ? ORDER BY node_id, channel_id, date;''', (since or '',),
+                since, end, batch_size)
+            for row in rows:
+                yield tuple(row)
+
+    def _get_rollup_watermark(self, tier):
+        row = self.conn.execute("SELECT watermark FROM rollup_state WHERE tier = ?;", (tier,)).fetchone()
+        return row[0] if row else None
+
+    def _set_rollup_watermark(self, tier, watermark):
+        self.conn.execute('''INSERT INTO rollup_state (tier, watermark) VALUES (?, ?)
+                             ON CONFLICT(tier) DO UPDATE SET watermark=excluded.watermark;''', (tier, watermark))
+
+    def _replace_rollup_rows(self, table, start, rows):
+        """table の start 以降のバケットを rows で置き換え、(書き込んだ行数, 最後の日時) を返します。"""
+        written = 0
+        last_date = None
+
+        def tracked():
+            nonlocal written, last_date
+            for row in rows:
+                written += 1
+                if last_date is None or row[-1] > last_date:
+                    last_date = row[-1]
+                yield row
+
+        placeholders = ', '.join(['?'] * len(ROLLUP_COLUMNS))
+        cursor = self.conn.cursor()
+        cursor.execute(f"DELETE FROM {table} WHERE bucket >= ?;", (start,))
+        cursor.executemany(f"INSERT INTO {table} ({', '.join(ROLLUP_COLUMNS)}) VALUES ({placeholders});", tracked())
+        return written, last_date
+
+    def update_rollups(self):
+        """
+        前回の集約以降の生サンプルを hourly に、hourly を daily に差分で集約します。
+        最後のバケットは途中の可能性があるため、毎回そのバケットから集約し直します。
+
+        月ごとのファイルに分割している場合、hourly への集約は月ごとに 1 トランザクションで行います
+        （ATTACH はトランザクション中にできないため）。
+
+        Returns:
+            {'hourly': 書き込んだ行数, 'daily': 書き込んだ行数}
+        """
+        hourly_table = ROLLUP_TABLES['hourly']
+        daily_table = ROLLUP_TABLES['daily']
+        previous_sql = f'''SELECT local_fee_last, remote_fee_last FROM {hourly_table}
+                           WHERE node_id = ? AND channel_id = ? AND bucket < ? ORDER BY bucket DESC LIMIT 1;'''
+        hourly = 0
+        try:
+            watermark = self._get_rollup_watermark('hourly')
+            for start, end in self._rollup_segments(hour_bucket(watermark) if watermark else ''):
+                # 読み込む月のファイルをトランザクションの前に ATTACH しておく
+                for _ in self._sample_sources(start, end):
+                    pass
+                self.conn.execute("BEGIN TRANSACTION")
+
+                def previous_fees(node_id, channel_id):
+                    row = self.conn.execute(previous_sql, (node_id, channel_id, start)).fetchone()
+                    return (row[0], row[1]) if row else None
+
+                written, last_date = self._replace_rollup_rows(
+                    hourly_table, start, rollup_samples(self._iter_raw_samples(start, end=end), previous_fees))
+                hourly += written
+                if last_date:
+                    self._set_rollup_watermark('hourly', last_date)
+                if self.partitioning != 'none':
+                    self.conn.commit()
+
+            watermark = self._get_rollup_watermark('daily')
+            start = day_bucket(watermark) if watermark else ''
+            cursor = self.conn.execute(
+                f'''SELECT {', '.join(ROLLUP_COLUMNS)} FROM {hourly_table} WHERE bucket >= ?
+                    ORDER BY node_id, channel_id, bucket;''',
+                (start,))
+            daily, _ = self._replace_rollup_rows(daily_table, start, rollup_rollups(cursor))
+            last_bucket = self.conn.execute(f"SELECT MAX(bucket) FROM {hourly_table};").fetchone()[0]
+            if last_bucket:
+                self._set_rollup_watermark('daily', last_bucket)
+
+            self.conn.commit()
+            return {'hourly': hourly, 'daily': daily}
+        except Error as e:
+            self.conn.rollback()
+            print(f"ロールアップの更新中にエラーが発生しました: {e}")
+            return {'hourly': hourly if self.partitioning != 'none' else 0, 'daily': 0, 'error': str(e)}
+
+    def _rollup_segments(self, start):
+        """
+        start 以降の生サンプルを集約する範囲 (開始, 終了) のリストを返します。
+        分割しない場合は 1 つ、月ごとのファイルに分割している場合はファイルごとの範囲になります。
+        """
+        if self.partitioning == 'none':
+            return [(start, None)]
+        return [(max(start, f"{month}-01 00:00"), f"{self._next_month(month)}-01 00:00")
+                for month in self.list_partitions() if month >= start[:7]]
+
+    def delete_old_rollups(self, hourly_retention_days=None, daily_retention_days=None):
+        """
+        保持期間 (日数) を過ぎたロールアップを削除します。None または 0 の階層は削除しません。
+
+        Returns:
+            {'hourly': 削除した行数, 'daily': 削除した行数}
+        """
+        result = {}
+        try:
+            cursor = self.conn.cursor()
+            for tier, days in (('hourly', hourly_retention_days), ('daily', daily_retention_days)):
+                result[tier] = 0
+                if not days:
+                    continue
+                cursor.execute(f"DELETE FROM {ROLLUP_TABLES[tier]} WHERE bucket < date('now', ?);", (f'-{days} days',))
+                result[tier] = cursor.rowcount
+            self.conn.commit()
+        except Error as e:
+            self.conn.rollback()
+            print(f"ロールアップの削除中にエラーが発生しました: {e}")
+        return result
+
+    # get_channel_history で resolution='auto' の場合に使う期間の上限（日数）
+    HISTORY_RAW_MAX_DAYS = 2
+    HISTORY_HOURLY_MAX_DAYS = 92
+
+    def get_channel_history(self, channel_id, start, end, resolution='auto'):
+        """
+        チャネルの start 以上 end 未満 ('%Y-%m-%d %H:%M') の履歴を取得します。
+
+        resolution が 'auto' の場合は期間の長さに応じて生サンプル・hourly・daily を選び、
+        長い期間の問い合わせで生サンプルを走査しないようにします。
+        ロールアップの場合、残高は平均値、手数料はバケット最後の値、active は稼働率になります。
+
+        Returns:
+            (resolution, [{'date', 'samples', 'local_balance', 'remote_balance',
+                           'local_fee', 'remote_fee', 'active'}, ...])
+        """
+        if resolution == 'auto':
+            days = (datetime.strptime(end, self.DATE_FORMAT) - datetime.strptime(start, self.DATE_FORMAT)).days
+            if days <= self.HISTORY_RAW_MAX_DAYS:
+                resolution = 'raw'
+            elif days <= self.HISTORY_HOURLY_MAX_DAYS:
+                resolution = 'hourly'
+            else:
+                resolution = 'daily'
+
+        if resolution == 'raw':
+            return resolution, [dict(sample, samples=1) for sample in self.get_channel_samples(channel_id, start, end)]
+
+        keys = ('date', 'samples', 'local_balance', 'remote_balance', 'local_fee', 'remote_fee', 'active')
+        try:
+            bucket_fn = hour_bucket if resolution == 'hourly' else day_bucket
+            sql = f'''SELECT bucket, samples, local_balance_avg, remote_balance_avg,
+                      local_fee_last, remote_fee_last, active_ratio
+                      FROM {ROLLUP_TABLES[resolution]}
+                      WHERE node_id = ? AND channel_id = ? AND bucket >= ? AND bucket < ? ORDER BY bucket;'''
+            rows = self.conn.execute(sql, (self.node_id, channel_id, bucket_fn(start), end))
+            return resolution, [dict(zip(keys, row)) for row in rows]
+        except (Error, KeyError) as e:
+            print(f"チャネル履歴の取得中にエラーが発生しました: {e}")
+            return resolution, []
+
+    def _iter_series_rows(self, channel_id, start, end, step=None, origin=0):
+        """
+        チャネルの start 以上 end 未満のサンプルを (エポック秒, *SERIES_COLUMNS) として日時の順に返す
+        step を指定した場合は、origin から step 秒ごとのグリッド時刻 (以前) に対応する最後のサンプルだけを返す
+        """
+        columns = ', '.join(SERIES_COLUMNS)
+        start_ts, end_ts = self._date_to_ts(start), self._date_to_ts(end)
+        if self.storage == 'delta':
+            return (row[2:] for row in self._iter_interval_samples(start_ts, end_ts, channel_id))
+        if self.storage == 'compact':
+            ts = 'ts'
+            where = "WHERE node_id = ? AND channel_id = ? AND ts >= ? AND ts < ?"
+            params = [self.node_id, int(channel_id), start_ts, end_ts]
+        else:
+            # date はローカル時刻の文字列のため、'utc' 修飾子でエポック秒に変換する（_date_to_ts と同じ値になる）
+            ts = "CAST(strftime('%s', date, 'utc') AS INTEGER)"
+            where = "WHERE node_id = ? AND channel_id = ? AND date >= ? AND date < ?"
+            params = [self.node_id, str(channel_id), start, end]
+
+        if step:
+            # グリッド時刻ごとに最後のサンプルだけを SQLite 側で選び、Python に渡す行数を減らす
+            # (MAX() と同時に選んだカラムは、最大値の行の値になる)
+            # 月ごとのファイルに分割している場合、月をまたぐグリッドは両方のファイルから 1 行ずつ返る（resample() で後の行が使われる）
+            def build_sql(table):
+                return f"SELECT MAX({ts}), {columns} FROM {table} {where} GROUP BY ({ts} - ? + ? - 1) / ? ORDER BY 1;"
+            params += [origin, step, step]
+        else:
+            def build_sql(table):
+                return f"SELECT {ts}, {columns} FROM {table} {where} ORDER BY {ts};"
+        return self._query_samples(build_sql, params, start, end)
+
+    def get_channels_arrays(self, start, end, channel_ids=None, step=None, max_gap=None,
+                            chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        複数チャネルの start 以上 end 未満 ('%Y-%m-%d %H:%M') の履歴を列指向の NumPy 配列で取得します（numpy が必要）。
+        チャネルごとに (channel_id, 日時) のキーで範囲検索し、fetchmany で chunk_size 件ずつ
+        まとめて配列に変換するため、sqlite3.Row を 1 件ずつ扱うより高速です。
+
+        Args:
+            channel_ids: 対象のチャネル（省略時は channel_lists の self.node_id のノードのすべてのチャネル）
+            step: 指定した場合は step 秒間隔のグリッドに揃える。各時刻の値はその時刻以前の最後のサンプル
+            max_gap: step を指定した場合、直前のサンプルがこの秒数より古い時刻は NaN にする
+
+        Returns:
+            step なし: {'channel_id', 'ts', <SERIES_COLUMNS>} の 1 次元配列（channel_id, ts の順）
+            step あり: {'channel_id': (チャネル数,), 'ts': グリッド, <SERIES_COLUMNS>: (チャネル数, グリッド数)}
+                       channel_ids を省略した場合、サンプルの無いチャネルは含まない
+        """
+        query_start = start
+        origin = 0
+        if step:
+            # 開始時刻の値を決めるため、グリッドに揃えた分だけ前のサンプルも読み込む
+            lookback_steps = max(1, math.ceil((max_gap if max_gap is not None else step) / step))
+            origin = self._date_to_ts(start) - lookback_steps * step
+            query_start = datetime.fromtimestamp(origin).strftime(self.DATE_FORMAT)
+
+        try:
+            targets = channel_ids
+            if targets is None:
+                targets = [row[0] for row in self.conn.execute(
+                    "SELECT channel_id FROM channel_lists WHERE node_id = ? ORDER BY channel_id;", (self.node_id,))]
+            series = ((channel_id, self._iter_series_rows(channel_id, query_start, end, step, origin))
+                      for channel_id in targets)
+            columns = rows_to_columns(series, chunk_size)
+        except Error as e:
+            print(f"チャネル履歴の配列での取得中にエラーが発生しました: {e}")
+            columns = rows_to_columns([])
+
+        if not step:
+            return columns
+        grid = make_grid(self._date_to_ts(start), self._date_to_ts(end), step)
+        return resample(columns, grid, max_gap, channel_ids)
+
+    def get_channel_arrays(self, channel_id, start, end, step=None, max_gap=None):
+        """
+        1 チャネルの履歴を列指向の NumPy 配列で取得します（get_channels_arrays() 参照）。
+
+        Returns:
+            {'ts', <SERIES_COLUMNS>} の 1 次元配列
+        """
+        columns = self.get_channels_arrays(start, end, [channel_id], step, max_gap)
+        columns.pop('channel_id')
+        if step:
+            for name in SERIES_COLUMNS:
+                columns[name] = columns[name][0]
+        return columns
+
+    # エクスポートするカラム (channel_lists を結合した channel_datas の行)
+    EXPORT_COLUMNS = ('date', 'node_id', 'channel_id', 'channel_name', 'channel_point', 'capacity',
+                      'local_balance', 'local_fee', 'local_infee', 'remote_balance', 'remote_fee', 'remote_infee',
+                      'num_updates', 'amboss_fee', 'active')
+
+    def get_sample_date_range(self):
+        """保存されているサンプルの最初と最後の日時 ('%Y-%m-%d %H:%M') を返します（無い場合は (None, None)）。"""
+        try:
+            if self.storage == 'delta':
+                row = self.conn.execute("SELECT MIN(ts), MAX(ts) FROM channel_interval_times;").fetchone()
+            else:
+                # 月ごとのファイルに分割している場合は最初と最後のファイルの値を使う
+                column = 'ts' if self.storage == 'compact' else 'date'
+                rows = [row for row in self._query_samples(lambda table: f"SELECT MIN({column}), MAX({column}) FROM {table};", ())
+                        if row[0] is not None]
+                row = (rows[0][0], rows[-1][1]) if rows else (None, None)
+                if self.storage == 'legacy':
+                    return row
+            if row[0] is None:
+                return None, None
+            return tuple(datetime.fromtimestamp(ts).strftime(self.DATE_FORMAT) for ts in row)
+        except Error as e:
+            print(f"サンプルの期間の取得中にエラーが発生しました: {e}")
+            return None, None
+
+    def iter_export_rows(self, start, end, window=timedelta(days=1), batch_size=10000):
+        """
+        start 以上 end 未満のサンプルを channel_lists と結合し、EXPORT_COLUMNS の順のタプルとして
+        日時, node_id, channel_id の順に返すジェネレータ（すべてのノードの行）
+
+        window ごとに区切って問い合わせるため、並べ替えに使うメモリは 1 区間分で済みます。
+        """
+        columns = ('channel_name', 'channel_point', 'capacity')
+        values = ('local_balance', 'local_fee', 'local_infee', 'remote_balance', 'remote_fee', 'remote_infee',
+                  'num_updates', 'amboss_fee', 'active')
+        if self.storage == 'compact':
+            sql = f'''SELECT s.ts, s.node_id, CAST(s.channel_id AS TEXT), {', '.join('l.' + c for c in columns)},
+                      {', '.join('s.' + c for c in values)}
+                      FROM {{table}} s LEFT JOIN channel_lists l
+                      ON l.node_id = s.node_id AND l.channel_id = CAST(s.channel_id AS TEXT)
+                      WHERE s.ts >= ? AND s.ts < ? ORDER BY s.ts, s.node_id, s.channel_id;'''
+        elif self.storage == 'delta':
+            sql = f'''SELECT t.ts, i.node_id, CAST(i.channel_id AS TEXT), {', '.join('l.' + c for c in columns)},
+                      {', '.join('i.' + c for c in values)}
+                      FROM channel_interval_times t
+                      JOIN channel_intervals i ON i.node_id = t.node_id AND t.ts BETWEEN i.valid_from AND i.valid_to
+                      LEFT JOIN channel_lists l ON l.node_id = i.node_id AND l.channel_id = CAST(i.channel_id AS TEXT)
+                      WHERE t.ts >= ? AND t.ts < ? AND i.valid_to >= ? ORDER BY t.ts, i.node_id, i.channel_id;'''
+        else:
+            sql = f'''SELECT d.date, d.node_id, d.channel_id, {', '.join('l.' + c for c in columns)},
+                      {', '.join('d.' + c for c in values)}
+                      FROM {{table}} d LEFT JOIN channel_lists l ON l.node_id = d.node_id AND l.channel_id = d.channel_id
+                      WHERE d.date >= ? AND d.date < ? ORDER BY d.date, d.node_id, d.channel_id;'''
+
+        window_start = datetime.strptime(start, self.DATE_FORMAT)
+        end_date = datetime.strptime(end, self.DATE_FORMAT)
+        while window_start < end_date:
+            window_end = min(window_start + window, end_date)
+            window_dates = (window_start.strftime(self.DATE_FORMAT), window_end.strftime(self.DATE_FORMAT))
+            if self.storage == 'legacy':
+                params = window_dates
+            else:
+                params = [int(window_start.timestamp()), int(window_end.timestamp())]
+                if self.storage == 'delta':
+                    params.append(params[0])
+            if self.storage == 'delta':
+                rows = self.conn.execute(sql, params)
+            else:
+                # 月ごとのファイルに分割している場合は、区間を含むファイルを日時の順に問い合わせる
+                rows = self._query_samples(lambda table: sql.replace('{table}', table), params, *window_dates,
+                                           batch_size=batch_size)
+            for row in rows:
+                if self.storage == 'legacy':
+                    yield tuple(row)
+                else:
+                    yield (datetime.fromtimestamp(row[0]).strftime(self.DATE_FORMAT),) + tuple(row[1:])
+            window_start = window_end
+
+    def migrate_to_compact(self, batch_size=50000):
+        """
+        channel_datas のサンプルを channel_samples (コンパクト形式) にストリーミングで移行します。
+        rowid 順に batch_size 件ずつ読み込んで変換・書き込み・コミットするため、
+        テーブルの大きさに関係なくメモリ使用量は一定です。移行元の channel_datas は削除しません。
+
+        Returns:
+            移行した行数
+        """
+        self.create_channel_samples_table()
+        select_sql = '''SELECT rowid, node_id, channel_id, date, local_balance, local_fee, local_infee,
+                        remote_balance, remote_fee, remote_infee, num_updates, amboss_fee, active
+                        FROM channel_datas WHERE rowid > ? ORDER BY rowid LIMIT ?;'''
+        total = self.conn.execute("SELECT COUNT(*) FROM channel_datas;").fetchone()[0]
+        # 同じ実行のサンプルは同じ日時なので、変換結果を使い回す
+        ts_cache = {}
+        migrated = 0
+        last_rowid = 0
+        try:
+            while True:
+                rows = self.conn.execute(select_sql, (last_rowid, batch_size)).fetchall()
+                if not rows:
+                    break
+                converted = []
+                for row in rows:
+                    date = row[3]
+                    ts = ts_cache.get(date)
+                    if ts is None:
+                        ts = ts_cache[date] = self._date_to_ts(date)
+                    converted.append((row[1],) + self._compact_row(tuple(row)[2:], ts))
+                self.conn.executemany(self.CHANNEL_SAMPLES_INSERT_SQL, converted)
+                self.conn.commit()
+                last_rowid = rows[-1][0]
+                migrated += len(rows)
+                if len(ts_cache) > 100000:
+                    ts_cache.clear()
+                print(f"channel_samples への移行: {migrated}/{total} 件")
+        except (Error, ValueError) as e:
+            self.conn.rollback()
+            print(f"channel_samples への移行中にエラーが発生しました: {e}")
+        return migrated
+
+    def migrate_to_delta(self, batch_size=50000):
+        """
+        channel_datas のサンプルを channel_intervals (差分形式) に記録日時の順に移行します。
+        batch_size 件ごとにコミットし、途中で中断した場合は移行済みの最後の日時の次から再開します。
+        移行元の channel_datas は削除しません。
+
+        Returns:
+            移行したサンプル数
+        """
+        self.create_channel_intervals_tables()
+        last_ts = self.conn.execute("SELECT MAX(ts) FROM channel_interval_times;").fetchone()[0]
+        since = datetime.fromtimestamp(last_ts).strftime(self.DATE_FORMAT) if last_ts else ''
+        select_sql = '''SELECT channel_id, date, local_balance, local_fee, local_infee,
+                        remote_balance, remote_fee, remote_infee, num_updates, amboss_fee, active, node_id
+                        FROM channel_datas WHERE date > ? ORDER BY date, node_id;'''
+        total = self.conn.execute("SELECT COUNT(*) FROM channel_datas WHERE date > ?;", (since,)).fetchone()[0]
+        migrated = 0
+        pending = 0
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(select_sql, (since,))
+            # 日時とノードごとにまとめて書き込む
+            key = None
+            rows = []
+            while True:
+                batch = cursor.fetchmany(batch_size)
+                for row in batch:
+                    if (row[1], row[-1]) != key and rows:
+                        self.for_node(key[1])._write_intervals(rows, self._date_to_ts(key[0]))
+                        pending += len(rows)
+                        rows = []
+                    key = (row[1], row[-1])
+                    rows.append(self._delta_row(tuple(row)[:-1]))
+                if not batch and rows:
+                    self.for_node(key[1])._write_intervals(rows, self._date_to_ts(key[0]))
+                    pending += len(rows)
+                if pending >= batch_size or not batch:
+                    # 同じ日時のサンプルが揃ってからコミットする（再開時に途中の日時を飛ばさないため）
+                    self.conn.commit()
+                    migrated += pending
+                    pending = 0
+                    print(f"channel_intervals への移行: {migrated}/{total} 件")
+                if not batch:
+                    break
+        except (Error, ValueError) as e:
+            self.conn.rollback()
+            print(f"channel_intervals への移行中にエラーが発生しました: {e}")
+        return migrated
+
+    def migrate_to_partitions(self):
+        """
+        db_path のサンプル (channel_datas / channel_samples) を月ごとのファイルにコピーします。
+        1 か月分ずつ INSERT ... SELECT でコピーしてコミットし、コピー済みのサンプルは飛ばすため再実行できます。
+        移行元のテーブルは削除しません。
+
+        Returns:
+            移行した行数
+        """
+        if self.partitioning == 'none':
+            raise ValueError("Partitioning is not enabled")
+        table = self._sample_table()
+        column = 'ts' if self.storage == 'compact' else 'date'
+        columns = ', '.join(('node_id', 'channel_id', column) + self.INTERVAL_VALUE_COLUMNS)
+        migrated = 0
+        try:
+            first, last = self.conn.execute(f"SELECT MIN({column}), MAX({column}) FROM main.{table};").fetchone()
+            if first is None:
+                return 0
+            if self.storage == 'compact':
+                first, last = (datetime.fromtimestamp(ts).strftime(self.DATE_FORMAT) for ts in (first, last))
+            month = first[:7]
+            while month <= last[:7]:
+                bounds = (f"{month}-01 00:00", f"{self._next_month(month)}-01 00:00")
+                if self.storage == 'compact':
+                    bounds = tuple(self._date_to_ts(bound) for bound in bounds)
+                month, current = self._next_month(month), month
+                if not self.conn.execute(f"SELECT 1 FROM main.{table} WHERE {column} >= ? AND {column} < ? LIMIT 1;",
+                                         bounds).fetchone():
+                    continue
+                schema = self._attach_partition(current, writable=True)
+                # 主キーの無い channel_datas は、同じノード・channel_id・日時の行があれば飛ばす
+                cursor = self.conn.execute(
+                    f'''INSERT OR IGNORE INTO {schema}.{table} ({columns})
+                        SELECT {columns} FROM main.{table} m WHERE m.{column} >= ? AND m.{column} < ?
+                        AND NOT EXISTS (SELECT 1 FROM {schema}.{table} p
+                                        WHERE p.node_id = m.node_id AND p.channel_id = m.channel_id
+                                        AND p.{column} = m.{column});''', bounds)
+                self.conn.commit()
+                migrated += cursor.rowcount
+                print(f"{self.partition_path(current)} への移行: {cursor.rowcount}件")
+        except (Error, ValueError) as e:
+            self.conn.rollback()
+            print(f"月ごとのファイルへの移行中にエラーが発生しました: {e}")
+        return migrated
+
     def get_channel_by_id(self, channel_id):
         """Get channel by channel_id."""
-        sql = "SELECT * FROM channel_lists WHERE channel_id = ?;"
+        sql = "SELECT * FROM channel_lists WHERE node_id = ? AND channel_id = ?;"
         try:
             cursor = self.conn.cursor()
-            cursor.execute(sql, (channel_id,))
+            cursor.execute(sql, (self.node_id, channel_id))
             return cursor.fetchone()
         except Error as e:
             print(f"Error retrieving channel: {e}")
@@ -386,19 +2090,21 @@ class Database:
         if self.conn:
             self.conn.close()
             self.conn = None
+            self._attached = {}
 
     def bulk_insert_channels(self, channels):
         """複数チャンネルを一度に挿入（高速）"""
         if not channels:
             return 0
             
-        sql = '''INSERT OR IGNORE INTO channel_lists (channel_name, channel_id, channel_point, capacity)
-                 VALUES (?, ?, ?, ?);'''
+        sql = '''INSERT OR IGNORE INTO channel_lists (node_id, channel_name, channel_id, channel_point, capacity)
+                 VALUES (?, ?, ?, ?, ?);'''
         
         try:
             cursor = self.conn.cursor()
             # executemany を使用して一括処理
-            values = [(ch.get('peer_alias', ''), ch.get('chan_id', ''), ch.get('channel_point', ''), ch.get('capacity', 0)) 
+            values = [(self.node_id, ch.get('peer_alias', ''), ch.get('chan_id', ''), ch.get('channel_point', ''),
+                       ch.get('capacity', 0))
                      for ch in channels]
             cursor.executemany(sql, values)
             return cursor.rowcount
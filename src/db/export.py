@@ -0,0 +1,195 @@
+# 履歴を Parquet / CSV のファイルに書き出してアーカイブする
+# pyarrow はオプションの依存パッケージのため、Parquet で書き出すときに読み込む
+import csv
+import json
+import os
+from datetime import datetime, timedelta
+
+# 1 つの行グループ (CSV の場合は書き込みの単位) の行数
+DEFAULT_ROW_GROUP_SIZE = 50000
+
+# 1 ファイルあたりの行数の目安（日時の区切りでファイルを閉じるため多少超える）
+DEFAULT_ROWS_PER_FILE = 1000000
+
+# 出力ディレクトリに保存する再開用のカーソル
+CURSOR_FILE = 'export_cursor.json'
+
+EXPORT_FORMATS = ('auto', 'parquet', 'csv')
+
+
+def _parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def resolve_format(fmt):
+    """'auto' の場合は pyarrow があれば parquet、無ければ csv を返す"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    if fmt == 'auto':
+        return 'parquet' if _parquet_available() else 'csv'
+    if fmt == 'parquet' and not _parquet_available():
+        raise ImportError("Parquet での書き出しには pyarrow が必要です (pip install pyarrow)")
+    return fmt
+
+
+class _CsvPartWriter:
+    """CSV のパートファイル（ヘッダー付き）"""
+
+    extension = 'csv'
+
+    def __init__(self, path, columns):
+        self._file = open(path, 'w', encoding='utf-8', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(columns)
+
+    def write_rows(self, rows):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+
+class _ParquetPartWriter:
+    """Parquet のパートファイル（write_rows() 1 回が 1 つの行グループになる）"""
+
+    extension = 'parquet'
+
+    # EXPORT_COLUMNS の型（date と文字列以外は整数）
+    STRING_COLUMNS = ('date', 'node_id', 'channel_id', 'channel_name', 'channel_point')
+
+    def __init__(self, path, columns):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self._schema = pa.schema([(name, pa.string() if name in self.STRING_COLUMNS else pa.int64())
+                                  for name in columns])
+        self._writer = pq.ParquetWriter(path, self._schema, compression='zstd')
+
+    def write_rows(self, rows):
+        arrays = [self._pa.array(values, type=field.type)
+                  for values, field in zip(zip(*rows), self._schema)]
+        self._writer.write_table(self._pa.Table.from_arrays(arrays, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+def load_cursor(output_dir):
+    """再開用のカーソルを読み込む（無い場合は None）"""
+    path = os.path.join(output_dir, CURSOR_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save_cursor(output_dir, cursor):
+    # 書きかけのカーソルが残らないように一時ファイルから置き換える
+    path = os.path.join(output_dir, CURSOR_FILE)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(cursor, f, ensure_ascii=False, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def _normalize_row(row):
+    """capacity 以降の数値のカラムを int に揃える（取得時の文字列のまま保存された値があるため）"""
+    return row[:5] + tuple(_to_int(value) for value in row[5:])
+
+
+def _to_int(value):
+    if value is None or isinstance(value, int):
+        return value
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def export_history(db, output_dir, start=None, end=None, fmt='auto',
+                   row_group_size=DEFAULT_ROW_GROUP_SIZE, rows_per_file=DEFAULT_ROWS_PER_FILE):
+    """
+    start 以上 end 未満の履歴を output_dir に part-NNNNN.{parquet,csv} として書き出す
+
+    行は Database.iter_export_rows() から順に読み込み、row_group_size 行ずつ書き込むため、
+    テーブルの大きさに関係なくメモリ使用量は一定。ファイルは日時の区切りで閉じ、閉じるたびに
+    書き出し済みの最後の日時を export_cursor.json に記録する。同じ output_dir で再実行すると
+    その日時より後から再開する（書きかけのファイルは上書きされる）。
+
+    Returns:
+        {'rows': 書き出した行数, 'files': 作成したファイルのリスト, 'last_date': 最後の日時, 'format': 形式}
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    cursor = load_cursor(output_dir) or {}
+    fmt = cursor.get('format') or resolve_format(fmt)
+    writer_class = _ParquetPartWriter if fmt == 'parquet' else _CsvPartWriter
+
+    first, last = db.get_sample_date_range()
+    result = {'rows': 0, 'files': [], 'last_date': cursor.get('last_date'), 'format': fmt}
+    if first is None:
+        return result
+    if start is None:
+        start = first
+    if end is None:
+        # 最後のサンプルを含めるため 1 分後までにする
+        end = _next_minute(last, db.DATE_FORMAT)
+    if cursor.get('last_date'):
+        # 書き出し済みの日時より後から再開する
+        start = max(start, _next_minute(cursor['last_date'], db.DATE_FORMAT))
+    if start >= end:
+        return result
+
+    part = cursor.get('next_part', 0)
+    writer = None
+    buffer = []
+    file_rows = 0
+    last_date = None
+
+    def flush():
+        nonlocal buffer
+        if buffer:
+            writer.write_rows(buffer)
+            buffer = []
+
+    def close_part():
+        nonlocal writer, part, file_rows
+        flush()
+        writer.close()
+        writer = None
+        part += 1
+        file_rows = 0
+        _save_cursor(output_dir, {'format': fmt, 'last_date': last_date, 'next_part': part})
+        result['last_date'] = last_date
+
+    try:
+        for row in db.iter_export_rows(start, end):
+            date = row[0]
+            if writer is not None and date != last_date and file_rows >= rows_per_file:
+                # 同じ日時の行が 2 つのファイルに分かれないように、日時が変わったところで閉じる
+                close_part()
+            if writer is None:
+                path = os.path.join(output_dir, f'part-{part:05d}.{writer_class.extension}')
+                writer = writer_class(path, db.EXPORT_COLUMNS)
+                result['files'].append(path)
+            buffer.append(_normalize_row(row))
+            file_rows += 1
+            result['rows'] += 1
+            last_date = date
+            if len(buffer) >= row_group_size:
+                flush()
+        if writer is not None:
+            close_part()
+    finally:
+        if writer is not None:
+            # 途中で失敗したファイルはカーソルに記録せず、再実行時に上書きする
+            writer.close()
+    return result
+
+
+def _next_minute(date, date_format):
+    return (datetime.strptime(date, date_format) + timedelta(minutes=1)).strftime(date_format)
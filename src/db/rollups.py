@@ -0,0 +1,169 @@
+# channel_datas を時間単位・日単位に集約したロールアップテーブルの定義と集約処理
+
+# ロールアップの階層 -> テーブル名
+#   hourly は生サンプルから、daily は hourly から集約する
+ROLLUP_TABLES = {
+    'hourly': 'channel_datas_hourly',
+    'daily': 'channel_datas_daily',
+}
+
+ROLLUP_COLUMNS = (
+    'node_id', 'channel_id', 'bucket', 'samples',
+    'local_balance_min', 'local_balance_max', 'local_balance_avg', 'local_balance_last',
+    'remote_balance_min', 'remote_balance_max', 'remote_balance_avg', 'remote_balance_last',
+    'local_fee_last', 'remote_fee_last', 'fee_changes', 'active_ratio', 'last_date',
+)
+
+
+def rollup_table_sql(table):
+    """ロールアップテーブルの CREATE 文を返す"""
+    return f'''CREATE TABLE IF NOT EXISTS {table} (
+                node_id TEXT NOT NULL,
+                channel_id TEXT NOT NULL,
+                bucket TEXT NOT NULL,
+                samples INTEGER NOT NULL,
+                local_balance_min INTEGER,
+                local_balance_max INTEGER,
+                local_balance_avg REAL,
+                local_balance_last INTEGER,
+                remote_balance_min INTEGER,
+                remote_balance_max INTEGER,
+                remote_balance_avg REAL,
+                remote_balance_last INTEGER,
+                local_fee_last INTEGER,
+                remote_fee_last INTEGER,
+                fee_changes INTEGER,
+                active_ratio REAL,
+                last_date TEXT,
+                PRIMARY KEY (node_id, channel_id, bucket)
+              ) WITHOUT ROWID;'''
+
+
+def hour_bucket(date):
+    """'%Y-%m-%d %H:%M' 形式の日時を時間単位のバケット ('%Y-%m-%d %H:00') に変換する"""
+    return date[:13] + ':00'
+
+
+def day_bucket(date):
+    """日時・バケットを日単位のバケット ('%Y-%m-%d') に変換する"""
+    return date[:10]
+
+
+class _Aggregate:
+    """1 ノードの 1 チャネル・1 バケット分の集計値"""
+
+    __slots__ = ('node_id', 'channel_id', 'bucket', 'samples',
+                 'local_min', 'local_max', 'local_sum', 'local_last',
+                 'remote_min', 'remote_max', 'remote_sum', 'remote_last',
+                 'local_fee_last', 'remote_fee_last', 'fee_changes', 'active_sum', 'last_date')
+
+    def __init__(self, node_id, channel_id, bucket):
+        self.node_id = node_id
+        self.channel_id = channel_id
+        self.bucket = bucket
+        self.samples = 0
+        self.local_min = self.local_max = self.local_last = None
+        self.remote_min = self.remote_max = self.remote_last = None
+        self.local_sum = self.remote_sum = 0
+        self.local_fee_last = self.remote_fee_last = None
+        self.fee_changes = 0
+        self.active_sum = 0
+        self.last_date = None
+
+    def add(self, samples, local_min, local_max, local_sum, local_last,
+            remote_min, remote_max, remote_sum, remote_last,
+            local_fee, remote_fee, fee_changes, active_sum, last_date):
+        """集計値 (生サンプルの場合は samples=1) を追加する。日時の昇順で呼び出すこと"""
+        self.samples += samples
+        self.local_min = local_min if self.local_min is None else min(self.local_min, local_min)
+        self.local_max = local_max if self.local_max is None else max(self.local_max, local_max)
+        self.remote_min = remote_min if self.remote_min is None else min(self.remote_min, remote_min)
+        self.remote_max = remote_max if self.remote_max is None else max(self.remote_max, remote_max)
+        self.local_sum += local_sum
+        self.remote_sum += remote_sum
+        self.local_last = local_last
+        self.remote_last = remote_last
+        self.local_fee_last = local_fee
+        self.remote_fee_last = remote_fee
+        self.fee_changes += fee_changes
+        self.active_sum += active_sum
+        self.last_date = last_date
+
+    def row(self):
+        """ROLLUP_COLUMNS の順の行を返す"""
+        return (
+            self.node_id, self.channel_id, self.bucket, self.samples,
+            self.local_min, self.local_max, self.local_sum / self.samples, self.local_last,
+            self.remote_min, self.remote_max, self.remote_sum / self.samples, self.remote_last,
+            self.local_fee_last, self.remote_fee_last, self.fee_changes,
+            self.active_sum / self.samples, self.last_date,
+        )
+
+
+def rollup_samples(rows, previous_fees):
+    """
+    生サンプルを時間単位に集約する
+
+    Args:
+        rows: (node_id, channel_id, date, local_balance, remote_balance, local_fee, remote_fee, active)
+              を node_id, channel_id, date の順に並べたイテラブル
+        previous_fees: node_id と channel_id を受け取り、集約範囲より前の最後の (local_fee, remote_fee)
+                       （無ければ None）を返す関数。範囲先頭のサンプルの手数料変更を数えるために使う
+
+    Yields:
+        ROLLUP_COLUMNS の順の行
+    """
+    current = None
+    last_fees = None
+    for node_id, channel_id, date, local_balance, remote_balance, local_fee, remote_fee, active in rows:
+        bucket = hour_bucket(date)
+        if (current is None or current.channel_id != channel_id or current.node_id != node_id
+                or current.bucket != bucket):
+            if current is not None:
+                if current.channel_id != channel_id or current.node_id != node_id:
+                    last_fees = None
+                yield current.row()
+            if last_fees is None:
+                last_fees = previous_fees(node_id, channel_id)
+            current = _Aggregate(node_id, channel_id, bucket)
+
+        fees = (local_fee, remote_fee)
+        fee_changed = int(last_fees is not None and fees != last_fees)
+        last_fees = fees
+        local_balance = local_balance or 0
+        remote_balance = remote_balance or 0
+        current.add(1, local_balance, local_balance, local_balance, local_balance,
+                    remote_balance, remote_balance, remote_balance, remote_balance,
+                    local_fee, remote_fee, fee_changed, active or 0, date)
+
+    if current is not None:
+        yield current.row()
+
+
+def rollup_rollups(rows, bucket_fn=day_bucket):
+    """
+    ロールアップの行をさらに粗いバケットに集約する（hourly -> daily）
+
+    Args:
+        rows: ROLLUP_COLUMNS の順の行を node_id, channel_id, bucket の順に並べたイテラブル
+
+    Yields:
+        ROLLUP_COLUMNS の順の行
+    """
+    current = None
+    for (node_id, channel_id, bucket, samples,
+         local_min, local_max, local_avg, local_last,
+         remote_min, remote_max, remote_avg, remote_last,
+         local_fee_last, remote_fee_last, fee_changes, active_ratio, last_date) in rows:
+        target = bucket_fn(bucket)
+        if (current is None or current.channel_id != channel_id or current.node_id != node_id
+                or current.bucket != target):
+            if current is not None:
+                yield current.row()
+            current = _Aggregate(node_id, channel_id, target)
+        current.add(samples, local_min, local_max, local_avg * samples, local_last,
+                    remote_min, remote_max, remote_avg * samples, remote_last,
+                    local_fee_last, remote_fee_last, fee_changes, active_ratio * samples, last_date)
+
+    if current is not None:
+        yield current.row()
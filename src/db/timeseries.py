@@ -0,0 +1,116 @@
+# チャネル履歴を列指向の NumPy 配列として読み込むための補助関数
+# numpy はオプションの依存パッケージ（分析用途でのみ必要）のため、使うときに読み込む
+from itertools import islice
+
+# 配列として返す値のカラム（順序は各保存形式の SELECT と合わせる）
+SERIES_COLUMNS = ('local_balance', 'remote_balance', 'local_fee', 'remote_fee', 'active')
+
+# fetchmany で一度に読み込む行数
+DEFAULT_CHUNK_SIZE = 50000
+
+
+def require_numpy():
+    """numpy を読み込んで返す（インストールされていない場合は ImportError）"""
+    try:
+        import numpy
+    except ImportError as e:
+        raise ImportError("配列での読み込みには numpy が必要です (pip install numpy)") from e
+    return numpy
+
+
+def _iter_chunks(rows, chunk_size):
+    """カーソルの場合は fetchmany で、それ以外のイテラブルは chunk_size 件ずつのリストで返す"""
+    if hasattr(rows, 'fetchmany'):
+        while True:
+            chunk = rows.fetchmany(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    else:
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+
+def rows_to_columns(series, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    チャネルごとの (ts, *SERIES_COLUMNS) の行を列ごとの配列に変換する
+    channel_id と ts は int64、値は float64（NULL は NaN）になる
+
+    Args:
+        series: (channel_id, ts の昇順の行のカーソルまたはイテラブル) のイテラブル
+
+    Returns:
+        {'channel_id': ndarray, 'ts': ndarray, <SERIES_COLUMNS>: ndarray}（channel_id, ts の順）
+    """
+    np = require_numpy()
+    width = 1 + len(SERIES_COLUMNS)
+    ids, blocks = [], []
+    for channel_id, rows in series:
+        for chunk in _iter_chunks(rows, chunk_size):
+            # 行全体を一度に float64 に変換する（エポック秒は 2**53 未満なので誤差なく表せる）
+            blocks.append(np.array(chunk, dtype=np.float64).reshape(len(chunk), width))
+            # channel_id (scid) は float64 では精度が落ちるため行とは別に持つ
+            ids.append(np.full(len(chunk), int(channel_id), dtype=np.int64))
+
+    if blocks:
+        ids, values = np.concatenate(ids), np.concatenate(blocks)
+    else:
+        ids, values = np.empty(0, dtype=np.int64), np.empty((0, width), dtype=np.float64)
+
+    columns = {'channel_id': ids, 'ts': values[:, 0].astype(np.int64)}
+    for i, name in enumerate(SERIES_COLUMNS, start=1):
+        columns[name] = np.ascontiguousarray(values[:, i])
+    return columns
+
+
+def make_grid(start_ts, end_ts, step):
+    """start_ts 以上 end_ts 未満の step 秒間隔のタイムスタンプを返す"""
+    np = require_numpy()
+    if step <= 0:
+        raise ValueError(f"step must be positive: {step}")
+    return np.arange(start_ts, end_ts, step, dtype=np.int64)
+
+
+def resample(columns, grid, max_gap=None, channel_ids=None):
+    """
+    rows_to_columns() の結果を固定間隔の grid に揃える
+
+    各グリッド時刻の値は、その時刻以前で最後のサンプルの値になる（サンプル前や、
+    直前のサンプルが max_gap 秒より古い場合は NaN）。
+    channel_ids を指定した場合はその順に行を並べる（サンプルの無いチャネルはすべて NaN）。
+
+    Returns:
+        {'channel_id': (チャネル数,), 'ts': grid, <SERIES_COLUMNS>: (チャネル数, len(grid))}
+    """
+    np = require_numpy()
+    ids = columns['channel_id']
+    timestamps = columns['ts']
+    # チャネルごとの範囲（ids は channel_id ごとにまとまっている）
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]]) if len(ids) else np.empty(0, dtype=np.int64)
+    ends = np.append(starts[1:], len(ids))
+    ranges = {int(ids[start]): (start, end) for start, end in zip(starts, ends)}
+    if channel_ids is None:
+        channel_ids = list(ranges)
+    channel_ids = np.array([int(channel_id) for channel_id in channel_ids], dtype=np.int64)
+
+    result = {'channel_id': channel_ids, 'ts': grid}
+    for name in SERIES_COLUMNS:
+        result[name] = np.full((len(channel_ids), len(grid)), np.nan)
+
+    for row, channel_id in enumerate(channel_ids):
+        if int(channel_id) not in ranges:
+            continue
+        start, end = ranges[int(channel_id)]
+        channel_ts = timestamps[start:end]
+        index = np.searchsorted(channel_ts, grid, side='right') - 1
+        valid = index >= 0
+        if max_gap is not None:
+            valid &= (grid - channel_ts[np.maximum(index, 0)]) <= max_gap
+        source = start + index[valid]
+        for name in SERIES_COLUMNS:
+            result[name][row, valid] = columns[name][source]
+    return result
@@ -1,17 +1,18 @@
 import os
 import sys
-import argparse
-from pathlib import Path
+from datetime import datetime
 
 # インポートパスをプロジェクトルートに設定（最初に実行）
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
-# 修正後のインポート文
+# 起動時間を短くするため、ここでは全モードで使う軽いモジュールだけをインポートする
+# requests を使う LND / Amboss のモジュール、エクスポート、スケジューラは使うモードの関数内でインポートする
+# (python -X importtime src/main.py --help や benchmarks/bench_startup.py で確認)
 from src.db.database import Database
-from src.api.lightning_client import get_channel_lists, get_channel_data, get_amboss_fee
 from src.utils.config import Config  # load_config ではなく Config をインポート
+from src.utils import metrics
 
 def resource_path(relative_path):
     """実行環境に応じたリソースパスを返す"""
@@ -26,11 +27,279 @@ def resource_path(relative_path):
     
     return os.path.join(base_path, relative_path), is_exe
 
-def main(delete_old_data=None, update_add_active=False, update_channel=False):
-    # リソースパスとexe環境かどうかを取得
+def record_run(db, config, mode, job):
+    """
+    job() を 1 回の実行として計測し、フェーズの所要時間・HTTP のレイテンシ・行数とエラー数を runs テーブルに保存する
+    metrics.prometheus_textfile を設定した場合は Prometheus のテキストファイルにも書き出す
+    job の例外は status を error として保存した後にそのまま送出する
+    """
+    settings = config.get('metrics', {})
+    if not settings.get('enabled', True):
+        return job()
+
+    run = metrics.start_run(mode)
+    try:
+        result = job()
+        run.finish('ok')
+        return result
+    except BaseException as e:
+        run.finish('error', str(e) or type(e).__name__)
+        raise
+    finally:
+        metrics.end_run(run)
+        db.insert_run(run)
+        textfile = settings.get('prometheus_textfile')
+        if textfile:
+            try:
+                metrics.write_textfile(run, textfile)
+            except OSError as e:
+                print(f"メトリクスのテキストファイルの書き出し中にエラーが発生しました: {e}")
+        phases = ', '.join(f"{name}: {seconds:.2f}秒" for name, seconds in run.phases.items())
+        print(f"実行時間: {run.duration_seconds:.2f}秒 ({phases}), エラー: {run.errors}件, "
+              f"期限切れでスキップ: {run.counters.get('channels_skipped', 0)}件")
+
+def update_rollups(db, config):
+    """config.yaml の rollups 設定に従ってロールアップを更新し、保持期間を過ぎたものを削除する"""
+    rollups = config.get('rollups', {})
+    if not rollups.get('enabled', True):
+        return
+    with metrics.phase('rollups'):
+        result = db.update_rollups()
+        deleted = db.delete_old_rollups(rollups.get('hourly_retention_days', 180),
+                                        rollups.get('daily_retention_days', 0))
+    print(f"ロールアップを更新しました (hourly: {result.get('hourly', 0)}件, daily: {result.get('daily', 0)}件, "
+          f"削除 hourly: {deleted.get('hourly', 0)}件, daily: {deleted.get('daily', 0)}件)")
+
+def archive_old_data(db, config, months):
+    """
+    database.retention.archive_dir が設定されている場合、削除対象になる期間のサンプルを書き出す
+    前回の続きから書き出すため、毎回の削除の前に実行しても重複しない
+
+    Returns:
+        書き出しに成功した（またはアーカイブしない設定の）場合は True
+    """
+    retention = config.get_database_config().get('retention', {})
+    archive_dir = retention.get('archive_dir')
+    if not archive_dir:
+        return True
+    from src.db.export import export_history
+    print(f"削除前に {archive_dir} へ履歴を書き出しています...")
+    try:
+        with metrics.phase('archive'):
+            result = export_history(db, archive_dir, end=db.retention_cutoff(months),
+                                    fmt=retention.get('archive_format', 'auto'))
+    except (ImportError, OSError, ValueError) as e:
+        print(f"履歴の書き出し中にエラーが発生しました: {e}")
+        return False
+    print(f"{result['rows']}件 を {result['format']} で書き出しました (最後の日時: {result['last_date']})")
+    return True
+
+def fetch_node(config, fee_cache=None, fingerprints=None):
+    """
+    1 ノードのチャネル一覧とチャネルデータを取得する（データベースには書き込まない）
+    実行期限を過ぎた後のチャネルはスキップし、それまでに取得できたチャネルだけを返す
+    fingerprints を指定した場合は、num_updates が前回と同じチャネルのエッジ情報を取得せずに前回のポリシーを使う
+
+    Returns:
+        (チャネル一覧, 取得できた (channel, channel_data, amboss_fee) のリスト)
+    """
+    from src.api import resilience
+    from src.api.collector import collect_channel_snapshots, get_concurrency
+    from src.api.lightning_client import get_channel_lists
+
+    # Config オブジェクト（またはノードごとの設定の辞書）を渡す
+    with metrics.phase('channel_list'):
+        channel_lists = get_channel_lists(config)
+    metrics.increment('channels', len(channel_lists))
+    # collection.concurrency に応じて並列取得する（エラーのチャネルはスキップ）
+    concurrency = get_concurrency(config)
+    snapshots = list(collect_channel_snapshots(channel_lists, config, concurrency, fee_cache, fingerprints))
+    deadline = resilience.current()
+    if deadline is not None and deadline.expired:
+        print(f"実行期限 ({deadline.seconds:g}秒) を過ぎたため、残りのチャネルをスキップしました")
+    return channel_lists, snapshots
+
+def write_node(db, channel_lists, snapshots, date=None, fingerprints=None):
+    """
+    fetch_node() の結果を db.node_id のノードの行として書き込む
+    fingerprints を指定した場合は前回から変わっていないチャネルを書き込みに渡し、書き込めたチャネルの指紋を記録する
+    （collection.write_unchanged が false なら、差分形式以外では変わっていないチャネルの行を書き込まない）
+    """
+    unchanged = set()
+    if fingerprints is not None:
+        unchanged = fingerprints.unchanged_channels(db.node_id, snapshots)
+        metrics.increment('channels_unchanged', len(unchanged))
+    rows = snapshots
+    if unchanged and not fingerprints.write_unchanged and db.storage != 'delta':
+        rows = [snapshot for snapshot in snapshots if snapshot[0]['chan_id'] not in unchanged]
+
+    with metrics.phase('db_write'):
+        if channel_lists:  # 空のリスト（取得エラー）の場合はチャネルを削除しないようにスキップ
+            db.update_channel_lists(channel_lists)
+
+        # 1 回分の収集結果を同じ日時で 1 トランザクションにまとめて書き込む
+        result = db.insert_channel_datas(rows, date=date, unchanged=unchanged)
+    metrics.increment('rows_written', result['inserted'])
+    metrics.increment('convert_errors', result['skipped'])
+    if 'error' in result:
+        metrics.increment('db_errors')
+    elif fingerprints is not None:
+        fingerprints.update(db.node_id, snapshots)
+    print(f"[{db.node_id}] {db.storage_table()} に {result['inserted']}件 のサンプルを書き込みました "
+          f"({result['date']}, 取得エラー: {len(channel_lists) - len(snapshots)}件, 変換エラー: {result['skipped']}件, "
+          f"変更なし: {len(unchanged)}件)")
+    return result
+
+def run_retention(db, config, months):
+    """months ヶ月より古いサンプルを、ロールアップへの集約とアーカイブの後にチャンク単位で削除する"""
+    retention = config.get_database_config().get('retention', {})
+    # 削除する生サンプルを先にロールアップへ集約し、アーカイブに書き出しておく
+    update_rollups(db, config)
+    if not archive_old_data(db, config, months):
+        print("アーカイブに失敗したため削除を中止しました。")
+        metrics.increment('archive_errors')
+        return
+    print(f"{months}ヶ月より古いデータを削除しています...")
+    with metrics.phase('retention'):
+        deleted = db.delete_old_data(months,
+                                     chunk_size=retention.get('chunk_size', 5000),
+                                     chunk_seconds=retention.get('chunk_seconds', 0.5),
+                                     pause_seconds=retention.get('pause_seconds', 0.05))
+    metrics.increment('rows_deleted', deleted)
+    print(f"{deleted}件 を削除しました。空き領域を解放しています...")
+    with metrics.phase('reclaim'):
+        db.reclaim_free_pages()
+    print("データ削除が完了しました。")
+
+def collect_once(db, config, fee_cache=None, fingerprints=None):
+    """
+    db.node_id のノードからチャネル一覧とチャネルデータを 1 回分取得してデータベースに書き込む
+    取得は collection.deadline_seconds で打ち切り、それまでに取得できたチャネルを書き込む
+
+    Returns:
+        書き込んだ (channel, channel_data, amboss_fee) のリスト
+    """
+    from src.api import resilience
+    from src.api.collector import get_deadline_seconds
+
+    with resilience.deadline(get_deadline_seconds(config)):
+        channel_lists, snapshots = fetch_node(config, fee_cache, fingerprints)
+    write_node(db, channel_lists, snapshots, fingerprints=fingerprints)
+    if fee_cache is not None:
+        fee_cache.save()
+    if fingerprints is not None:
+        fingerprints.save()
+
+    # 長期保存用のロールアップ (hourly / daily) を差分で更新し、保持期間を過ぎたものを削除
+    update_rollups(db, config)
+    return snapshots
+
+def collect_nodes(db, nodes, config, fee_cache=None, fingerprints=None):
+    """
+    複数のノードから並行して 1 回分取得し、ノードごとにデータベースに書き込む
+
+    LND への問い合わせはノードごとのスレッドで同時に行い（接続プールは接続先ごと）、
+    SQLite への書き込みは取得が終わったノードから順にこのスレッドで行う。
+    すべてのノードの行は同じ日時で記録する。
+    collection.deadline_seconds はすべてのノードで共通の期限とする。
+
+    Args:
+        nodes: Config.get_node_configs() の (node_id, 設定) のリスト
+
+    Returns:
+        {node_id: 書き込んだ (channel, channel_data, amboss_fee) のリスト}（取得に失敗したノードは含まない）
+    """
+    if len(nodes) == 1:
+        node_id, node_config = nodes[0]
+        return {node_id: collect_once(db.for_node(node_id), node_config, fee_cache, fingerprints)}
+
+    from concurrent.futures import ThreadPoolExecutor
+    from src.api import resilience
+    from src.api.collector import get_deadline_seconds
+
+    date = datetime.now().strftime(Database.DATE_FORMAT)
+    results = {}
+    with resilience.deadline(get_deadline_seconds(config)), ThreadPoolExecutor(max_workers=len(nodes)) as executor:
+        futures = [(node_id, executor.submit(fetch_node, node_config, fee_cache, fingerprints)) for node_id, node_config in nodes]
+        for node_id, future in futures:
+            try:
+                channel_lists, snapshots = future.result()
+            except Exception as e:
+                print(f"[{node_id}] データ取得中にエラーが発生しました: {e}")
+                metrics.increment('node_errors')
+                continue
+            write_node(db.for_node(node_id), channel_lists, snapshots, date, fingerprints)
+            results[node_id] = snapshots
+    if fee_cache is not None:
+        fee_cache.save()
+    if fingerprints is not None:
+        fingerprints.save()
+
+    update_rollups(db, config)
+    return results
+
+def run_daemon(db, nodes, config, fee_cache=None, fingerprints=None):
+    """
+    常駐して daemon.interval_seconds ごとに collect_nodes() を実行する
+    データベース接続と LND への HTTP セッションはサイクル間で使い回し、停止時に閉じる
+    """
+    from src.api.lightning_client import close_clients
+    from src.utils.scheduler import Scheduler
+
+    daemon = config.get('daemon', {})
+    scheduler = Scheduler(daemon.get('interval_seconds', 600), daemon.get('jitter_seconds', 30))
+    scheduler.install_signal_handlers()
+    print(f"デーモンモードで起動しました (間隔: {scheduler.interval_seconds}秒, ゆらぎ: 最大 {scheduler.jitter_seconds}秒)")
+    try:
+        cycles = scheduler.run(lambda: record_run(db, config, 'collect',
+                                                  lambda: collect_nodes(db, nodes, config, fee_cache,
+                                                                        fingerprints)))
+    finally:
+        if fee_cache is not None:
+            fee_cache.save()
+        if fingerprints is not None:
+            fingerprints.save()
+        close_clients()
+        db.close()
+    print(f"デーモンモードを終了しました ({cycles}サイクル)")
+
+def run_events(db, config, fee_cache=None, fingerprints=None):
+    """
+    LND のストリーミング API を購読し、イベントが届いたチャネルの行だけを書き込む
+    events.reconcile_seconds ごとに collect_once() で全件を取得して取りこぼしを補う
+    db と config は 1 ノード分（db.for_node() と Config.get_node_configs() の設定）
+    """
+    from src.api.events import EventCapture
+    from src.api.lightning_client import close_clients
+    from src.utils.scheduler import install_stop_signal_handlers
+
+    reconcile = lambda: record_run(db, config, 'reconcile',
+                                   lambda: collect_once(db, config, fee_cache, fingerprints))
+    capture = EventCapture.from_config(db, config, reconcile, fee_cache)
+    install_stop_signal_handlers(capture.stop)
+    print(f"イベント駆動モードで起動しました (全件取得の間隔: {capture.reconcile_seconds}秒)")
+    try:
+        capture.run()
+    finally:
+        if fee_cache is not None:
+            fee_cache.save()
+        if fingerprints is not None:
+            fingerprints.save()
+        close_clients()
+        db.close()
+    print("イベント駆動モードを終了しました")
+
+def main(delete_old_data=None, update_add_active=False, update_channel=False, migrate_compact=False,
+         migrate_delta=False, daemon=False, events=False, export=None, export_start=None, export_end=None,
+         export_format='auto', migrate_partitions=False, node=None, config_file=None,
+         enable_incremental_vacuum=False, dedupe_channel_datas=False, dry_run=False, migrate_node_scope=False,
+         node_id=None):
+    # リソースパスとexe環境かどうかを取得（config_file を指定した場合はそのファイルを使う）
     config_path, is_exe = resource_path('config.yaml')
+    if config_file:
+        config_path = config_file
     
-    if is_exe:
+    if is_exe and not config_file:
         # exe環境では複数のパスを試す
         print(f"設定ファイルのパス (exe環境): {config_path}")
         if not os.path.exists(config_path):
@@ -49,6 +318,18 @@ def main(delete_old_data=None, update_add_active=False, update_channel=False):
     # ConfigクラスはPath(__file__).parent.parent.parentを使用しているので、
     # 明示的にパスを渡すとよい
     config = Config(config_file=config_path)
+
+    # 収集対象のノード (nodes、無い場合は lightning の 1 ノード)
+    try:
+        nodes = config.get_node_configs()
+    except ValueError as e:
+        print(f"設定ファイルのエラー: {e}")
+        return
+    if node is not None:
+        nodes = [(node_id, node_config) for node_id, node_config in nodes if node_id == node]
+        if not nodes:
+            print(f"ノード {node} が設定ファイルにありません。")
+            return
     
     # データベースパスの確認（exe環境の場合のみ）
     db_path = config.get_database_config().get('path')
@@ -58,27 +339,118 @@ def main(delete_old_data=None, update_add_active=False, update_channel=False):
             print(f"データディレクトリを作成: {db_dir}")
             os.makedirs(db_dir, exist_ok=True)
     
-    db = Database(db_path)
+    # database.storage: legacy (channel_datas) / compact (channel_samples) / delta (channel_intervals)
+    if migrate_compact:
+        storage = 'compact'
+    elif migrate_delta:
+        storage = 'delta'
+    else:
+        storage = config.get_database_config().get('storage', 'legacy')
+    # database.partitioning: none / monthly (サンプルを月ごとのファイルに保存する)
+    # 形式の移行は db_path のテーブル同士で行うため分割しない
+    if migrate_partitions:
+        partitioning = 'monthly'
+    elif migrate_compact or migrate_delta:
+        partitioning = 'none'
+    else:
+        partitioning = config.get_database_config().get('partitioning', 'none')
+    # database.channel_log_dir: チャネルの変更ログ (channel_changes.log) のディレクトリ（空の場合は書き込まない、
+    # 相対パスはデータベースファイルのディレクトリが基準）
+    db = Database(db_path, storage=storage, pragmas=config.get_database_config().get('pragmas'),
+                  partitioning=partitioning, node_id=nodes[0][0],
+                  log_dir=config.get_database_config().get('channel_log_dir', 'logs'))
     
+    # ノード ID の無い既存のデータベースの行を node_id のノードの行として移行して終了
+    # （テーブル全体を作り直すため、明示的に指定した場合のみ）
+    if migrate_node_scope:
+        if node_id not in [configured for configured, _ in nodes]:
+            print("--migrate_node_scope には既存の行のノードを --node_id で指定してください（config.yaml のノード）。")
+            return
+        if not db.connect():
+            return
+        print(f"既存の行をノード {node_id} の行としてノード別のテーブルに移行しています...")
+        migrated = db.for_node(node_id).migrate_to_node_scope()
+        remaining = db.unmigrated_node_tables()
+        db.close()
+        if remaining:
+            print(f"移行できなかったテーブルがあります: {', '.join(remaining)}")
+        else:
+            print(f"{migrated}件 のテーブルの移行が完了しました。")
+        return
+
     # Initialize database and create tables
     # update_channel フラグを渡す
-    db.initialize(update_channel=update_channel)
+    # ノード別にする前のデータベースは書き込まずに終了する（--migrate_node_scope で移行する）
+    if not db.initialize(update_channel=update_channel):
+        db.close()
+        return
+    db.report_pragmas()
+    # 頻繁に実行されるクエリがインデックスを使っているか確認（問題があれば警告を表示）
+    db.check_query_plans()
 
     # delete_old_data が指定されている場合は削除処理のみ実行
     if delete_old_data:
-        print(f"{delete_old_data}ヶ月より古いデータを削除しています...")
-        db.delete_old_data(delete_old_data)
-        print("データベースを最適化しています...")
-        db.vacuum()
-        print("データ削除が完了しました。")
+        # チャンク単位で削除・コミットするため、収集処理と並行して実行できる
+        record_run(db, config, 'retention', lambda: run_retention(db, config, delete_old_data))
+        return
+
+    # auto_vacuum を INCREMENTAL に変換して終了（データベース全体を再構築するため、明示的に指定した場合のみ）
+    if enable_incremental_vacuum:
+        if db.enable_incremental_vacuum():
+            print("auto_vacuum を INCREMENTAL に変更しました。以降の --delete で空きページを解放します。")
+        return
+
+    # 同じノード・チャネル・日時の channel_datas の重複した行を削除して終了（件数を表示してから削除、dry_run は表示のみ）
+    if dedupe_channel_datas:
+        removed = db.remove_duplicate_channel_datas(dry_run=dry_run)
+        if dry_run:
+            print(f"重複した行は {removed}件 です（--dry_run のため削除していません）。")
+        else:
+            print(f"重複した行を合計 {removed}件 削除しました。")
+        return
+
+    # 指定した期間の履歴を Parquet / CSV に書き出して終了（同じディレクトリで再実行すると続きから再開）
+    if export:
+        from src.db.export import export_history
+        print(f"{export} へ履歴を書き出しています...")
+        try:
+            result = export_history(db, export, start=export_start, end=export_end, fmt=export_format)
+        except (ImportError, OSError, ValueError) as e:
+            print(f"履歴の書き出し中にエラーが発生しました: {e}")
+            return
+        print(f"{result['rows']}件 を {result['format']} で書き出しました (ファイル: {len(result['files'])}件, "
+              f"最後の日時: {result['last_date']})")
         return
 
     # update_channel モードの場合はメッセージを表示
     if update_channel:
         print("channel_lists テーブルを更新し、channel_point カラムを追加しました。")
+        from src.api.lightning_client import get_channel_lists
         # channel_listsを取得してデータベースにアップデートして終了
-        channel_lists = get_channel_lists(config)
-        db.update_channel_lists(channel_lists)
+        for node_id, node_config in nodes:
+            channel_lists = get_channel_lists(node_config)
+            db.for_node(node_id).update_channel_lists(channel_lists)
+        return
+
+    # channel_datas のサンプルをコンパクト形式 (channel_samples) に移行して終了
+    if migrate_compact:
+        print("channel_datas を channel_samples (コンパクト形式) に移行しています...")
+        migrated = db.migrate_to_compact()
+        print(f"{migrated}件 の移行が完了しました。config.yaml の database.storage を compact に設定してください。")
+        return
+
+    # channel_datas のサンプルを差分形式 (channel_intervals) に移行して終了
+    if migrate_delta:
+        print("channel_datas を channel_intervals (差分形式) に移行しています...")
+        migrated = db.migrate_to_delta()
+        print(f"{migrated}件 の移行が完了しました。config.yaml の database.storage を delta に設定してください。")
+        return
+
+    # db_path のサンプルを月ごとのファイルに移行して終了
+    if migrate_partitions:
+        print("サンプルを月ごとのファイルに移行しています...")
+        migrated = db.migrate_to_partitions()
+        print(f"{migrated}件 の移行が完了しました。config.yaml の database.partitioning を monthly に設定してください。")
         return
 
     # アップデートモードの場合、channel_datasテーブルに'active'カラムを追加して終了
@@ -89,33 +461,62 @@ def main(delete_old_data=None, update_add_active=False, update_channel=False):
         return
 
     # 通常モード: データ取得と更新
-    
-    # Retrieve channel lists and update database
-    # Config オブジェクトを渡す
-    channel_lists = get_channel_lists(config)
-    if channel_lists:  # 空のリストの場合はスキップ
-        db.update_channel_lists(channel_lists)
-
-    # Retrieve channel data and update database
-    for channel in channel_lists:
-        channel_data = get_channel_data(channel['chan_id'], config)
-        # エラーチェック
-        if channel_data.get("error"):
-            print(f"チャンネル {channel['chan_id']} のデータ取得中にエラーが発生しました: {channel_data.get('message')}")
-            continue
-        
-        amboss_fee = get_amboss_fee(channel['remote_pubkey'], config)
-        db.update_channel_data(channel, channel_data, amboss_fee)
+    # Amboss 手数料は pubkey ごとにキャッシュし、期限切れ・未取得のノードだけ API を呼ぶ
+    from src.api.fee_cache import AmbossFeeCache
+    fee_cache = AmbossFeeCache.from_config(config, db)
+    # チャネルの指紋 (num_updates・ポリシーの last_update) は起動時にすべて読み込み、変わっていないチャネルを判定する
+    from src.api.fingerprint_cache import ChannelFingerprintCache
+    fingerprints = ChannelFingerprintCache.from_config(config, db)
+
+    # イベント駆動モードではストリーミング API の購読でチャネルの変化を記録する
+    if events:
+        if len(nodes) != 1:
+            print("イベント駆動モードは 1 ノードずつ実行してください (--node で指定)。")
+            return
+        node_id, node_config = nodes[0]
+        run_events(db.for_node(node_id), node_config, fee_cache, fingerprints)
+        return
+
+    # デーモンモードでは常駐して定期的に収集する
+    if daemon:
+        run_daemon(db, nodes, config, fee_cache, fingerprints)
+        return
+
+    record_run(db, config, 'collect', lambda: collect_nodes(db, nodes, config, fee_cache, fingerprints))
 
     # Optionally delete old data
     if delete_old_data:
         db.delete_old_data(delete_old_data)
 
 if __name__ == "__main__":
+    import argparse
+
     parser = argparse.ArgumentParser(description="Lightning Node Database Management")
     parser.add_argument('--delete', type=int, help="Delete data older than x months")
     parser.add_argument('--update_add_active', action='store_true', help="Update database schema only (add 'active' column to channel_datas)")
     parser.add_argument('--update_channel', action='store_true', help="Update channel_lists table structure to add channel_point column")
+    parser.add_argument('--migrate_compact', action='store_true', help="Copy channel_datas into the compact channel_samples table")
+    parser.add_argument('--migrate_delta', action='store_true', help="Copy channel_datas into the change-only channel_intervals table")
+    parser.add_argument('--migrate_partitions', action='store_true', help="Copy samples into per-month database files (database.partitioning: monthly)")
+    parser.add_argument('--enable_incremental_vacuum', action='store_true', help="Rebuild the database once with auto_vacuum=INCREMENTAL so --delete can reclaim free pages")
+    parser.add_argument('--dedupe_channel_datas', action='store_true', help="Report and delete duplicate channel_datas rows (same node, channel and date), keeping the last written")
+    parser.add_argument('--dry_run', action='store_true', help="With --dedupe_channel_datas, only report the rows that would be deleted")
+    parser.add_argument('--migrate_node_scope', '--migrate-node-scope', action='store_true', help="Add node_id to the tables of a database created before multi-node support (requires --node_id)")
+    parser.add_argument('--node_id', '--node-id', metavar='NODE_ID', help="With --migrate_node_scope, the node that existing rows belong to")
+    parser.add_argument('--daemon', action='store_true', help="Stay resident and collect every daemon.interval_seconds")
+    parser.add_argument('--events', action='store_true', help="Stay resident and record channels when LND streams an event for them")
+    parser.add_argument('--export', metavar='DIR', help="Export history to Parquet/CSV part files in DIR (resumes from DIR/export_cursor.json)")
+    parser.add_argument('--export_start', help="Export samples at or after this date ('YYYY-MM-DD HH:MM')")
+    parser.add_argument('--export_end', help="Export samples before this date ('YYYY-MM-DD HH:MM')")
+    parser.add_argument('--export_format', choices=['auto', 'parquet', 'csv'], default='auto', help="auto: Parquet if pyarrow is installed, otherwise CSV")
+    parser.add_argument('--node', metavar='NODE_ID', help="Collect only from this node (node_id in config.yaml nodes)")
+    parser.add_argument('--config', metavar='PATH', help="Use this config.yaml instead of the one next to the program")
     args = parser.parse_args()
 
-    main(delete_old_data=args.delete, update_add_active=args.update_add_active, update_channel=args.update_channel)
\ No newline at end of file
+    main(delete_old_data=args.delete, update_add_active=args.update_add_active, update_channel=args.update_channel,
+         migrate_compact=args.migrate_compact, migrate_delta=args.migrate_delta, daemon=args.daemon,
+         events=args.events, export=args.export, export_start=args.export_start, export_end=args.export_end,
+         export_format=args.export_format, migrate_partitions=args.migrate_partitions, node=args.node,
+         config_file=args.config, enable_incremental_vacuum=args.enable_incremental_vacuum,
+         dedupe_channel_datas=args.dedupe_channel_datas, dry_run=args.dry_run,
+         migrate_node_scope=args.migrate_node_scope, node_id=args.node_id)
\ No newline at end of file
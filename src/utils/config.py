@@ -1,9 +1,40 @@
+import json
 import os
-import yaml
+import sys
+import zlib
 from pathlib import Path
 
+# lightning.node_id が無い場合のノード ID（Database.DEFAULT_NODE_ID と同じ値）
+DEFAULT_NODE_ID = 'default'
+
+# 解析済みの設定を保存するファイルの接尾辞（cache_dir() に config-<パスのハッシュ>.yaml.cache.json を作成する）
+CACHE_SUFFIX = '.cache.json'
+# 設定のキャッシュを保存するディレクトリを指定する環境変数（ベンチマーク・テスト用）
+CACHE_DIR_ENV = 'LIGHTNING_NODE_DB_CACHE_DIR'
+
+
+def cache_dir():
+    """
+    設定のキャッシュを保存するユーザーごとのディレクトリ
+    PyInstaller の onefile の実行ファイルでは config.yaml が実行ごとに一時ディレクトリ (_MEIPASS) に展開されるため、
+    config.yaml の隣ではなく Windows は %LOCALAPPDATA%、それ以外は $XDG_CACHE_HOME (~/.cache) の下に保存する
+    """
+    if os.environ.get(CACHE_DIR_ENV):
+        return os.environ[CACHE_DIR_ENV]
+    base = os.environ.get('LOCALAPPDATA') if os.name == 'nt' else os.environ.get('XDG_CACHE_HOME')
+    return os.path.join(base or os.path.join(os.path.expanduser('~'), '.cache'), 'lightning-node-db')
+
+
 class Config:
-    def __init__(self, config_file=None):
+    """
+    config.yaml の設定
+
+    解析した設定はユーザーごとのキャッシュディレクトリ (cache_dir()) に保存し、config.yaml の内容のハッシュが
+    変わっていなければ次回の起動時は yaml を解析せずにそちらを使う（起動時間の短縮）。
+    実行ファイルでは展開のたびに config.yaml の更新日時が変わるため、更新日時ではなく内容で比較する。
+    """
+
+    def __init__(self, config_file=None, use_cache=True):
         # デフォルトのconfig.yamlの場所を指定
         if config_file is None:
             # プロジェクトのルートディレクトリを基準にした設定ファイルのパス
@@ -11,6 +42,7 @@ class Config:
             config_file = os.path.join(project_root, 'config.yaml')
         
         self.config_file = config_file
+        self.use_cache = use_cache
         self.settings = self.load_config()
     
     def load_config(self):
@@ -18,13 +50,74 @@ class Config:
             # ファイルが見つからない場合はデフォルト設定を返す
             print(f"警告: 設定ファイル '{self.config_file}' が見つかりません。デフォルト設定を使用します。")
             return self._get_default_config()
+
+        try:
+            with open(self.config_file, 'rb') as file:
+                data = file.read()
+        except OSError as e:
+            print(f"設定ファイルの読み込みエラー: {e}")
+            return self._get_default_config()
+
+        # hashlib のインポートは起動時間に響くため、内容の比較には CRC32 とサイズを使う
+        digest = f"{zlib.crc32(data):08x}-{len(data)}"
+        if self.use_cache:
+            settings = self._load_cache(digest)
+            if settings is not None:
+                return settings
         
         try:
-            with open(self.config_file, 'r', encoding='utf-8') as file:
-                return yaml.safe_load(file)
+            # yaml の読み込みには時間がかかるため、キャッシュが使えない場合だけインポートする
+            import yaml
+            loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+            settings = yaml.load(data.decode('utf-8'), Loader=loader)
         except Exception as e:
             print(f"設定ファイルの読み込みエラー: {e}")
             return self._get_default_config()
+
+        if self.use_cache:
+            self._save_cache(digest, settings)
+        return settings
+
+    @property
+    def cache_file(self):
+        """
+        キャッシュのファイル（config.yaml のパスごと。実行ファイルに同梱した config.yaml は展開先が毎回変わるため 1 つにまとめる）
+        """
+        path = os.path.abspath(self.config_file)
+        base, ext = os.path.splitext(os.path.basename(path))
+        bundle = getattr(sys, '_MEIPASS', None)
+        if bundle and os.path.dirname(path) == os.path.abspath(bundle):
+            key = 'bundled'
+        else:
+            key = f"{zlib.crc32(path.encode('utf-8')):08x}"
+        return os.path.join(cache_dir(), f"{base}-{key}{ext}{CACHE_SUFFIX}")
+
+    def _load_cache(self, digest):
+        """config.yaml の内容が保存時から変わっていなければキャッシュした設定を返す（使えない場合は None）"""
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as file:
+                cache = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(cache, dict) or cache.get('digest') != digest:
+            return None
+        return cache.get('settings')
+
+    def _save_cache(self, digest, settings):
+        """
+        解析した設定をキャッシュに保存する
+        JSON で同じ値に戻せない設定（日付や数値のキーなど）と、書き込めない場合は保存しない
+        """
+        try:
+            if json.loads(json.dumps(settings)) != settings:
+                return
+            os.makedirs(cache_dir(), exist_ok=True)
+            tmp_file = self.cache_file + '.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as file:
+                json.dump({'digest': digest, 'settings': settings}, file, ensure_ascii=False)
+            os.replace(tmp_file, self.cache_file)
+        except (OSError, TypeError, ValueError):
+            pass
     
     def _get_default_config(self):
         """デフォルトの設定値を返す"""
@@ -42,4 +135,26 @@ class Config:
         return self.get('database', {})
 
     def get_retention_period(self):
-        return self.get('retention_period', 3)  # Default to 3 months if not specified
\ No newline at end of file
+        return self.get('retention_period', 3)  # Default to 3 months if not specified
+
+    def get_node_configs(self):
+        """
+        収集対象のノードごとの (node_id, 設定) のリストを返す
+        nodes が設定されている場合は lightning の値をデフォルトとして各ノードの値で上書きし、
+        無い場合は lightning の 1 ノードだけを返す。設定は lightning 以外の項目も含む辞書で、
+        Config と同じように get_client() などに渡せる。
+
+        Raises:
+            ValueError: node_id が重複している場合
+        """
+        lightning = self.get('lightning', {}) or {}
+        nodes = self.get('nodes') or [lightning]
+        result = []
+        for node in nodes:
+            merged = dict(lightning, **node)
+            node_id = str(merged.get('node_id') or DEFAULT_NODE_ID)
+            if node_id in (existing for existing, _ in result):
+                raise ValueError(f"Duplicate node_id in config: {node_id}")
+            merged['node_id'] = node_id
+            result.append((node_id, dict(self.settings, lightning=merged)))
+        return result
@@ -0,0 +1,215 @@
+# 1 回の実行（収集・削除など）ごとのフェーズの所要時間・HTTP のレイテンシ・行数とエラー数を集計する
+# 実行中の RunMetrics はプロセスで 1 つだけ有効にし、ワーカースレッドからもモジュールの関数で記録する
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# HTTP のレイテンシのヒストグラムの上限 (秒)
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Prometheus のメトリクス名の接頭辞
+PROMETHEUS_PREFIX = 'lnddb'
+
+
+class RunMetrics:
+    """
+    1 回の実行のメトリクス
+
+    フェーズの所要時間は同じ名前の区間の合計（複数ノードを並行して収集した場合はノードの合計）。
+    記録用のメソッドはワーカースレッドから呼び出してよい。
+    """
+
+    def __init__(self, mode='collect', clock=time.perf_counter):
+        self.mode = mode
+        self.started_at = datetime.now()
+        self.finished_at = None
+        self.status = 'running'
+        self.error = None
+        self._clock = clock
+        self._started = clock()
+        self.duration_seconds = None
+        self.phases = {}
+        self.counters = {}
+        self.http = {}
+        self.skipped = {}
+        self._lock = threading.Lock()
+
+    def add_phase(self, name, seconds):
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record_skip(self, node_id, channel_id):
+        """実行期限を過ぎたため取得しなかったチャネルを記録する"""
+        with self._lock:
+            self.skipped.setdefault(node_id, []).append(channel_id)
+            self.counters['channels_skipped'] = self.counters.get('channels_skipped', 0) + 1
+
+    def observe_http(self, endpoint, seconds, error=False):
+        """endpoint への 1 リクエストの所要時間を記録する（error はタイムアウト・接続エラー・HTTP エラー）"""
+        with self._lock:
+            stats = self.http.get(endpoint)
+            if stats is None:
+                stats = self.http[endpoint] = {'buckets': [0] * len(HTTP_BUCKETS), 'count': 0, 'sum': 0.0,
+                                               'errors': 0}
+            for i, bound in enumerate(HTTP_BUCKETS):
+                if seconds <= bound:
+                    stats['buckets'][i] += 1
+            stats['count'] += 1
+            stats['sum'] += seconds
+            if error:
+                stats['errors'] += 1
+
+    @property
+    def errors(self):
+        """エラーの件数の合計（*_errors のカウンターと HTTP のエラー）"""
+        with self._lock:
+            return (sum(value for name, value in self.counters.items() if name.endswith('_errors'))
+                    + sum(stats['errors'] for stats in self.http.values()))
+
+    def finish(self, status='ok', error=None):
+        """実行の終了を記録する（status: ok / error）"""
+        self.finished_at = datetime.now()
+        self.duration_seconds = self._clock() - self._started
+        self.status = status
+        self.error = error
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'mode': self.mode,
+                'started_at': self.started_at.strftime('%Y-%m-%d %H:%M:%S'),
+                'finished_at': self.finished_at.strftime('%Y-%m-%d %H:%M:%S') if self.finished_at else None,
+                'duration_seconds': self.duration_seconds,
+                'status': self.status,
+                'error': self.error,
+                'phases': dict(self.phases),
+                'counters': dict(self.counters),
+                'http': {endpoint: {'buckets': dict(zip(HTTP_BUCKETS, stats['buckets'])), 'count': stats['count'],
+                                    'sum': stats['sum'], 'errors': stats['errors']}
+                         for endpoint, stats in self.http.items()},
+                'skipped_channels': {node_id: list(channel_ids) for node_id, channel_ids in self.skipped.items()},
+            }
+
+    def to_prometheus(self, prefix=PROMETHEUS_PREFIX):
+        """
+        node_exporter の textfile collector 用のテキスト形式で返す
+        値はすべて最後の実行のもの（mode ラベルで実行の種類を区別する）
+        """
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{_label(label_value)}"'
+                                      for key, label_value in (('mode', self.mode),) + labels)
+                lines.append(f"{prefix}_{name}{{{label_text}}} {_number(value)}")
+
+        with self._lock:
+            finished = (self.finished_at or datetime.now()).timestamp()
+            metric('run_last_timestamp_seconds', 'gauge', "Unix time the last run finished.", [((), finished)])
+            metric('run_duration_seconds', 'gauge', "Wall time of the last run.",
+                   [((), self.duration_seconds or 0.0)])
+            metric('run_success', 'gauge', "1 if the last run finished without an exception.",
+                   [((), 1 if self.status == 'ok' else 0)])
+            metric('phase_duration_seconds', 'gauge', "Time spent in each phase of the last run.",
+                   [((('phase', name),), seconds) for name, seconds in sorted(self.phases.items())])
+            metric('run_count', 'gauge', "Rows, channels and errors counted in the last run.",
+                   [((('name', name),), value) for name, value in sorted(self.counters.items())])
+
+            name = f"{prefix}_http_request_duration_seconds"
+            lines.append(f"# HELP {name} Latency of HTTP requests in the last run.")
+            lines.append(f"# TYPE {name} histogram")
+            for endpoint, stats in sorted(self.http.items()):
+                labels = f'mode="{_label(self.mode)}",endpoint="{_label(endpoint)}"'
+                for bound, count in zip(HTTP_BUCKETS, stats['buckets']):
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {stats["count"]}')
+                lines.append(f"{name}_sum{{{labels}}} {_number(stats['sum'])}")
+                lines.append(f"{name}_count{{{labels}}} {stats['count']}")
+            metric('http_request_errors', 'gauge', "Failed HTTP requests in the last run.",
+                   [((('endpoint', endpoint),), stats['errors']) for endpoint, stats in sorted(self.http.items())])
+        return '\n'.join(lines) + '\n'
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def write_textfile(run, path, prefix=PROMETHEUS_PREFIX):
+    """
+    run を Prometheus のテキストファイルに書き出す
+    node_exporter が書きかけのファイルを読まないように、一時ファイルから置き換える
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        f.write(run.to_prometheus(prefix))
+    os.replace(path + '.tmp', path)
+
+
+# 実行中の RunMetrics（無い場合は記録しない）
+_active = None
+_active_lock = threading.Lock()
+
+
+def start_run(mode='collect'):
+    """新しい実行を開始し、以降の記録先にする"""
+    global _active
+    run = RunMetrics(mode)
+    with _active_lock:
+        _active = run
+    return run
+
+
+def end_run(run):
+    """run が実行中であれば記録先から外す"""
+    global _active
+    with _active_lock:
+        if _active is run:
+            _active = None
+
+
+def current():
+    """実行中の RunMetrics を返す（無い場合は None）"""
+    return _active
+
+
+@contextmanager
+def phase(name):
+    """with ブロックの所要時間を実行中の RunMetrics のフェーズ name に加える"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        run = _active
+        if run is not None:
+            run.add_phase(name, time.perf_counter() - started)
+
+
+def increment(name, value=1):
+    run = _active
+    if run is not None:
+        run.increment(name, value)
+
+
+def observe_http(endpoint, seconds, error=False):
+    run = _active
+    if run is not None:
+        run.observe_http(endpoint, seconds, error)
+
+
+def record_skip(node_id, channel_id):
+    run = _active
+    if run is not None:
+        run.record_skip(node_id, channel_id)
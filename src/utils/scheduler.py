@@ -0,0 +1,80 @@
+import random
+import signal
+import threading
+import time
+
+
+def install_stop_signal_handlers(stop):
+    """SIGINT / SIGTERM (Windows では SIGBREAK も) を受け取ったら stop() を呼ぶようにする（メインスレッドから呼ぶこと）"""
+    def handler(signum, frame):
+        print(f"シグナル {signal.Signals(signum).name} を受信しました。現在の処理が終わり次第停止します。")
+        stop()
+
+    for name in ('SIGINT', 'SIGTERM', 'SIGBREAK'):
+        signum = getattr(signal, name, None)
+        if signum is not None:
+            signal.signal(signum, handler)
+
+
+class Scheduler:
+    """
+    一定間隔（＋ランダムなゆらぎ）でジョブを繰り返し実行する常駐用スケジューラ
+
+    ジョブは同じスレッドで順番に実行するため、前のサイクルが終わるまで次のサイクルは始まらない。
+    ジョブが間隔より長くかかった場合は、遅れを取り戻そうとせずにすぐ次のサイクルを 1 回だけ始める。
+    stop() が呼ばれると、実行中のサイクルが終わった時点でループを抜ける。
+    """
+
+    def __init__(self, interval_seconds, jitter_seconds=0, clock=time.monotonic, jitter_fn=random.uniform):
+        if interval_seconds <= 0:
+            raise ValueError(f"interval_seconds must be positive: {interval_seconds}")
+        self.interval_seconds = interval_seconds
+        self.jitter_seconds = max(0, jitter_seconds)
+        self._clock = clock
+        self._jitter_fn = jitter_fn
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        """実行中のサイクルが終わった後に停止する"""
+        self._stop_event.set()
+
+    @property
+    def stopped(self):
+        return self._stop_event.is_set()
+
+    def install_signal_handlers(self):
+        """SIGINT / SIGTERM (Windows では SIGBREAK も) を受け取ったら停止するようにする（メインスレッドから呼ぶこと）"""
+        install_stop_signal_handlers(self.stop)
+
+    def next_delay(self, elapsed):
+        """ジョブの処理時間 elapsed から、次のサイクルまでの待ち時間を返す"""
+        jitter = self._jitter_fn(0, self.jitter_seconds) if self.jitter_seconds else 0
+        return max(0, self.interval_seconds - elapsed) + jitter
+
+    def run(self, job, max_cycles=None):
+        """
+        stop() が呼ばれるまで（または max_cycles 回）job を実行する
+        job の例外はメッセージを表示して次のサイクルに進む
+
+        Returns:
+            実行したサイクル数
+        """
+        cycles = 0
+        while not self.stopped:
+            started = self._clock()
+            cycles += 1
+            try:
+                job()
+            except Exception as e:
+                print(f"サイクル {cycles} でエラーが発生しました: {e}")
+            elapsed = self._clock() - started
+            print(f"サイクル {cycles} が完了しました ({elapsed:.2f}秒)")
+
+            if max_cycles is not None and cycles >= max_cycles:
+                break
+            delay = self.next_delay(elapsed)
+            if elapsed > self.interval_seconds:
+                print(f"警告: サイクルの処理時間 ({elapsed:.2f}秒) が実行間隔 ({self.interval_seconds}秒) を超えています")
+            # Event.wait はシグナルや stop() で待機を中断できる
+            self._stop_event.wait(delay)
+        return cycles
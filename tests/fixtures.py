@@ -0,0 +1,54 @@
+"""
+テストで使う LND の応答と同じ形のチャネル情報・エッジ情報
+
+/v1/channels と /v1/graph/edge は int64 / uint64 の値を文字列で、int32 / uint32 の値
+（inbound_fee_rate_milli_msat・last_update）を数値で返す。src.api.decode はこの形の辞書をそのまま返す。
+"""
+
+TXID = 'ab' * 31 + 'cd'
+
+LAST_UPDATE = 1700000000
+
+
+def make_channel(chan_id='1', remote_pubkey=None, local_balance=600000, remote_balance=400000, num_updates=42,
+                 active=True):
+    """/v1/channels の 1 チャネル（remote_pubkey の既定は f'remote{chan_id}'、channel_point は f'{TXID}:{chan_id}'）"""
+    return {
+        'chan_id': chan_id,
+        'remote_pubkey': remote_pubkey or f'remote{chan_id}',
+        'channel_point': f'{TXID}:{chan_id}',
+        'peer_alias': f'peer{chan_id}',
+        'capacity': str(local_balance + remote_balance),
+        'local_balance': str(local_balance),
+        'remote_balance': str(remote_balance),
+        'num_updates': str(num_updates),
+        'active': active,
+    }
+
+
+def make_edge(chan_id='1', remote_pubkey=None, local_fee=100, remote_fee=200, remote_infee=-10,
+              last_update=LAST_UPDATE, remote_is_node1=True):
+    """
+    /v1/graph/edge の 1 エッジ（ローカルの pubkey は 'local'）
+    last_update はローカルのポリシーの値（リモートのポリシーは LAST_UPDATE）
+    """
+    remote = (remote_pubkey or f'remote{chan_id}', {'fee_rate_milli_msat': str(remote_fee),
+                                                    'inbound_fee_rate_milli_msat': remote_infee,
+                                                    'last_update': LAST_UPDATE})
+    local = ('local', {'fee_rate_milli_msat': str(local_fee), 'inbound_fee_rate_milli_msat': 0,
+                       'last_update': last_update})
+    (node1_pub, node1_policy), (node2_pub, node2_policy) = (remote, local) if remote_is_node1 else (local, remote)
+    return {
+        'channel_id': chan_id,
+        'chan_point': f'{TXID}:{chan_id}',
+        'node1_pub': node1_pub,
+        'node2_pub': node2_pub,
+        'capacity': '1000000',
+        'node1_policy': node1_policy,
+        'node2_policy': node2_policy,
+    }
+
+
+def make_snapshot(chan_id='1', local_fee=100, remote_fee=200, amboss_fee=1500):
+    """収集結果の (channel, channel_data, amboss_fee)"""
+    return make_channel(chan_id), make_edge(chan_id, local_fee=local_fee, remote_fee=remote_fee), amboss_fee
@@ -0,0 +1,98 @@
+import unittest
+from unittest.mock import patch
+
+from src.api.collector import collect_channel_snapshots, get_concurrency, get_edge_source
+
+
+CHANNELS = [
+    {'chan_id': '1', 'remote_pubkey': 'pub1'},
+    {'chan_id': '2', 'remote_pubkey': 'pub2'},
+    {'chan_id': '3', 'remote_pubkey': 'pub3'},
+]
+
+
+def fake_channel_data(channel_id, config=None):
+    if channel_id == '2':
+        return {"error": True, "message": "not found"}
+    return {'channel_id': channel_id}
+
+
+def fake_amboss_fee(remote_pubkey, config=None, fee_cache=None):
+    return int(remote_pubkey[-1]) * 100
+
+
+def fake_amboss_fees(remote_pubkeys, config=None, fee_cache=None, batch_size=None):
+    return {pubkey: fake_amboss_fee(pubkey) for pubkey in remote_pubkeys}
+
+
+# Amboss をチャネルごとに問い合わせる設定
+PER_CHANNEL = {'amboss': {'batch_size': 1}}
+
+
+class TestCollector(unittest.TestCase):
+
+    @patch('src.api.collector.get_amboss_fee', side_effect=fake_amboss_fee)
+    @patch('src.api.collector.get_channel_data', side_effect=fake_channel_data)
+    def test_sequential_skips_errors(self, mock_get_channel_data, mock_get_amboss_fee):
+        results = list(collect_channel_snapshots(CHANNELS, PER_CHANNEL, concurrency=1))
+
+        self.assertEqual([r[0]['chan_id'] for r in results], ['1', '3'])
+        self.assertEqual([r[2] for r in results], [100, 300])
+        # エラーのチャネルでは Amboss を呼ばない
+        self.assertEqual(mock_get_amboss_fee.call_count, 2)
+
+    @patch('src.api.collector.get_amboss_fee', side_effect=fake_amboss_fee)
+    @patch('src.api.collector.get_channel_data', side_effect=fake_channel_data)
+    def test_concurrent_keeps_order(self, mock_get_channel_data, mock_get_amboss_fee):
+        channels = [{'chan_id': str(i), 'remote_pubkey': f'pub{i % 10}'} for i in range(50)]
+        results = list(collect_channel_snapshots(channels, PER_CHANNEL, concurrency=8))
+
+        expected = [c['chan_id'] for c in channels if c['chan_id'] != '2']
+        self.assertEqual([r[0]['chan_id'] for r in results], expected)
+        for channel, channel_data, amboss_fee in results:
+            self.assertEqual(channel_data['channel_id'], channel['chan_id'])
+            self.assertEqual(amboss_fee, fake_amboss_fee(channel['remote_pubkey']))
+
+    @patch('src.api.collector.get_amboss_fees', side_effect=fake_amboss_fees)
+    @patch('src.api.collector.get_channel_data', side_effect=fake_channel_data)
+    def test_batched_fees(self, mock_get_channel_data, mock_get_amboss_fees):
+        channels = [{'chan_id': str(i), 'remote_pubkey': f'pub{i % 3}'} for i in range(10)]
+        results = list(collect_channel_snapshots(channels, {'amboss': {'batch_size': 5}}, concurrency=4))
+
+        self.assertEqual([r[0]['chan_id'] for r in results], [c['chan_id'] for c in channels if c['chan_id'] != '2'])
+        for channel, channel_data, amboss_fee in results:
+            self.assertEqual(amboss_fee, fake_amboss_fee(channel['remote_pubkey']))
+        # エラーのチャネルを除いた pubkey で 1 回だけ呼び出す
+        mock_get_amboss_fees.assert_called_once()
+        self.assertEqual(len(mock_get_amboss_fees.call_args[0][0]), 9)
+        self.assertEqual(mock_get_amboss_fees.call_args[0][3], 5)
+
+    @patch('src.api.collector.get_amboss_fee', side_effect=fake_amboss_fee)
+    @patch('src.api.collector.get_channel_data', side_effect=fake_channel_data)
+    @patch('src.api.collector.get_graph_edges')
+    def test_graph_snapshot_with_fallback(self, mock_get_graph_edges, mock_get_channel_data, mock_get_amboss_fee):
+        # チャネル 1 はスナップショットから、3 と 2 (エラー) は個別に取得する
+        mock_get_graph_edges.return_value = {'1': {'channel_id': '1', 'source': 'graph'}}
+        config = {'collection': {'edge_source': 'graph'}, 'amboss': {'batch_size': 1}}
+
+        results = list(collect_channel_snapshots(CHANNELS, config, concurrency=4))
+
+        self.assertEqual([r[0]['chan_id'] for r in results], ['1', '3'])
+        self.assertEqual(results[0][1]['source'], 'graph')
+        self.assertEqual(sorted(c[0][0] for c in mock_get_channel_data.call_args_list), ['2', '3'])
+
+    def test_get_edge_source(self):
+        self.assertEqual(get_edge_source({}, 10), 'edge')
+        self.assertEqual(get_edge_source({}, 1000), 'graph')
+        self.assertEqual(get_edge_source({'collection': {'graph_snapshot_threshold': 5}}, 5), 'graph')
+        self.assertEqual(get_edge_source({'collection': {'edge_source': 'edge'}}, 1000), 'edge')
+
+    def test_get_concurrency(self):
+        self.assertEqual(get_concurrency({}), 1)
+        self.assertEqual(get_concurrency({'collection': {'concurrency': 16}}), 16)
+        self.assertEqual(get_concurrency({'collection': {'concurrency': 0}}), 1)
+        self.assertEqual(get_concurrency({'collection': {'concurrency': 'x'}}), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
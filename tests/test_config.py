@@ -0,0 +1,110 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import unittest.mock
+
+import yaml
+
+from src.utils.config import CACHE_DIR_ENV, Config
+
+
+class TestNodeConfigs(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _config(self, settings):
+        path = os.path.join(self.tmpdir, 'config.yaml')
+        with open(path, 'w', encoding='utf-8') as f:
+            yaml.safe_dump(settings, f)
+        return Config(config_file=path, use_cache=False)
+
+    def test_single_node_from_lightning(self):
+        config = self._config({'lightning': {'api_url': 'https://a:8080'}, 'collection': {'concurrency': 4}})
+
+        nodes = config.get_node_configs()
+
+        self.assertEqual([node_id for node_id, _ in nodes], ['default'])
+        self.assertEqual(nodes[0][1]['lightning']['api_url'], 'https://a:8080')
+        self.assertEqual(nodes[0][1].get('collection'), {'concurrency': 4})
+
+    def test_nodes_override_lightning_defaults(self):
+        config = self._config({
+            'lightning': {'node_id': 'a', 'api_url': 'https://a:8080', 'read_timeout': 30},
+            'nodes': [{'node_id': 'a'}, {'node_id': 'b', 'api_url': 'https://b:8080'}],
+        })
+
+        nodes = dict(config.get_node_configs())
+
+        self.assertEqual(list(nodes), ['a', 'b'])
+        self.assertEqual(nodes['b']['lightning'], {'node_id': 'b', 'api_url': 'https://b:8080', 'read_timeout': 30})
+        self.assertEqual(nodes['a']['lightning']['api_url'], 'https://a:8080')
+
+    def test_duplicate_node_id(self):
+        config = self._config({'lightning': {'node_id': 'a'}, 'nodes': [{'api_url': 'https://a:8080'}, {}]})
+
+        with self.assertRaises(ValueError):
+            config.get_node_configs()
+
+
+class TestConfigCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'config.yaml')
+        self.cache_dir = os.path.join(self.tmpdir, 'cache')
+        env = unittest.mock.patch.dict(os.environ, {CACHE_DIR_ENV: self.cache_dir})
+        env.start()
+        self.addCleanup(env.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, text, mtime_ns=None):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        if mtime_ns is not None:
+            os.utime(self.path, ns=(mtime_ns, mtime_ns))
+
+    def test_cached_settings_are_reused_until_file_changes(self):
+        self._write("database:\n  path: a.db\n", mtime_ns=1_000_000_000)
+        self.assertEqual(Config(self.path).get_database_config(), {'path': 'a.db'})
+        self.assertTrue(os.path.exists(Config(self.path).cache_file))
+        self.assertEqual(os.path.dirname(Config(self.path).cache_file), self.cache_dir)
+
+        # キャッシュが使われる場合は yaml を解析しない
+        with unittest.mock.patch('yaml.load', side_effect=AssertionError("parsed")):
+            self.assertEqual(Config(self.path).get_database_config(), {'path': 'a.db'})
+
+        self._write("database:\n  path: b.db\n", mtime_ns=2_000_000_000)
+        self.assertEqual(Config(self.path).get_database_config(), {'path': 'b.db'})
+
+    def test_values_json_cannot_represent_are_not_cached(self):
+        self._write("retention:\n  1: 2024-01-01\n")
+        self.assertEqual(list(Config(self.path).get('retention')), [1])
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+    def test_bundled_config_hits_cache_after_extraction(self):
+        # onefile の実行ファイルは実行ごとに別の一時ディレクトリ (_MEIPASS) に config.yaml を展開する
+        for run in range(2):
+            bundle = os.path.join(self.tmpdir, f'_MEI{run}')
+            os.makedirs(bundle)
+            path = os.path.join(bundle, 'config.yaml')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write("database:\n  path: a.db\n")
+            with unittest.mock.patch.object(sys, '_MEIPASS', bundle, create=True):
+                if run:
+                    with unittest.mock.patch('yaml.load', side_effect=AssertionError("parsed")):
+                        self.assertEqual(Config(path).get_database_config(), {'path': 'a.db'})
+                else:
+                    Config(path)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,12 @@
+import os
+import shutil
+import tempfile
 import unittest
 import sqlite3
+from unittest.mock import patch
+from datetime import datetime, timedelta
 from src.db.database import Database
+from tests.fixtures import make_snapshot
 
 class TestDatabase(unittest.TestCase):
 
@@ -57,5 +63,780 @@ class TestDatabase(unittest.TestCase):
         self.db.delete_old_data(1)  # Assuming 1 month retention
         # Add assertions to verify old data deletion
 
+
+class TestChannelDatasWrites(unittest.TestCase):
+
+    def setUp(self):
+        self.db = Database(':memory:')
+        self.db.initialize()
+        self.db.bulk_insert_channels([{'chan_id': str(i), 'peer_alias': f'peer{i}', 'capacity': 1000000}
+                                      for i in range(3)])
+        self.db.conn.commit()
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_batched_insert_shares_timestamp(self):
+        snapshots = [make_snapshot(str(i)) for i in range(3)]
+        result = self.db.insert_channel_datas(snapshots, date='2024-01-01 00:10')
+
+        self.assertEqual(result['inserted'], 3)
+        rows = self.db.conn.execute(
+            "SELECT channel_id, date, local_fee, remote_fee, remote_infee, active FROM channel_datas ORDER BY channel_id"
+        ).fetchall()
+        self.assertEqual([tuple(r) for r in rows], [
+            (str(i), '2024-01-01 00:10', 100, 200, -10, 1) for i in range(3)
+        ])
+
+    def test_batched_insert_is_atomic(self):
+        # channel_lists に存在しないチャネルは外部キー制約違反になり、全件ロールバックされる
+        snapshots = [make_snapshot('0'), make_snapshot('missing')]
+        result = self.db.insert_channel_datas(snapshots)
+
+        self.assertEqual(result['inserted'], 0)
+        self.assertEqual(self.db.conn.execute("SELECT COUNT(*) FROM channel_datas").fetchone()[0], 0)
+
+    def test_null_policy(self):
+        channel, edge, amboss_fee = make_snapshot('1')
+        edge['node2_policy'] = None
+        self.db.update_channel_data(channel, edge, amboss_fee)
+
+        row = self.db.conn.execute("SELECT local_fee, remote_fee FROM channel_datas").fetchone()
+        self.assertEqual(tuple(row), (0, 200))
+
+
+class TestChannelDatasIndexes(unittest.TestCase):
+
+    def setUp(self):
+        self.db = Database(':memory:')
+        self.db.initialize()
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_hot_queries_use_indexes(self):
+        self.assertEqual(self.db.check_query_plans(), [])
+
+    def test_missing_index_is_reported(self):
+        self.db.conn.execute("DROP INDEX idx_channel_datas_date_node;")
+        warnings = self.db.check_query_plans()
+        self.assertEqual([name for name, _ in warnings], ['delete_old_data', 'nodes_range'])
+
+        # 既存のデータベースでも再作成される
+        self.db.create_channel_datas_indexes()
+        self.assertEqual(self.db.check_query_plans(), [])
+
+    def test_duplicates_are_removed_only_on_request(self):
+        self.db.bulk_insert_channels([{'chan_id': '1', 'peer_alias': 'peer1', 'capacity': 1000000}])
+        self.db.conn.commit()
+        self.db.insert_channel_datas([make_snapshot('1')], date='2024-01-01 00:00')
+        self.db.insert_channel_datas([make_snapshot('1', local_fee=150)], date='2024-01-01 00:00')
+        self.db.insert_channel_datas([make_snapshot('1')], date='2024-01-01 00:10')
+        # 初期化では削除しない
+        self.db.initialize()
+        self.assertEqual(self.db.conn.execute("SELECT COUNT(*) FROM channel_datas").fetchone()[0], 3)
+
+        self.assertEqual(self.db.remove_duplicate_channel_datas(dry_run=True), 1)
+        self.assertEqual(self.db.conn.execute("SELECT COUNT(*) FROM channel_datas").fetchone()[0], 3)
+
+        self.assertEqual(self.db.remove_duplicate_channel_datas(), 1)
+        rows = self.db.conn.execute("SELECT date, local_fee FROM channel_datas ORDER BY date").fetchall()
+        self.assertEqual([tuple(r) for r in rows], [('2024-01-01 00:00', 150), ('2024-01-01 00:10', 100)])
+        self.assertEqual(self.db.remove_duplicate_channel_datas(), 0)
+
+    def test_checks_the_storage_table(self):
+        for storage, index, expected in (('compact', 'idx_channel_samples_ts', ['nodes_range']),
+                                         ('delta', 'idx_channel_intervals_valid_to', ['delete_old_data', 'nodes_range'])):
+            db = Database(':memory:', storage=storage)
+            db.initialize()
+            db.conn.execute(f"DROP INDEX {index};")
+            self.assertEqual([name for name, _ in db.check_query_plans()], expected, storage)
+            db.close()
+
+            db = Database(':memory:', storage=storage)
+            db.initialize()
+            self.assertEqual(db.check_query_plans(), [], storage)
+            db.close()
+
+
+class TestCompactStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.db = Database(':memory:', storage='compact')
+        self.db.initialize()
+        self.db.bulk_insert_channels([{'chan_id': str(i), 'peer_alias': f'peer{i}', 'capacity': 1000000}
+                                      for i in range(3)])
+        self.db.conn.commit()
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_insert_uses_integer_keys(self):
+        self.db.insert_channel_datas([make_snapshot('1'), make_snapshot('2')], date='2024-01-01 00:10')
+
+        rows = self.db.conn.execute(
+            "SELECT channel_id, ts, local_balance, typeof(channel_id) FROM channel_samples ORDER BY channel_id"
+        ).fetchall()
+        ts = Database._date_to_ts('2024-01-01 00:10')
+        self.assertEqual([tuple(r) for r in rows], [(1, ts, 600000, 'integer'), (2, ts, 600000, 'integer')])
+        self.assertEqual(self.db.conn.execute("SELECT COUNT(*) FROM channel_datas").fetchone()[0], 0)
+
+    def test_migrate_from_channel_datas(self):
+        legacy = Database.CHANNEL_DATAS_INSERT_SQL
+        for i, date in enumerate(['2024-01-01 00:00', '2024-01-01 00:10', '2024-01-01 00:20']):
+            for chan_id in ('0', '1'):
+                row = Database._channel_data_row(*make_snapshot(chan_id), date)
+                self.db.conn.execute(legacy, (Database.DEFAULT_NODE_ID,) + row)
+        self.db.conn.commit()
+
+        self.assertEqual(self.db.migrate_to_compact(batch_size=4), 6)
+        rows = self.db.conn.execute("SELECT channel_id, ts FROM channel_samples ORDER BY channel_id, ts").fetchall()
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[1][1] - rows[0][1], 600)
+
+        # 再実行しても重複しない
+        self.db.migrate_to_compact()
+        self.assertEqual(self.db.conn.execute("SELECT COUNT(*) FROM channel_samples").fetchone()[0], 6)
+
+
+class TestChannelListSync(unittest.TestCase):
+
+    @staticmethod
+    def _channels(ids, alias='peer'):
+        return [{'chan_id': str(i), 'peer_alias': f'{alias}{i}', 'channel_point': f'{i}:0', 'capacity': '1000000'}
+                for i in ids]
+
+    @patch.object(Database, '_log_channel_changes')
+    def test_counts_only_changed_rows(self, mock_log):
+        db = Database(':memory:')
+        db.initialize()
+        self.assertEqual(db.update_channel_lists(self._channels(range(3))), {'inserted': 3, 'updated': 0, 'deleted': 0})
+        # 値が同じチャネルは更新として数えない
+        self.assertEqual(db.update_channel_lists(self._channels(range(3))), {'inserted': 0, 'updated': 0, 'deleted': 0})
+
+        channels = self._channels(range(1, 4))
+        channels[0]['peer_alias'] = 'renamed'
+        self.assertEqual(db.update_channel_lists(channels), {'inserted': 1, 'updated': 1, 'deleted': 1})
+
+        rows = db.conn.execute("SELECT channel_id, channel_name, capacity FROM channel_lists ORDER BY channel_id")
+        self.assertEqual([tuple(row) for row in rows], [('1', 'renamed', 1000000), ('2', 'peer2', 1000000),
+                                                        ('3', 'peer3', 1000000)])
+        inserted, updated, deleted = mock_log.call_args[0]
+        self.assertEqual(([c['channel_id'] for c in inserted], updated, [c['channel_id'] for c in deleted]),
+                         (['3'], 1, ['0']))
+        db.close()
+
+    @patch.object(Database, '_log_channel_changes')
+    def test_removes_more_channels_than_parameter_limit(self, mock_log):
+        for storage in ('legacy', 'compact'):
+            db = Database(':memory:', storage=storage)
+            db.initialize()
+            db.update_channel_lists(self._channels(range(40000)))
+            db.insert_channel_datas([make_snapshot('1'), make_snapshot('39999')], date='2024-01-01 00:00')
+
+            self.assertEqual(db.update_channel_lists(self._channels([1])), {'inserted': 0, 'updated': 0,
+                                                                            'deleted': 39999}, storage)
+            self.assertEqual(db.conn.execute("SELECT COUNT(*) FROM channel_lists").fetchone()[0], 1, storage)
+            table = db._sample_table()
+            self.assertEqual(db.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0], 1, storage)
+            db.close()
+
+    def test_change_log_is_written_next_to_database(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        cwd = os.getcwd()
+        # カレントディレクトリではなくデータベースファイルのディレクトリの logs に書き込む
+        os.chdir(tempfile.gettempdir())
+        self.addCleanup(os.chdir, cwd)
+        db = Database(os.path.join(tmpdir, 'data.db'), log_dir='logs')
+        db.initialize()
+        db.update_channel_lists(self._channels(range(2)))
+        db.close()
+
+        self.assertTrue(os.path.exists(os.path.join(tmpdir, 'logs', 'channel_changes.log')))
+        self.assertEqual(Database(':memory:', log_dir='logs').log_dir, 'logs')
+
+
+class TestPragmas(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmpdir, 'pragmas.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_defaults_and_overrides(self):
+        db = Database(self.db_path, pragmas={'synchronous': 'FULL', 'busy_timeout': 1000})
+        db.connect()
+        self.assertEqual(db.effective_pragmas['journal_mode'], 'wal')
+        self.assertEqual(db.effective_pragmas['synchronous'], 2)
+        self.assertEqual(db.effective_pragmas['busy_timeout'], 1000)
+        self.assertEqual(db.effective_pragmas['temp_store'], 2)
+        db.close()
+
+    def test_rejects_unknown_or_invalid(self):
+        with self.assertRaises(ValueError):
+            Database(self.db_path, pragmas={'writable_schema': 'ON'})
+        with self.assertRaises(ValueError):
+            Database(self.db_path, pragmas={'cache_size': '1; DROP TABLE channel_lists'})
+
+
+class TestRetention(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _populate(self, storage):
+        db = Database(os.path.join(self.tmpdir, f'{storage}.db'), storage=storage)
+        db.initialize()
+        db.bulk_insert_channels([{'chan_id': str(i), 'peer_alias': f'peer{i}', 'capacity': 1000000}
+                                 for i in range(5)])
+        db.conn.commit()
+        # 古いデータ 5 チャネル x 100 件と、新しいデータ 5 チャネル x 1 件
+        for day in range(100):
+            date = (datetime(2000, 1, 1) + timedelta(days=day)).strftime(Database.DATE_FORMAT)
+            db.insert_channel_datas([make_snapshot(str(i)) for i in range(5)], date=date)
+        db.insert_channel_datas([make_snapshot(str(i)) for i in range(5)])
+        return db
+
+    def test_chunked_delete_and_incremental_vacuum(self):
+        for storage, table in (('legacy', 'channel_datas'), ('compact', 'channel_samples')):
+            db = self._populate(storage)
+            self.assertEqual(db.conn.execute("PRAGMA auto_vacuum;").fetchone()[0], 2)
+
+            deleted = db.delete_old_data(3, chunk_size=7, chunk_seconds=10, pause_seconds=0)
+
+            self.assertEqual(deleted, 500, storage)
+            self.assertEqual(db.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0], 5)
+            db.reclaim_free_pages(pages_per_step=1, pause_seconds=0)
+            self.assertEqual(db.conn.execute("PRAGMA freelist_count;").fetchone()[0], 0)
+            db.close()
+
+    def test_compact_delete_walks_every_node(self):
+        db = self._populate('compact')
+        other = db.for_node('other')
+        for day in range(3):
+            date = (datetime(2000, 1, 1) + timedelta(days=day)).strftime(Database.DATE_FORMAT)
+            other.insert_channel_datas([make_snapshot('1'), make_snapshot('9')], date=date)
+
+        self.assertEqual(db.delete_old_data(3, chunk_size=4, chunk_seconds=10, pause_seconds=0), 506)
+        rows = db.conn.execute("SELECT node_id, COUNT(*) FROM channel_samples GROUP BY node_id").fetchall()
+        self.assertEqual([tuple(r) for r in rows], [(Database.DEFAULT_NODE_ID, 5)])
+        db.close()
+
+    def test_reclaim_requires_incremental_auto_vacuum(self):
+        db = self._populate('legacy')
+        db.conn.execute("PRAGMA auto_vacuum = NONE;")
+        db.vacuum()
+        self.assertEqual(db.conn.execute("PRAGMA auto_vacuum;").fetchone()[0], 0)
+        db.delete_old_data(3, chunk_size=100, pause_seconds=0)
+        free_pages = db.conn.execute("PRAGMA freelist_count;").fetchone()[0]
+
+        # --delete では VACUUM で変換せず、何も解放しない
+        self.assertEqual(db.reclaim_free_pages(pause_seconds=0), 0)
+        self.assertEqual(db.conn.execute("PRAGMA auto_vacuum;").fetchone()[0], 0)
+        self.assertEqual(db.conn.execute("PRAGMA freelist_count;").fetchone()[0], free_pages)
+
+        self.assertTrue(db.enable_incremental_vacuum())
+        self.assertEqual(db.conn.execute("PRAGMA auto_vacuum;").fetchone()[0], 2)
+        self.assertFalse(db.enable_incremental_vacuum())
+        db.close()
+
+
+class TestRollups(unittest.TestCase):
+
+    def _populate(self, storage, samples):
+        db = Database(':memory:', storage=storage)
+        db.initialize()
+        db.bulk_insert_channels([{'chan_id': '1', 'peer_alias': 'peer1', 'capacity': 1000000}])
+        db.conn.commit()
+        # 10 分間隔のサンプル。手数料は 7 件ごとに変わる
+        for i in samples:
+            date = (datetime(2024, 1, 1) + timedelta(minutes=10 * i)).strftime(Database.DATE_FORMAT)
+            db.insert_channel_datas([make_snapshot('1', local_fee=100 + i // 7)], date=date)
+        return db
+
+    def test_incremental_rollups_match_full_rollup(self):
+        for storage in Database.STORAGE_FORMATS:
+            full = self._populate(storage, range(30))
+            full.update_rollups()
+
+            incremental = self._populate(storage, range(10))
+            incremental.update_rollups()
+            for i in range(10, 30):
+                date = (datetime(2024, 1, 1) + timedelta(minutes=10 * i)).strftime(Database.DATE_FORMAT)
+                incremental.insert_channel_datas([make_snapshot('1', local_fee=100 + i // 7)], date=date)
+                incremental.update_rollups()
+
+            for table in ('channel_datas_hourly', 'channel_datas_daily'):
+                sql = f"SELECT * FROM {table} ORDER BY bucket"
+                self.assertEqual([tuple(r) for r in incremental.conn.execute(sql)],
+                                 [tuple(r) for r in full.conn.execute(sql)], (storage, table))
+
+            hourly = full.conn.execute(
+                "SELECT bucket, samples, local_fee_last, fee_changes FROM channel_datas_hourly ORDER BY bucket").fetchall()
+            self.assertEqual([tuple(r) for r in hourly], [
+                ('2024-01-01 00:00', 6, 100, 0),
+                ('2024-01-01 01:00', 6, 101, 1),
+                ('2024-01-01 02:00', 6, 102, 1),
+                ('2024-01-01 03:00', 6, 103, 1),
+                ('2024-01-01 04:00', 6, 104, 1),
+            ])
+            daily = full.conn.execute(
+                "SELECT bucket, samples, local_balance_avg, fee_changes, active_ratio FROM channel_datas_daily").fetchall()
+            self.assertEqual([tuple(r) for r in daily], [('2024-01-01', 30, 600000.0, 4, 1.0)])
+            full.close()
+            incremental.close()
+
+    def test_history_resolution(self):
+        db = self._populate('legacy', range(30))
+        db.update_rollups()
+
+        resolution, rows = db.get_channel_history('1', '2024-01-01 00:00', '2024-01-01 01:00')
+        self.assertEqual((resolution, len(rows)), ('raw', 6))
+        resolution, rows = db.get_channel_history('1', '2024-01-01 00:00', '2024-01-10 00:00')
+        self.assertEqual((resolution, len(rows)), ('hourly', 5))
+        resolution, rows = db.get_channel_history('1', '2023-01-01 00:00', '2024-02-01 00:00')
+        self.assertEqual((resolution, len(rows)), ('daily', 1))
+        self.assertEqual(rows[0]['samples'], 30)
+        db.close()
+
+    def test_delete_old_rollups(self):
+        db = self._populate('legacy', range(3))
+        db.update_rollups()
+
+        deleted = db.delete_old_rollups(hourly_retention_days=30, daily_retention_days=0)
+
+        self.assertEqual(deleted, {'hourly': 1, 'daily': 0})
+        self.assertEqual(db.conn.execute("SELECT COUNT(*) FROM channel_datas_daily").fetchone()[0], 1)
+        db.close()
+
+
+class TestDeltaStorage(unittest.TestCase):
+
+    def _write_runs(self, db, runs):
+        for i, snapshots in enumerate(runs):
+            date = (datetime(2024, 1, 1) + timedelta(minutes=10 * i)).strftime(Database.DATE_FORMAT)
+            db.insert_channel_datas(snapshots, date=date)
+
+    def _open(self, storage):
+        db = Database(':memory:', storage=storage)
+        db.initialize()
+        db.bulk_insert_channels([{'chan_id': str(i), 'peer_alias': f'peer{i}', 'capacity': 1000000}
+                                 for i in range(3)])
+        db.conn.commit()
+        return db
+
+    def _runs(self):
+        runs = []
+        for i in range(10):
+            # チャネル 0 は 5 回目から手数料が変わり、チャネル 1 は 3 回目に取得エラーで欠ける
+            snapshots = [make_snapshot('0', local_fee=100 if i < 5 else 150)]
+            if i != 3:
+                snapshots.append(make_snapshot('1'))
+            snapshots.append(make_snapshot('2'))
+            runs.append(snapshots)
+        return runs
+
+    def test_only_changes_are_written(self):
+        db = self._open('delta')
+        self._write_runs(db, self._runs())
+
+        intervals = db.conn.execute(
+            "SELECT channel_id, valid_from, valid_to, local_fee FROM channel_intervals ORDER BY channel_id, valid_from"
+        ).fetchall()
+        self.assertEqual([(r[0], r[3]) for r in intervals], [(0, 100), (0, 150), (1, 100), (1, 100), (2, 100)])
+        self.assertEqual(db.conn.execute("SELECT COUNT(*) FROM channel_interval_times").fetchone()[0], 10)
+        db.close()
+
+    def test_nodes_and_partial_writes_keep_intervals(self):
+        db = self._open('delta')
+        other = db.for_node('other')
+        runs = [[make_snapshot(str(c)) for c in range(3)] for _ in range(10)]
+        for i, snapshots in enumerate(runs):
+            date = datetime(2024, 1, 1) + timedelta(minutes=10 * i)
+            db.insert_channel_datas(snapshots, date=date.strftime(Database.DATE_FORMAT))
+            # 別のノードの書き込みと、チャネル 0 だけのイベントでの書き込みは他のチャネルの区間を閉じない
+            other.insert_channel_datas([make_snapshot('9')], date=(date + timedelta(minutes=1)).strftime(Database.DATE_FORMAT))
+            db.insert_channel_datas([make_snapshot('0')], date=(date + timedelta(minutes=2)).strftime(Database.DATE_FORMAT),
+                                    partial=True)
+
+        self.assertEqual(db.conn.execute("SELECT COUNT(*) FROM channel_intervals WHERE node_id = ?",
+                                         (Database.DEFAULT_NODE_ID,)).fetchone()[0], 3)
+        self.assertEqual(db.conn.execute("SELECT COUNT(*) FROM channel_intervals WHERE node_id = 'other'").fetchone()[0], 1)
+        # 展開はノードの記録日時だけを使う
+        self.assertEqual(len(db.get_channel_samples('1', '2024-01-01 00:00', '2024-01-02 00:00')), 19)
+        self.assertEqual(len(other.get_channel_samples('9', '2024-01-01 00:00', '2024-01-02 00:00')), 10)
+        db.close()
+
+    def test_migrates_shared_interval_times(self):
+        db = self._open('delta')
+        self._write_runs(db, self._runs())
+        expected = db.get_channel_samples('1', '2024-01-01 00:00', '2024-01-02 00:00')
+        # ノードごとにする前の channel_interval_times (ts のみ) に戻す
+        db.conn.execute("ALTER TABLE channel_interval_times RENAME TO times_new;")
+        db.conn.execute("CREATE TABLE channel_interval_times (ts INTEGER PRIMARY KEY);")
+        db.conn.execute("INSERT INTO channel_interval_times SELECT ts FROM times_new;")
+        db.conn.execute("DROP TABLE times_new;")
+        db.conn.commit()
+
+        self.assertEqual(db.migrate_to_node_scope(), 1)
+        self.assertEqual(db.get_channel_samples('1', '2024-01-01 00:00', '2024-01-02 00:00'), expected)
+        self.assertEqual(db.migrate_to_node_scope(), 0)
+        db.close()
+
+    def test_expanded_samples_match_legacy(self):
+        legacy = self._open('legacy')
+        delta = self._open('delta')
+        self._write_runs(legacy, self._runs())
+        self._write_runs(delta, self._runs())
+
+        for channel_id in ('0', '1', '2'):
+            self.assertEqual(delta.get_channel_samples(channel_id, '2024-01-01 00:00', '2024-01-02 00:00'),
+                             legacy.get_channel_samples(channel_id, '2024-01-01 00:00', '2024-01-02 00:00'))
+        self.assertEqual(len(delta.get_channel_samples('1', '2024-01-01 00:00', '2024-01-02 00:00')), 9)
+        self.assertEqual(len(delta.get_channel_samples('0', '2024-01-01 00:20', '2024-01-01 01:00')), 4)
+        legacy.close()
+        delta.close()
+
+    def test_migrate_to_delta(self):
+        db = self._open('delta')
+        self._write_runs(db, self._runs())
+        expected = db.conn.execute("SELECT * FROM channel_intervals ORDER BY channel_id, valid_from").fetchall()
+
+        migrated = self._open('delta')
+        migrated.conn.executemany(Database.CHANNEL_DATAS_INSERT_SQL, [
+            (Database.DEFAULT_NODE_ID,) + Database._channel_data_row(
+                channel, edge, fee, (datetime(2024, 1, 1) + timedelta(minutes=10 * i)).strftime(Database.DATE_FORMAT))
+            for i, snapshots in enumerate(self._runs()) for channel, edge, fee in snapshots
+        ])
+        migrated.conn.commit()
+
+        self.assertEqual(migrated.migrate_to_delta(batch_size=4), 29)
+        # 移行済みの日時より後のサンプルだけが対象になるため、再実行しても重複しない
+        self.assertEqual(migrated.migrate_to_delta(batch_size=4), 0)
+        self.assertEqual([tuple(r) for r in migrated.conn.execute(
+            "SELECT * FROM channel_intervals ORDER BY channel_id, valid_from")], [tuple(r) for r in expected])
+        db.close()
+        migrated.close()
+
+    def test_closed_channel_intervals_are_removed(self):
+        db = self._open('delta')
+        other = db.for_node('other')
+        self._write_runs(db, self._runs())
+        other.insert_channel_datas([make_snapshot('1')], date='2024-01-01 00:00')
+
+        db.update_channel_lists([{'chan_id': '0', 'peer_alias': 'peer0', 'capacity': 1000000},
+                                 {'chan_id': '2', 'peer_alias': 'peer2', 'capacity': 1000000}])
+
+        rows = db.conn.execute("SELECT DISTINCT node_id, channel_id FROM channel_intervals ORDER BY node_id, channel_id")
+        # 他のノードの同じチャネルは残す
+        self.assertEqual([tuple(r) for r in rows], [(Database.DEFAULT_NODE_ID, 0), (Database.DEFAULT_NODE_ID, 2),
+                                                    ('other', 1)])
+        db.close()
+
+    def test_delete_old_intervals(self):
+        db = self._open('delta')
+        self._write_runs(db, self._runs())
+        db.insert_channel_datas([make_snapshot('2')])
+
+        # チャネル 2 は値が変わらず最新の記録まで続いているため、区間は残り古い記録日時だけが消える
+        db.delete_old_data(1, chunk_size=1, pause_seconds=0)
+
+        rows = db.conn.execute("SELECT channel_id FROM channel_intervals ORDER BY channel_id").fetchall()
+        self.assertEqual([r[0] for r in rows], [2])
+        self.assertEqual(db.conn.execute("SELECT COUNT(*) FROM channel_interval_times").fetchone()[0], 1)
+        self.assertEqual(len(db.get_channel_samples('2', '2000-01-01 00:00', '2100-01-01 00:00')), 1)
+        db.close()
+
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+@unittest.skipUnless(numpy, "numpy がインストールされていません")
+class TestChannelArrays(unittest.TestCase):
+
+    def _populate(self, storage):
+        db = Database(':memory:', storage=storage)
+        db.initialize()
+        db.bulk_insert_channels([{'chan_id': str(i), 'peer_alias': f'peer{i}', 'capacity': 1000000}
+                                 for i in (1, 2, 3)])
+        db.conn.commit()
+        # チャネル 1 は 10 分間隔、チャネル 2 は 30 分間隔、チャネル 3 はサンプルなし
+        for i in range(12):
+            date = (datetime(2024, 1, 1) + timedelta(minutes=10 * i)).strftime(Database.DATE_FORMAT)
+            snapshots = [make_snapshot('1', local_fee=100 + i)]
+            if i % 3 == 0:
+                snapshots.append(make_snapshot('2', local_fee=500 + i))
+            db.insert_channel_datas(snapshots, date=date)
+        return db
+
+    def test_columns_match_across_storage_formats(self):
+        start_ts = int(datetime(2024, 1, 1).timestamp())
+        for storage in Database.STORAGE_FORMATS:
+            db = self._populate(storage)
+            columns = db.get_channels_arrays('2024-01-01 00:00', '2024-01-01 01:00')
+
+            self.assertEqual(columns['channel_id'].tolist(), [1] * 6 + [2] * 2, storage)
+            self.assertEqual(columns['ts'].tolist()[:2], [start_ts, start_ts + 600], storage)
+            self.assertEqual(columns['local_fee'].tolist(), [100, 101, 102, 103, 104, 105, 500, 503], storage)
+            self.assertEqual(columns['local_balance'].dtype, numpy.float64)
+
+            single = db.get_channel_arrays('2', '2024-01-01 00:00', '2024-01-02 00:00')
+            self.assertEqual(single['local_fee'].tolist(), [500, 503, 506, 509], storage)
+            db.close()
+
+    def test_resample_to_grid(self):
+        start_ts = int(datetime(2024, 1, 1, 0, 5).timestamp())
+        for storage in Database.STORAGE_FORMATS:
+            db = self._populate(storage)
+            grid = db.get_channels_arrays('2024-01-01 00:05', '2024-01-01 02:05', channel_ids=['1', '2', '3'],
+                                          step=1800)
+
+            self.assertEqual(grid['ts'].tolist(), [start_ts + 1800 * k for k in range(4)], storage)
+            self.assertEqual(grid['channel_id'].tolist(), [1, 2, 3])
+            self.assertEqual(grid['local_fee'].shape, (3, 4))
+            # 各時刻以前の最後のサンプル (00:05 -> 00:00, 00:35 -> 00:30, ...)
+            self.assertEqual(grid['local_fee'][0].tolist(), [100, 103, 106, 109], storage)
+            self.assertEqual(grid['local_fee'][1].tolist(), [500, 503, 506, 509], storage)
+            self.assertTrue(numpy.isnan(grid['local_fee'][2]).all())
+
+            # 直前のサンプルが max_gap より古い時刻は NaN
+            sparse = db.get_channel_arrays('2', '2024-01-01 00:05', '2024-01-01 02:35', step=1800, max_gap=600)
+            self.assertEqual(sparse['local_fee'][:4].tolist(), [500, 503, 506, 509], storage)
+            self.assertTrue(numpy.isnan(sparse['local_fee'][4]))
+            db.close()
+
+
+class TestPartitioning(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _open(self, storage, partitioning='monthly', name='node.db'):
+        db = Database(os.path.join(self.tmpdir, name), storage=storage, partitioning=partitioning)
+        db.initialize()
+        db.bulk_insert_channels([{'chan_id': str(i), 'peer_alias': f'peer{i}', 'capacity': 1000000}
+                                 for i in range(2)])
+        db.conn.commit()
+        return db
+
+    def _write_runs(self, db, start=datetime(2024, 1, 31, 22, 0), runs=30):
+        # 月末から翌月にまたがる 10 分間隔のサンプル
+        for i in range(runs):
+            date = (start + timedelta(minutes=10 * i)).strftime(Database.DATE_FORMAT)
+            db.insert_channel_datas([make_snapshot(str(c), local_fee=100 + i // 7) for c in range(2)], date=date)
+
+    def test_reads_match_unpartitioned(self):
+        for storage in ('legacy', 'compact'):
+            plain = self._open(storage, 'none', f'plain_{storage}.db')
+            monthly = self._open(storage, 'monthly', f'monthly_{storage}.db')
+            for db in (plain, monthly):
+                self._write_runs(db)
+                db.update_rollups()
+
+            self.assertEqual(monthly.list_partitions(), ['2024-01', '2024-02'], storage)
+            table = monthly._sample_table()
+            self.assertEqual(monthly.conn.execute(f"SELECT COUNT(*) FROM main.{table}").fetchone()[0], 0)
+
+            start, end = '2024-01-31 00:00', '2024-02-02 00:00'
+            self.assertEqual(monthly.get_channel_samples('1', start, end), plain.get_channel_samples('1', start, end))
+            self.assertEqual(len(monthly.get_channel_samples('1', start, end)), 30)
+            self.assertEqual(monthly.get_sample_date_range(), ('2024-01-31 22:00', '2024-02-01 02:50'))
+            self.assertEqual(list(monthly.iter_export_rows(start, end)), list(plain.iter_export_rows(start, end)))
+            for rollup in ('channel_datas_hourly', 'channel_datas_daily'):
+                sql = f"SELECT * FROM {rollup} ORDER BY channel_id, bucket"
+                self.assertEqual([tuple(r) for r in monthly.conn.execute(sql)],
+                                 [tuple(r) for r in plain.conn.execute(sql)], (storage, rollup))
+            plain.close()
+            monthly.close()
+
+    def test_older_months_are_read_only(self):
+        db = self._open('legacy')
+        self._write_runs(db)
+        db.get_channel_samples('0', '2024-01-01 00:00', '2024-03-01 00:00')
+
+        # 書き込んだ 2 月だけが読み書き可能で、1 月は読み込み専用で ATTACH される
+        self.assertEqual(db._attached, {'2024-02': True, '2024-01': False})
+        with self.assertRaises(sqlite3.OperationalError):
+            db.conn.execute("INSERT INTO p_2024_01.channel_datas (channel_id, date) VALUES ('0', '2024-01-31 23:59')")
+        db.close()
+
+    def test_reads_beyond_attach_limit(self):
+        db = self._open('compact')
+        for month in range(1, 13):
+            db.insert_channel_datas([make_snapshot('0', local_fee=month)], date=f'2024-{month:02d}-15 00:00')
+
+        samples = db.get_channel_samples('0', '2024-01-01 00:00', '2025-01-01 00:00')
+
+        self.assertEqual([s['local_fee'] for s in samples], list(range(1, 13)))
+        self.assertLessEqual(len(db._attached), Database.MAX_ATTACHED_PARTITIONS)
+        db.close()
+
+    def test_delete_drops_old_month_files(self):
+        db = self._open('legacy')
+        self._write_runs(db)
+        db.insert_channel_datas([make_snapshot('0')])
+
+        deleted = db.delete_old_data(3)
+
+        self.assertEqual(deleted, 60)
+        self.assertEqual(db.list_partitions(), [datetime.now().strftime('%Y-%m')])
+        self.assertFalse(os.path.exists(db.partition_path('2024-01')))
+        db.close()
+
+    def test_closed_channels_are_removed_from_month_files(self):
+        for storage, table in (('legacy', 'channel_datas'), ('compact', 'channel_samples')):
+            db = self._open(storage, name=f'closed_{storage}.db')
+            self._write_runs(db)
+            db.for_node('other').insert_channel_datas([make_snapshot('1')], date='2024-01-31 23:00')
+
+            db.update_channel_lists([{'chan_id': '0', 'peer_alias': 'peer0', 'capacity': 1000000}])
+
+            for month in ('2024-01', '2024-02'):
+                schema = db._attach_partition(month)
+                rows = db.conn.execute(f"SELECT DISTINCT node_id, channel_id FROM {schema}.{table} "
+                                       "ORDER BY node_id, channel_id").fetchall()
+                # 他のノードの同じチャネルは残す
+                expected = [(Database.DEFAULT_NODE_ID, '0')] + ([('other', '1')] if month == '2024-01' else [])
+                self.assertEqual([(r[0], str(r[1])) for r in rows], expected, (storage, month))
+            db.close()
+
+    def test_migrate_to_partitions(self):
+        plain = self._open('compact', 'none')
+        self._write_runs(plain)
+        plain.close()
+
+        db = self._open('compact')
+        self.assertEqual(db.migrate_to_partitions(), 60)
+        self.assertEqual(db.migrate_to_partitions(), 0)
+        self.assertEqual(db.list_partitions(), ['2024-01', '2024-02'])
+        self.assertEqual(len(db.get_channel_samples('0', '2024-01-01 00:00', '2024-03-01 00:00')), 30)
+        db.close()
+
+    def test_rejects_unsupported_combinations(self):
+        with self.assertRaises(ValueError):
+            Database(os.path.join(self.tmpdir, 'node.db'), storage='delta', partitioning='monthly')
+        with self.assertRaises(ValueError):
+            Database(':memory:', partitioning='monthly')
+
+
+
+class TestMultiNode(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _open(self, storage='legacy', node_id='node-a'):
+        db = Database(':memory:', storage=storage, node_id=node_id)
+        db.initialize()
+        return db
+
+    def _channels(self, *chan_ids):
+        return [{'chan_id': chan_id, 'peer_alias': f'peer{chan_id}', 'capacity': 1000000} for chan_id in chan_ids]
+
+    def test_same_channel_id_on_two_nodes(self):
+        for storage in Database.STORAGE_FORMATS:
+            db = self._open(storage)
+            node_b = db.for_node('node-b')
+            for node in (db, node_b):
+                node.bulk_insert_channels(self._channels('1'))
+                node.conn.commit()
+            db.insert_channel_datas([make_snapshot('1', local_fee=100)], date='2024-01-01 00:00')
+            node_b.insert_channel_datas([make_snapshot('1', local_fee=300)], date='2024-01-01 00:00')
+
+            # 接続は共有し、ノードの行だけを読み書きする
+            self.assertIs(node_b.conn, db.conn)
+            for node, fee in ((db, 100), (node_b, 300)):
+                samples = node.get_channel_samples('1', '2024-01-01 00:00', '2024-01-02 00:00')
+                self.assertEqual([sample['local_fee'] for sample in samples], [fee], storage)
+            rows = list(db.iter_export_rows('2024-01-01 00:00', '2024-01-02 00:00'))
+            self.assertEqual([(row[1], row[2], row[3]) for row in rows],
+                             [('node-a', '1', 'peer1'), ('node-b', '1', 'peer1')], storage)
+            db.close()
+
+    @patch.object(Database, '_log_channel_changes')
+    def test_update_channel_lists_keeps_other_nodes(self, mock_log):
+        db = self._open()
+        node_b = db.for_node('node-b')
+        db.update_channel_lists(self._channels('1', '2'))
+        node_b.update_channel_lists(self._channels('2', '3'))
+        node_b.insert_channel_datas([make_snapshot('2')], date='2024-01-01 00:00')
+
+        # node-a のチャネル 2 が閉じても node-b のチャネル 2 とそのサンプルは残る
+        db.update_channel_lists(self._channels('1'))
+
+        rows = db.conn.execute("SELECT node_id, channel_id FROM channel_lists ORDER BY node_id, channel_id").fetchall()
+        self.assertEqual([tuple(r) for r in rows], [('node-a', '1'), ('node-b', '2'), ('node-b', '3')])
+        self.assertEqual(len(node_b.get_channel_samples('2', '2024-01-01 00:00', '2024-01-02 00:00')), 1)
+        db.close()
+
+    def test_rollups_per_node(self):
+        db = self._open()
+        node_b = db.for_node('node-b')
+        for node in (db, node_b):
+            node.bulk_insert_channels(self._channels('1'))
+            node.conn.commit()
+        for i in range(6):
+            date = (datetime(2024, 1, 1) + timedelta(minutes=10 * i)).strftime(Database.DATE_FORMAT)
+            db.insert_channel_datas([make_snapshot('1', local_fee=100)], date=date)
+            node_b.insert_channel_datas([make_snapshot('1', local_fee=200 + i)], date=date)
+        db.update_rollups()
+
+        rows = db.conn.execute(
+            "SELECT node_id, samples, local_fee_last, fee_changes FROM channel_datas_hourly ORDER BY node_id").fetchall()
+        self.assertEqual([tuple(r) for r in rows], [('node-a', 6, 100, 0), ('node-b', 6, 205, 5)])
+        _, history = node_b.get_channel_history('1', '2024-01-01 00:00', '2024-01-10 00:00', resolution='hourly')
+        self.assertEqual([row['local_fee'] for row in history], [205])
+        db.close()
+
+    def test_migrates_database_without_node_id(self):
+        path = os.path.join(self.tmpdir, 'old.db')
+        conn = sqlite3.connect(path)
+        conn.executescript('''
+            CREATE TABLE channel_lists (id INTEGER PRIMARY KEY AUTOINCREMENT, channel_name TEXT NOT NULL,
+                channel_id TEXT NOT NULL UNIQUE, channel_point TEXT, capacity INTEGER NOT NULL);
+            CREATE TABLE channel_datas (channel_id TEXT NOT NULL, date TEXT NOT NULL, local_balance INTEGER,
+                local_fee INTEGER, local_infee INTEGER, remote_balance INTEGER, remote_fee INTEGER,
+                remote_infee INTEGER, num_updates INTEGER, amboss_fee INTEGER, active INTEGER,
+                FOREIGN KEY (channel_id) REFERENCES channel_lists (channel_id));
+            CREATE INDEX idx_channel_datas_channel_date ON channel_datas (channel_id, date);
+            INSERT INTO channel_lists (channel_name, channel_id, capacity) VALUES ('peer1', '1', 1000000);
+            INSERT INTO channel_datas VALUES ('1', '2024-01-01 00:00', 600000, 100, 0, 400000, 200, -10, 42, 1500, 1);
+        ''')
+        conn.commit()
+        conn.close()
+
+        db = Database(path, node_id='node-a')
+        # 移行するまでは初期化（書き込み）しない
+        self.assertFalse(db.initialize())
+        self.assertEqual(db.unmigrated_node_tables(), ['channel_lists', 'channel_datas'])
+        self.assertEqual(db.migrate_to_node_scope(), 2)
+        self.assertEqual(db.unmigrated_node_tables(), [])
+        self.assertTrue(db.initialize())
+
+        rows = db.conn.execute("SELECT node_id, channel_id, local_fee FROM channel_datas").fetchall()
+        self.assertEqual([tuple(r) for r in rows], [('node-a', '1', 100)])
+        self.assertEqual(db.get_channel_by_id('1')['channel_name'], 'peer1')
+        self.assertEqual(db.check_query_plans(), [])
+        self.assertEqual(db.conn.execute("PRAGMA foreign_key_check;").fetchall(), [])
+        # 移行済みのデータベースは作り直さない
+        self.assertEqual(db.migrate_to_node_scope(), 0)
+        db.close()
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,63 @@
+import json
+import unittest
+from unittest.mock import patch
+
+from src.api import decode
+from src.api.decode import decode_channels, decode_edge
+from src.db.database import Database
+
+CHANNEL = {
+    'active': True,
+    'remote_pubkey': 'remote',
+    'channel_point': 'aa:0',
+    'chan_id': '123',
+    'capacity': '1000000',
+    'local_balance': '600000',
+    'remote_balance': '400000',
+    'num_updates': '42',
+    'peer_alias': 'peer',
+    'pending_htlcs': [{'amount': '1'}],
+    'commit_fee': '2000',
+}
+
+EDGE = {
+    'channel_id': '123',
+    'chan_point': 'aa:0',
+    'node1_pub': 'remote',
+    'node2_pub': 'local',
+    'capacity': '1000000',
+    'node1_policy': {'fee_rate_milli_msat': '200', 'inbound_fee_rate_milli_msat': -50, 'min_htlc': '1000',
+                     'last_update': 1700000000},
+    'node2_policy': None,
+}
+
+
+class TestDecode(unittest.TestCase):
+
+    def test_channels_are_dicts(self):
+        # チャネル一覧は response.json() と同じ辞書のまま
+        channels = decode_channels(json.dumps({'channels': [CHANNEL, {'chan_id': '9'}]}).encode())
+
+        self.assertEqual(channels, [CHANNEL, {'chan_id': '9'}])
+        self.assertEqual(decode_channels(b'{}'), [])
+
+    def test_edge_is_dict(self):
+        self.assertEqual(decode_edge(json.dumps(EDGE).encode()), EDGE)
+
+    def test_without_orjson(self):
+        # 標準の json でも同じ形で返す
+        with patch.object(decode, 'orjson', None):
+            self.assertEqual(decode_channels(json.dumps({'channels': [CHANNEL]})), [CHANNEL])
+            self.assertEqual(decode_edge(json.dumps(EDGE).encode()), EDGE)
+            self.assertEqual(decode_channels(b'{}'), [])
+        with self.assertRaises(ValueError):
+            decode.loads(b'{"channels": [')
+
+    def test_row(self):
+        row = Database._channel_data_row(CHANNEL, decode_edge(json.dumps(EDGE)), 100, 'date')
+
+        self.assertEqual(row, ('123', 'date', '600000', 0, 0, '400000', '200', -50, '42', 100, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
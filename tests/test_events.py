@@ -0,0 +1,186 @@
+import base64
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch, MagicMock
+
+import requests
+
+from src.api.events import ChannelState, EventCapture, format_channel_point
+from src.api.lightning_client import LightningClient, close_clients
+from src.db.database import Database
+from tests.fixtures import TXID, make_channel, make_edge
+
+
+def inactive_event(chan_id):
+    # funding_txid_bytes はバイト順が逆の txid
+    txid_bytes = base64.b64encode(bytes.fromhex(TXID)[::-1]).decode()
+    return {'type': 'INACTIVE_CHANNEL', 'inactive_channel': {'funding_txid_bytes': txid_bytes,
+                                                             'output_index': int(chan_id)}}
+
+
+def policy_update(chan_id, node, fee):
+    return {'channel_updates': [{'chan_id': chan_id, 'advertising_node': node,
+                                 'routing_policy': {'fee_rate_milli_msat': fee}}]}
+
+
+class _FakeStreamHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        messages = self.server.streams.get(self.path, [])
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for message in messages:
+            payload = (json.dumps(message) + '\n').encode()
+            # メッセージの途中でチャンクを区切る
+            for part in (payload[:7], payload[7:]):
+                self.wfile.write(f'{len(part):x}\r\n'.encode() + part + b'\r\n')
+                self.wfile.flush()
+        self.wfile.write(b'0\r\n\r\n')
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestSubscriptions(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _FakeStreamHandler)
+        self.server.streams = {}
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.tmpdir = tempfile.mkdtemp()
+        macaroon_path = os.path.join(self.tmpdir, 'admin.macaroon')
+        with open(macaroon_path, 'wb') as f:
+            f.write(b'\x01')
+        self.config = {
+            'lightning': {
+                'api_url': f'http://127.0.0.1:{self.server.server_address[1]}',
+                'macaroon_path': macaroon_path,
+                'tls_path': requests.certs.where(),
+            }
+        }
+
+    def tearDown(self):
+        close_clients()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_subscribe_parses_chunked_stream(self):
+        self.server.streams['/v1/channels/subscribe'] = [{'result': inactive_event('1')},
+                                                         {'result': {'type': 'ACTIVE_CHANNEL'}}]
+        self.server.streams['/v1/graph/subscribe'] = [{'result': policy_update('1', 'local', '150')},
+                                                      {'error': {'code': 2, 'message': 'shutting down'}}]
+        client = LightningClient(self.config)
+
+        events = list(client.subscribe_channel_events())
+        self.assertEqual([e['type'] for e in events], ['INACTIVE_CHANNEL', 'ACTIVE_CHANNEL'])
+
+        updates = client.subscribe_graph()
+        self.assertEqual(next(updates)['channel_updates'][0]['chan_id'], '1')
+        with self.assertRaises(ValueError):
+            next(updates)
+        client.close()
+
+    def test_run_writes_rows_for_streamed_events(self):
+        self.server.streams['/v1/graph/subscribe'] = [
+            {'result': policy_update('999', 'other', '1')},  # 自ノード以外のチャネルは無視する
+            {'result': policy_update('1', 'local', '150')},
+        ]
+        db = Database(':memory:')
+        db.initialize()
+        db.bulk_insert_channels([{'chan_id': '1', 'peer_alias': 'peer1', 'capacity': 1000000}])
+        db.conn.commit()
+
+        capture = EventCapture(db, self.config, lambda: [(make_channel('1'), make_edge('1'), 1500)],
+                               reconcile_seconds=60)
+        handle = capture.handle
+
+        def handle_and_stop(events):
+            written = handle(events)
+            if written:
+                capture.stop()
+            return written
+
+        capture.handle = handle_and_stop
+        watchdog = threading.Timer(10, capture.stop)
+        watchdog.start()
+        with patch('src.api.events.get_amboss_fee', return_value=1500):
+            capture.run()
+        watchdog.cancel()
+
+        rows = db.conn.execute("SELECT channel_id, local_fee FROM channel_datas").fetchall()
+        self.assertEqual([tuple(r) for r in rows], [('1', 150)])
+        db.close()
+
+
+class TestEventCapture(unittest.TestCase):
+
+    def setUp(self):
+        self.db = Database(':memory:')
+        self.db.initialize()
+        self.db.bulk_insert_channels([{'chan_id': str(i), 'peer_alias': f'peer{i}', 'capacity': 1000000}
+                                      for i in range(1, 4)])
+        self.db.conn.commit()
+        self.db.update_channel_lists = MagicMock()
+        self.capture = EventCapture(self.db, {}, lambda: [(make_channel('1'), make_edge('1'), 1500),
+                                                          (make_channel('2'), make_edge('2'), 1500)])
+        self.capture.reconcile()
+
+    def tearDown(self):
+        self.db.close()
+
+    def _rows(self):
+        return [tuple(r) for r in self.db.conn.execute(
+            "SELECT channel_id, local_fee, remote_fee, active FROM channel_datas ORDER BY rowid")]
+
+    def test_format_channel_point(self):
+        self.assertEqual(format_channel_point(inactive_event('2')['inactive_channel']), f'{TXID}:2')
+        self.assertEqual(format_channel_point({'funding_txid_str': 'ff', 'output_index': 3}), 'ff:3')
+
+    @patch('src.api.events.get_amboss_fee', return_value=1500)
+    def test_bursts_are_coalesced_per_channel(self, mock_get_amboss_fee):
+        written = self.capture.handle([
+            ('graph', policy_update('1', 'local', '110')),
+            ('graph', policy_update('1', 'remote1', '210')),
+            ('channels', inactive_event('2')),
+            ('channels', inactive_event('2')),
+        ])
+
+        self.assertEqual(written, 2)
+        self.assertEqual(self._rows(), [('1', 110, 210, 1), ('2', 100, 200, 0)])
+        self.db.update_channel_lists.assert_not_called()
+
+    @patch('src.api.events.get_amboss_fee', return_value=1500)
+    def test_unchanged_policy_writes_nothing(self, mock_get_amboss_fee):
+        self.assertEqual(self.capture.handle([('graph', policy_update('1', 'local', '100'))]), 0)
+        # 記録しないフィールドだけの変更も書き込まない
+        update = policy_update('1', 'local', '100')
+        update['channel_updates'][0]['routing_policy'].update({'last_update': 1700000100, 'time_lock_delta': 80})
+        self.assertEqual(self.capture.handle([('graph', update)]), 0)
+        self.assertEqual(self._rows(), [])
+
+    @patch('src.api.events.get_amboss_fee', return_value=1500)
+    @patch('src.api.events.get_channel_data', side_effect=lambda chan_id, config: make_edge(chan_id, local_fee=300))
+    def test_open_and_close_update_channel_lists(self, mock_get_channel_data, mock_get_amboss_fee):
+        written = self.capture.handle([
+            ('channels', {'type': 'OPEN_CHANNEL', 'open_channel': make_channel('3')}),
+            ('channels', {'type': 'CLOSED_CHANNEL', 'closed_channel': {'chan_id': '2'}}),
+        ])
+
+        self.assertEqual(written, 1)
+        self.assertEqual(self._rows(), [('3', 300, 200, 1)])
+        channels = self.db.update_channel_lists.call_args[0][0]
+        self.assertEqual(sorted(c['chan_id'] for c in channels), ['1', '3'])
+
+
+if __name__ == '__main__':
+    unittest.main()
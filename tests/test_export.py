@@ -0,0 +1,126 @@
+import csv
+import glob
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from src.db.database import Database
+from src.db.export import export_history, load_cursor
+from tests.fixtures import make_snapshot
+
+try:
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+def read_csv_parts(output_dir):
+    rows = []
+    for path in sorted(glob.glob(os.path.join(output_dir, 'part-*.csv'))):
+        with open(path, encoding='utf-8', newline='') as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            rows.extend(tuple(row) for row in reader)
+    return header, rows
+
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _populate(self, storage, runs=10):
+        db = Database(':memory:', storage=storage)
+        db.initialize()
+        db.bulk_insert_channels([{'chan_id': str(i), 'peer_alias': f'peer{i}', 'capacity': 1000000}
+                                 for i in range(3)])
+        db.conn.commit()
+        # 6 時間間隔で日をまたぐサンプル
+        for i in range(runs):
+            date = (datetime(2024, 1, 1) + timedelta(hours=6 * i)).strftime(Database.DATE_FORMAT)
+            db.insert_channel_datas([make_snapshot(str(c), local_fee=100 + i) for c in range(3)], date=date)
+        return db
+
+    def test_csv_export_matches_across_storage_formats(self):
+        exported = {}
+        for storage in Database.STORAGE_FORMATS:
+            db = self._populate(storage)
+            output_dir = os.path.join(self.tmpdir, storage)
+            result = export_history(db, output_dir, fmt='csv', row_group_size=4, rows_per_file=7)
+
+            self.assertEqual(result['rows'], 30, storage)
+            # 日時の区切りでファイルを閉じるため、1 ファイルは 9 行 (3 回分)
+            self.assertEqual(len(result['files']), 4, storage)
+            header, rows = read_csv_parts(output_dir)
+            self.assertEqual(tuple(header), Database.EXPORT_COLUMNS)
+            exported[storage] = rows
+            db.close()
+
+        self.assertEqual(exported['legacy'][0], ('2024-01-01 00:00', 'default', '0', 'peer0', '', '1000000',
+                                                 '600000', '100', '0', '400000', '200', '-10', '42', '1500', '1'))
+        self.assertEqual(exported['compact'], exported['legacy'])
+        self.assertEqual(exported['delta'], exported['legacy'])
+
+    def test_resume_after_interruption(self):
+        db = self._populate('legacy')
+        output_dir = os.path.join(self.tmpdir, 'archive')
+        iter_export_rows = db.iter_export_rows
+
+        def failing_rows(start, end):
+            for count, row in enumerate(iter_export_rows(start, end)):
+                if count == 14:
+                    raise OSError('disk full')
+                yield row
+
+        db.iter_export_rows = failing_rows
+        with self.assertRaises(OSError):
+            export_history(db, output_dir, fmt='csv', rows_per_file=6)
+        # 閉じたファイル (2 回分ずつ) の最後の日時だけがカーソルに記録される
+        self.assertEqual(load_cursor(output_dir), {'format': 'csv', 'last_date': '2024-01-01 18:00', 'next_part': 2})
+
+        db.iter_export_rows = iter_export_rows
+        result = export_history(db, output_dir, fmt='csv', rows_per_file=6)
+        self.assertEqual(result['rows'], 18)
+        _, rows = read_csv_parts(output_dir)
+        self.assertEqual(len(rows), 30)
+        self.assertEqual(len(set(rows)), 30)
+
+        # 新しいサンプルが増えた後の再実行では、増えた分だけを書き出す
+        db.insert_channel_datas([make_snapshot('0')], date='2024-01-04 00:00')
+        self.assertEqual(export_history(db, output_dir, fmt='csv')['rows'], 1)
+        db.close()
+
+    def test_export_end_uses_retention_cutoff(self):
+        db = self._populate('compact')
+        db.insert_channel_datas([make_snapshot('0')])
+        output_dir = os.path.join(self.tmpdir, 'archive')
+
+        result = export_history(db, output_dir, fmt='csv', end=db.retention_cutoff(1))
+
+        self.assertEqual(result['rows'], 30)
+        db.close()
+
+    @unittest.skipUnless(pyarrow, "pyarrow がインストールされていません")
+    def test_parquet_row_groups(self):
+        db = self._populate('legacy')
+        output_dir = os.path.join(self.tmpdir, 'parquet')
+
+        result = export_history(db, output_dir, fmt='parquet', row_group_size=8)
+
+        self.assertEqual(result['format'], 'parquet')
+        parquet_file = pyarrow.parquet.ParquetFile(result['files'][0])
+        self.assertEqual(parquet_file.metadata.num_rows, 30)
+        self.assertEqual(parquet_file.metadata.num_row_groups, 4)
+        table = parquet_file.read()
+        self.assertEqual(table.column('local_fee').to_pylist()[-1], 109)
+        self.assertEqual(table.column('channel_id').to_pylist()[:3], ['0', '1', '2'])
+        db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import time
+import unittest
+from unittest.mock import patch
+
+from src.api.fee_cache import AmbossFeeCache
+from src.api.lightning_client import get_amboss_fee, AMBOSS_DEFAULT_FEE
+from src.db.database import Database
+
+
+class TestAmbossFeeCache(unittest.TestCase):
+
+    def setUp(self):
+        self.db = Database(':memory:')
+        self.db.initialize()
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_expiry_and_eviction(self):
+        cache = AmbossFeeCache(ttl_seconds=60, max_entries=2)
+        cache.put('a', 100)
+        cache.put('b', 200, fetched_at=time.time() - 120)
+        self.assertEqual(cache.get('a'), 100)
+        self.assertIsNone(cache.get('b'))
+
+        cache.put('c', 300)
+        cache.put('d', 400)
+        # 上限 2 件のため最も古い 'a' が追い出される
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('d'), 400)
+
+    def test_persists_across_runs(self):
+        cache = AmbossFeeCache(ttl_seconds=60, max_entries=10, db=self.db)
+        cache.put('fresh', 100)
+        cache.put('stale', 200, fetched_at=time.time() - 120)
+        self.assertEqual(cache.save(), 2)
+
+        # 期限切れのエントリは保存時に削除される
+        rows = self.db.conn.execute("SELECT pubkey FROM amboss_fee_cache").fetchall()
+        self.assertEqual([row[0] for row in rows], ['fresh'])
+
+        next_run = AmbossFeeCache(ttl_seconds=60, max_entries=10, db=self.db)
+        self.assertEqual(next_run.load(), 1)
+        self.assertEqual(next_run.get('fresh'), 100)
+
+    @patch('src.api.lightning_client._fetch_amboss_fee')
+    def test_get_amboss_fee_uses_cache(self, mock_fetch):
+        cache = AmbossFeeCache(ttl_seconds=60)
+        mock_fetch.return_value = 1500
+
+        self.assertEqual(get_amboss_fee('pub', {}, cache), 1500)
+        self.assertEqual(get_amboss_fee('pub', {}, cache), 1500)
+        self.assertEqual(mock_fetch.call_count, 1)
+
+        # 取得失敗時のデフォルト値はキャッシュしない
+        mock_fetch.return_value = None
+        self.assertEqual(get_amboss_fee('other', {}, cache), AMBOSS_DEFAULT_FEE)
+        self.assertIsNone(cache.get('other'))
+
+
+if __name__ == '__main__':
+    unittest.main()
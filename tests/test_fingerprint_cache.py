@@ -0,0 +1,223 @@
+import time
+import unittest
+from unittest.mock import patch
+
+from src.api.collector import collect_channel_snapshots
+from src.api.fee_cache import AmbossFeeCache
+from src.api.fingerprint_cache import ChannelFingerprintCache, channel_fingerprint
+from src.api.lightning_client import AMBOSS_DEFAULT_FEE
+from src.db.database import Database
+from src.main import write_node
+from tests.fixtures import make_channel, make_edge
+
+
+class TestChannelFingerprint(unittest.TestCase):
+
+    def test_changes_with_updates_and_policies(self):
+        base = channel_fingerprint(make_channel(), make_edge())
+
+        self.assertEqual(channel_fingerprint(make_channel(), make_edge()), base)
+        self.assertNotEqual(channel_fingerprint(make_channel(num_updates=43), make_edge()), base)
+        self.assertNotEqual(channel_fingerprint(make_channel(active=False), make_edge()), base)
+        self.assertNotEqual(channel_fingerprint(make_channel(), make_edge(last_update=1700000100)), base)
+        self.assertNotEqual(channel_fingerprint(make_channel(), make_edge(local_fee=150)), base)
+        # チャネルは num_updates と active だけを使う
+        self.assertEqual(channel_fingerprint({'num_updates': 42, 'active': True}, make_edge()), base)
+
+
+class TestChannelFingerprintCache(unittest.TestCase):
+
+    def setUp(self):
+        self.db = Database(':memory:', node_id='a')
+        self.db.initialize()
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_detects_unchanged_channels(self):
+        cache = ChannelFingerprintCache()
+        snapshots = [(make_channel(), make_edge(), 1500)]
+        self.assertEqual(cache.unchanged_channels('a', snapshots), set())
+        cache.update('a', snapshots)
+
+        self.assertEqual(cache.unchanged_channels('a', snapshots), {'1'})
+        self.assertEqual(cache.unchanged_channels('b', snapshots), set())
+        self.assertEqual(cache.unchanged_channels('a', [(make_channel(num_updates=43), make_edge(), 1500)]), set())
+        self.assertEqual(cache.unchanged_channels('a', [(make_channel(), make_edge(), 1600)]), set())
+
+    def test_persists_and_removes_closed_channels(self):
+        cache = ChannelFingerprintCache(db=self.db)
+        self.db.update_channel_lists([make_channel('1'), make_channel('2')])
+        cache.update('a', [(make_channel('1'), make_edge('1'), 1500), (make_channel('2'), make_edge('2'), None)])
+        self.assertEqual(cache.save(), 2)
+        self.assertEqual(cache.save(), 0)
+
+        warmed = ChannelFingerprintCache(db=self.db)
+        self.assertEqual(warmed.load(), 2)
+        self.assertEqual(warmed.unchanged_channels('a', [(make_channel('1'), make_edge('1'), 1500),
+                                                         (make_channel('2'), make_edge('2'), None)]), {'1', '2'})
+
+        self.db.update_channel_lists([make_channel('1')])
+        self.assertEqual(len(self.db.load_channel_fingerprints()), 1)
+
+
+class TestEdgeReuse(unittest.TestCase):
+
+    CONFIG = {'lightning': {'node_id': 'a'}, 'collection': {'edge_source': 'edge'}, 'amboss': {'batch_size': 25}}
+
+    def _collect(self, channels, cache, edges=None):
+        edges = edges or {}
+        fetch = lambda chan_id, config=None: edges.get(chan_id) or make_edge(chan_id)
+        with patch('src.api.collector.get_channel_data', side_effect=fetch) as get_edge, \
+                patch('src.api.collector.get_amboss_fees',
+                      side_effect=lambda pubkeys, *args: {pubkey: 1500 for pubkey in pubkeys}):
+            snapshots = list(collect_channel_snapshots(channels, self.CONFIG, fingerprints=cache))
+        return snapshots, sorted(call.args[0] for call in get_edge.call_args_list)
+
+    def test_skips_edge_fetch_while_num_updates_match(self):
+        cache = ChannelFingerprintCache()
+        channels = [make_channel('1'), make_channel('2')]
+        snapshots, fetched = self._collect(channels, cache)
+        self.assertEqual(fetched, ['1', '2'])
+        cache.update('a', snapshots)
+
+        changed = [make_channel('1'), make_channel('2', num_updates=43)]
+        reused, fetched = self._collect(changed, cache)
+        self.assertEqual(fetched, ['2'])
+        # 作り直したエッジは取得したエッジと同じ行になり、変更の無いチャネルとして扱う
+        self.assertEqual(Database._channel_data_row(*reused[0], 'date'), Database._channel_data_row(*snapshots[0], 'date'))
+        self.assertEqual(cache.unchanged_channels('a', reused), {'1'})
+
+        # 期間を過ぎたら取得し直す
+        cache.update('a', reused)
+        with patch('src.api.fingerprint_cache.time.time', return_value=time.time() + 3600):
+            _, fetched = self._collect(changed, cache)
+        self.assertEqual(fetched, ['1', '2'])
+
+    def test_rebuilds_edge_with_remote_as_node2(self):
+        cache = ChannelFingerprintCache()
+        edge = make_edge('1', last_update=1700000001, remote_is_node1=False)
+        snapshots, _ = self._collect([make_channel('1')], cache, {'1': edge})
+        cache.update('a', snapshots)
+
+        reused, fetched = self._collect([make_channel('1')], cache)
+        self.assertEqual(fetched, [])
+        self.assertEqual(Database._channel_data_row(*reused[0], 'date'), Database._channel_data_row(*snapshots[0], 'date'))
+        self.assertEqual(channel_fingerprint(*reused[0][:2]), channel_fingerprint(*snapshots[0][:2]))
+
+    def test_reuse_survives_restart(self):
+        db = Database(':memory:', node_id='a')
+        db.initialize()
+        db.update_channel_lists([make_channel('1')])
+        cache = ChannelFingerprintCache(db=db)
+        snapshots, _ = self._collect([make_channel('1')], cache)
+        cache.update('a', snapshots)
+        cache.save()
+
+        warmed = ChannelFingerprintCache(db=db)
+        warmed.load()
+        reused, fetched = self._collect([make_channel('1')], warmed)
+        self.assertEqual(fetched, [])
+        self.assertEqual(warmed.unchanged_channels('a', reused), {'1'})
+        # 使い回したエッジの取得時刻は引き継ぐ
+        warmed.update('a', reused)
+        self.assertEqual(warmed.save(), 0)
+        db.close()
+
+    def test_refresh_disabled(self):
+        cache = ChannelFingerprintCache.from_config({'collection': {'edge_refresh_minutes': 0}})
+        snapshots, _ = self._collect([make_channel('1')], cache)
+        cache.update('a', snapshots)
+        _, fetched = self._collect([make_channel('1')], cache)
+        self.assertEqual(fetched, ['1'])
+
+    def test_adds_edge_columns_to_existing_table(self):
+        db = Database(':memory:', node_id='a')
+        db.connect()
+        db.conn.execute('''CREATE TABLE channel_fingerprints (node_id TEXT NOT NULL, channel_id TEXT NOT NULL,
+                           num_updates INTEGER NOT NULL, active INTEGER NOT NULL, node1_last_update INTEGER NOT NULL,
+                           node2_last_update INTEGER NOT NULL, policy_hash INTEGER NOT NULL, amboss_fee INTEGER,
+                           PRIMARY KEY (node_id, channel_id)) WITHOUT ROWID;''')
+        db.conn.execute("INSERT INTO channel_fingerprints VALUES ('a', '1', 10, 1, 0, 0, 0, 1500);")
+        db.initialize()
+
+        rows = db.load_channel_fingerprints()
+        self.assertEqual(rows, [('a', '1', 10, 1, 0, 0, 0, 1500, 0, 0, 0, 0, 0, 0)])
+        # 取得時刻の無い既存の行のエッジは使い回さない
+        cache = ChannelFingerprintCache(db=db)
+        cache.load()
+        self.assertEqual(cache.reusable_edges('a', [make_channel('1')]), {})
+        db.close()
+
+
+class TestUnchangedWrites(unittest.TestCase):
+
+    def _intervals(self, db):
+        return db.conn.execute("SELECT channel_id, valid_from, valid_to, local_balance FROM channel_intervals "
+                               "ORDER BY channel_id, valid_from").fetchall()
+
+    def test_delta_extends_unchanged_channels(self):
+        db = Database(':memory:', storage='delta', node_id='a')
+        db.initialize()
+        cache = ChannelFingerprintCache()
+        channels = [make_channel('1'), make_channel('2')]
+        snapshots = [(channel, make_edge(channel['chan_id']), 1500) for channel in channels]
+
+        write_node(db, channels, snapshots, '2024-01-01 00:00', cache)
+        write_node(db, channels, snapshots, '2024-01-01 00:10', cache)
+        rows = self._intervals(db)
+        self.assertEqual([(row[0], row[2] - row[1]) for row in rows], [(1, 600), (2, 600)])
+
+        # 指紋に表れない変更（イベントでの書き込みなど）があった場合は区間を比較して新しい区間を始める
+        db.conn.execute("UPDATE channel_intervals SET local_balance = 1 WHERE channel_id = 2")
+        db.conn.commit()
+        write_node(db, channels, snapshots, '2024-01-01 00:20', cache)
+        rows = self._intervals(db)
+        self.assertEqual([(row[0], row[3]) for row in rows], [(1, 600000), (2, 1), (2, 600000)])
+        self.assertEqual(rows[0][2] - rows[0][1], 1200)
+        db.close()
+
+    def test_write_unchanged_false_skips_rows(self):
+        db = Database(':memory:', node_id='a')
+        db.initialize()
+        cache = ChannelFingerprintCache(write_unchanged=False)
+        channels = [make_channel('1'), make_channel('2')]
+
+        write_node(db, channels, [(channel, make_edge(channel['chan_id']), 1500) for channel in channels],
+                   '2024-01-01 00:00', cache)
+        changed = [(make_channel('1'), make_edge('1'), 1500), (make_channel('2', num_updates=43), make_edge('2'), 1500)]
+        result = write_node(db, channels, changed, '2024-01-01 00:10', cache)
+
+        self.assertEqual(result['inserted'], 1)
+        self.assertEqual(db.conn.execute("SELECT COUNT(*) FROM channel_datas").fetchone()[0], 3)
+        db.close()
+
+
+class TestAmbossFeesNotReused(unittest.TestCase):
+
+    def test_fallback_fee_is_fetched_again(self):
+        db = Database(':memory:', node_id='a')
+        db.initialize()
+        channels = [make_channel('1'), make_channel('2')]
+        cache = ChannelFingerprintCache()
+        fee_cache = AmbossFeeCache(ttl_seconds=3600)
+        config = {'lightning': {'node_id': 'a'}, 'collection': {'edge_source': 'edge'}, 'amboss': {'batch_size': 25}}
+
+        # API キーが無いためデフォルトの手数料になり、手数料キャッシュには入らない
+        with patch('src.api.collector.get_channel_data', side_effect=lambda chan_id, config=None: make_edge(chan_id)):
+            snapshots = list(collect_channel_snapshots(channels, config, fee_cache=fee_cache))
+        self.assertEqual([fee for _, _, fee in snapshots], [AMBOSS_DEFAULT_FEE, AMBOSS_DEFAULT_FEE])
+        self.assertIsNone(fee_cache.get('remote1'))
+        write_node(db, channels, snapshots, '2024-01-01 00:00', cache)
+
+        # 指紋が変わっていなくても Amboss に問い合わせ、取得できた手数料で書き込む
+        with patch('src.api.collector.get_channel_data', side_effect=lambda chan_id, config=None: make_edge(chan_id)), \
+                patch('src.api.collector.get_amboss_fees', return_value={'remote1': 1500, 'remote2': 1800}) as fees:
+            snapshots = list(collect_channel_snapshots(channels, config, fee_cache=fee_cache))
+        self.assertEqual(sorted(fees.call_args[0][0]), ['remote1', 'remote2'])
+        self.assertEqual(cache.unchanged_channels('a', snapshots), set())
+        db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import json
+import unittest
+
+from src.api.graph_stream import JsonStreamReader, iter_graph_edges, build_edge_index
+
+
+def chunked(data, size):
+    return (data[i:i + size] for i in range(0, len(data), size))
+
+
+GRAPH = {
+    'nodes': [
+        {'pub_key': 'a', 'alias': 'ノード "edges": [1]', 'addresses': [{'addr': '1.2.3.4:9735'}]},
+        {'pub_key': 'b', 'alias': 'bob', 'features': {'0': {'name': 'x'}}},
+    ],
+    'edges': [
+        {'channel_id': str(i), 'node1_pub': 'a', 'node2_pub': 'b',
+         'node1_policy': {'fee_rate_milli_msat': str(i)}, 'node2_policy': None}
+        for i in range(20)
+    ],
+}
+
+
+class TestGraphStream(unittest.TestCase):
+
+    def test_edges_with_small_chunks(self):
+        data = json.dumps(GRAPH, ensure_ascii=False, indent=1).encode('utf-8')
+        for size in (1, 3, 7, 64, len(data)):
+            edges = list(iter_graph_edges(chunked(data, size)))
+            self.assertEqual(edges, GRAPH['edges'], f"chunk size {size}")
+
+    def test_edge_index_stops_early(self):
+        data = json.dumps(GRAPH).encode('utf-8')
+        consumed = []
+
+        def tracking_chunks():
+            for chunk in chunked(data, 16):
+                consumed.append(chunk)
+                yield chunk
+
+        index = build_edge_index(iter_graph_edges(tracking_chunks()), ['3', '5', 'unknown'])
+        self.assertEqual(sorted(index), ['3', '5'])
+
+        index = build_edge_index(iter_graph_edges(chunked(data, 16)), ['1', '2'])
+        self.assertEqual(index['2']['node1_policy']['fee_rate_milli_msat'], '2')
+
+        consumed.clear()
+        build_edge_index(iter_graph_edges(tracking_chunks()), ['0'])
+        self.assertLess(sum(len(c) for c in consumed), len(data))
+
+    def test_scalars_and_empty(self):
+        reader = JsonStreamReader(chunked(b'{"a": 12345, "b": [], "c": true, "edges": []}', 2))
+        items = []
+        for key, value in reader.iter_object():
+            items.append((key, value if not hasattr(value, '__next__') else list(value)))
+        self.assertEqual(items, [('a', 12345), ('b', []), ('c', True), ('edges', [])])
+
+    def test_invalid_json(self):
+        with self.assertRaises(ValueError):
+            list(iter_graph_edges(chunked(b'{"edges": [{"channel_id": "1"} {"x": 1}]}', 4)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch, MagicMock
+
+import requests
+
+from src.utils import metrics
+from src.api.lightning_client import LightningClient, get_amboss_fee, get_amboss_fees, AMBOSS_DEFAULT_FEE
+
+
+class _FakeLndHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.client_ports.add(self.client_address[1])
+        self.server.macaroons.add(self.headers.get('Grpc-Metadata-macaroon'))
+        if self.path.startswith('/v1/channels'):
+            body = {'channels': [{'chan_id': '1'}, {'chan_id': '2'}]}
+        elif self.path.split('?', 1)[0] == '/v1/graph':
+            body = {'nodes': [{'pub_key': 'a'}], 'edges': [{'channel_id': str(i)} for i in range(100)]}
+        elif self.path.startswith('/v1/graph/edge/'):
+            chan_id = self.path.rsplit('/', 1)[-1]
+            if chan_id == 'missing':
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            body = {'channel_id': chan_id}
+        else:
+            body = {}
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestLightningClient(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _FakeLndHandler)
+        self.server.client_ports = set()
+        self.server.macaroons = set()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.macaroon_path = os.path.join(self.tmpdir, 'admin.macaroon')
+        with open(self.macaroon_path, 'wb') as f:
+            f.write(b'\x01\x02\x03')
+
+        self.config = {
+            'lightning': {
+                'api_url': f'http://127.0.0.1:{self.server.server_address[1]}',
+                'macaroon_path': self.macaroon_path,
+                # 有効な PEM であれば良いので certifi の CA バンドルを使う
+                'tls_path': requests.certs.where(),
+            }
+        }
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_reuses_connection_and_credentials(self):
+        client = LightningClient(self.config)
+        # macaroon は生成時に読み込み済みなので、ファイルが無くなっても動作する
+        os.remove(self.macaroon_path)
+
+        self.assertEqual([c['chan_id'] for c in client.get_channel_lists()], ['1', '2'])
+        for chan_id in range(20):
+            self.assertEqual(client.get_channel_data(str(chan_id))['channel_id'], str(chan_id))
+        client.close()
+
+        self.assertEqual(len(self.server.client_ports), 1)
+        self.assertEqual(self.server.macaroons, {'010203'})
+
+    def test_graph_edges(self):
+        client = LightningClient(self.config)
+        index = client.get_graph_edges(['5', '42', 'unknown'])
+        client.close()
+
+        self.assertEqual(sorted(index), ['42', '5'])
+        self.assertEqual(index['42']['channel_id'], '42')
+
+    def test_channel_list_error_is_reported_and_counted(self):
+        client = LightningClient(self.config)
+        run = metrics.start_run('collect')
+        try:
+            with patch.object(client, '_get', side_effect=requests.exceptions.ConnectionError('refused')), \
+                    patch('builtins.print') as mock_print:
+                self.assertEqual(client.get_channel_lists(), [])
+        finally:
+            metrics.end_run(run)
+            client.close()
+
+        self.assertIn('refused', mock_print.call_args[0][0])
+        self.assertEqual(run.counters.get('channel_list_errors'), 1)
+
+    def test_error_returns_error_dict(self):
+        client = LightningClient(self.config)
+        channel_data = client.get_channel_data('missing')
+        client.close()
+
+        self.assertTrue(channel_data.get('error'))
+
+    def test_missing_config(self):
+        with self.assertRaises(ValueError):
+            LightningClient(None)
+        with self.assertRaises(ValueError):
+            LightningClient({'lightning': {'api_url': 'https://127.0.0.1:8080'}})
+
+
+class TestAmbossBatch(unittest.TestCase):
+
+    CONFIG = {'amboss': {'api_key': 'key', 'api_url': 'https://amboss.test', 'batch_size': 2}}
+
+    @staticmethod
+    def _node(fee):
+        return {'graph_info': {'channels': {'fee_info': {'remote': {'weighted_corrected': fee}}}}}
+
+    @patch('src.api.lightning_client.requests.post')
+    def test_chunks_and_defaults(self, mock_post):
+        responses = [
+            {'data': {'n0': self._node('1234.9'), 'n1': None}},
+            {'data': {'n0': {'graph_info': {'channels': []}}}},
+        ]
+        mock_post.side_effect = [MagicMock(content=json.dumps(r).encode()) for r in responses]
+
+        fees = get_amboss_fees(['a', 'b', 'a', 'c'], self.CONFIG)
+
+        self.assertEqual(fees, {'a': 1234, 'b': AMBOSS_DEFAULT_FEE, 'c': AMBOSS_DEFAULT_FEE})
+        self.assertEqual(mock_post.call_count, 2)
+        first = mock_post.call_args_list[0].kwargs['json']
+        self.assertEqual(first['variables'], {'p0': 'a', 'p1': 'b'})
+        self.assertIn('n1: getNode(pubkey: $p1)', first['query'])
+
+    @patch('src.api.lightning_client.requests.post')
+    def test_single_node_fee(self, mock_post):
+        # graph_info.channels はオブジェクトとして返る
+        mock_post.return_value = MagicMock(content=json.dumps({'data': {'getNode': self._node(512.3)}}).encode())
+        self.assertEqual(get_amboss_fee('a', self.CONFIG), 512)
+
+        mock_post.return_value = MagicMock(content=b'{"data": {"getNode": null}}')
+        self.assertEqual(get_amboss_fee('b', self.CONFIG), AMBOSS_DEFAULT_FEE)
+
+    @patch('src.api.lightning_client.requests.post')
+    def test_request_failure_uses_default(self, mock_post):
+        mock_post.side_effect = requests.exceptions.ConnectionError("down")
+
+        fees = get_amboss_fees(['a', 'b', 'c'], self.CONFIG)
+
+        self.assertEqual(fees, {'a': AMBOSS_DEFAULT_FEE, 'b': AMBOSS_DEFAULT_FEE, 'c': AMBOSS_DEFAULT_FEE})
+
+
+if __name__ == '__main__':
+    unittest.main()
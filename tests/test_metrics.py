@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from src.db.database import Database
+from src.utils import metrics
+from src.utils.metrics import RunMetrics
+
+
+class TestRunMetrics(unittest.TestCase):
+
+    def test_http_histogram_is_cumulative(self):
+        run = RunMetrics()
+        run.observe_http('lnd:/v1/graph/edge', 0.003)
+        run.observe_http('lnd:/v1/graph/edge', 0.2)
+        run.observe_http('lnd:/v1/graph/edge', 30.0, error=True)
+
+        stats = run.to_dict()['http']['lnd:/v1/graph/edge']
+        self.assertEqual(stats['buckets'][0.005], 1)
+        self.assertEqual(stats['buckets'][0.25], 2)
+        self.assertEqual(stats['buckets'][10.0], 2)
+        self.assertEqual((stats['count'], stats['errors']), (3, 1))
+        self.assertEqual(run.errors, 1)
+
+    def test_module_functions_record_into_active_run(self):
+        metrics.increment('rows_written', 5)  # 実行中でなければ記録しない
+        run = metrics.start_run('collect')
+        try:
+            with metrics.phase('db_write'):
+                metrics.increment('rows_written', 3)
+            metrics.increment('edge_errors')
+            metrics.observe_http('amboss:/graphql', 0.1)
+        finally:
+            metrics.end_run(run)
+        metrics.increment('rows_written', 7)
+        run.finish('ok')
+
+        self.assertIsNone(metrics.current())
+        self.assertEqual(run.counters, {'rows_written': 3, 'edge_errors': 1})
+        self.assertIn('db_write', run.phases)
+        self.assertEqual(run.errors, 1)
+
+    def test_prometheus_textfile(self):
+        run = RunMetrics('collect')
+        run.add_phase('edges', 1.5)
+        run.increment('rows_written', 10)
+        run.observe_http('lnd:/v1/channels', 0.02)
+        run.finish('ok')
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'textfile', 'lnddb.prom')
+            metrics.write_textfile(run, path)
+            with open(path, encoding='utf-8') as f:
+                text = f.read()
+        finally:
+            shutil.rmtree(tmpdir)
+
+        self.assertIn('lnddb_run_success{mode="collect"} 1\n', text)
+        self.assertIn('lnddb_phase_duration_seconds{mode="collect",phase="edges"} 1.5\n', text)
+        self.assertIn('lnddb_run_count{mode="collect",name="rows_written"} 10\n', text)
+        self.assertIn('lnddb_http_request_duration_seconds_bucket{mode="collect",endpoint="lnd:/v1/channels",le="0.01"} 0\n',
+                      text)
+        self.assertIn('lnddb_http_request_duration_seconds_bucket{mode="collect",endpoint="lnd:/v1/channels",le="+Inf"} 1\n',
+                      text)
+
+    def test_runs_table(self):
+        db = Database(':memory:')
+        db.initialize()
+        for status in ('ok', 'error'):
+            run = RunMetrics('collect')
+            run.increment('rows_written', 4)
+            run.increment('edge_errors', 2)
+            run.finish(status)
+            self.assertIsNotNone(db.insert_run(run))
+
+        row = db.conn.execute("SELECT mode, status, rows_written, errors FROM runs ORDER BY id").fetchone()
+        self.assertEqual(tuple(row), ('collect', 'ok', 4, 2))
+        runs = db.get_recent_runs(limit=1)
+        self.assertEqual([(r['status'], r['counters']['edge_errors']) for r in runs], [('error', 2)])
+        db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
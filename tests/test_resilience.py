@@ -0,0 +1,167 @@
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+
+import requests
+
+from src.api import resilience
+from src.api.collector import collect_channel_snapshots
+from src.api.fee_cache import AmbossFeeCache
+from src.api.lightning_client import get_amboss_fee, get_amboss_fees, reset_amboss_breakers, AMBOSS_DEFAULT_FEE
+from src.api.resilience import CircuitBreaker, Deadline, DeadlineExceeded, call_with_retries
+from src.utils import metrics
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.exceptions.HTTPError(f"{status}", response=response)
+
+
+class TestDeadline(unittest.TestCase):
+
+    def test_timeout_is_clamped_to_remaining(self):
+        clock = FakeClock()
+        deadline = Deadline(10, clock=clock)
+        self.assertEqual(deadline.timeout((5, 30)), (5, 10))
+        clock.now += 8
+        self.assertEqual(deadline.timeout((5, 30)), (2, 2))
+        clock.now += 2
+        self.assertTrue(deadline.expired)
+        with self.assertRaises(DeadlineExceeded):
+            deadline.timeout((5, 30))
+
+    def test_nested_deadline_keeps_outer(self):
+        with resilience.deadline(60) as outer:
+            with resilience.deadline(1) as inner:
+                self.assertIs(inner, outer)
+            self.assertIs(resilience.current(), outer)
+        self.assertIsNone(resilience.current())
+        with resilience.deadline(0) as none:
+            self.assertIsNone(none)
+
+
+class TestRetries(unittest.TestCase):
+
+    def test_retries_transient_errors_with_jitter(self):
+        func = MagicMock(side_effect=[requests.exceptions.ConnectionError("reset"), http_error(503), 'ok'])
+        delays = []
+        result = call_with_retries(func, retries=2, backoff_seconds=1.0, sleep=delays.append,
+                                   jitter_fn=lambda low, high: high)
+        self.assertEqual(result, 'ok')
+        self.assertEqual(delays, [1.0, 2.0])
+
+    def test_does_not_retry_client_errors(self):
+        func = MagicMock(side_effect=http_error(404))
+        with self.assertRaises(requests.exceptions.HTTPError):
+            call_with_retries(func, retries=3, sleep=lambda delay: None)
+        self.assertEqual(func.call_count, 1)
+
+    def test_gives_up_when_backoff_exceeds_deadline(self):
+        func = MagicMock(side_effect=requests.exceptions.Timeout("slow"))
+        with resilience.deadline(0.5):
+            with self.assertRaises(requests.exceptions.Timeout):
+                call_with_retries(func, retries=3, backoff_seconds=5.0, sleep=lambda delay: None,
+                                  jitter_fn=lambda low, high: high)
+        self.assertEqual(func.call_count, 1)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_opens_and_half_opens(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=2, reset_seconds=60, clock=clock)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'closed')
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'open')
+        self.assertFalse(breaker.allow())
+
+        clock.now += 60
+        self.assertEqual(breaker.state, 'half-open')
+        self.assertTrue(breaker.allow())
+        # 試しの 1 回の結果が出るまでは他の呼び出しを止める
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'open')
+
+        clock.now += 60
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, 'closed')
+
+
+class TestAmbossFallback(unittest.TestCase):
+
+    CONFIG = {'amboss': {'api_key': 'key', 'api_url': 'https://amboss.test', 'batch_size': 2, 'retries': 0,
+                         'breaker_failures': 2, 'breaker_reset_seconds': 300}}
+
+    def setUp(self):
+        reset_amboss_breakers()
+
+    def tearDown(self):
+        reset_amboss_breakers()
+
+    @patch('src.api.lightning_client.requests.post')
+    def test_open_breaker_uses_stale_cache(self, mock_post):
+        mock_post.side_effect = requests.exceptions.ConnectionError("down")
+        cache = AmbossFeeCache(ttl_seconds=60)
+        cache.put('stale', 1234, fetched_at=time.time() - 120)
+
+        self.assertEqual(get_amboss_fees(['a', 'b', 'c', 'd'], self.CONFIG, cache),
+                         {'a': AMBOSS_DEFAULT_FEE, 'b': AMBOSS_DEFAULT_FEE, 'c': AMBOSS_DEFAULT_FEE,
+                          'd': AMBOSS_DEFAULT_FEE})
+        self.assertEqual(mock_post.call_count, 2)
+
+        # 2 回続けて失敗したため、以降は API を呼ばずにキャッシュ済みの値かデフォルト値を使う
+        self.assertEqual(get_amboss_fee('stale', self.CONFIG, cache), 1234)
+        self.assertEqual(get_amboss_fee('other', self.CONFIG, cache), AMBOSS_DEFAULT_FEE)
+        self.assertEqual(mock_post.call_count, 2)
+
+    @patch('src.api.lightning_client.requests.post')
+    def test_expired_deadline_skips_amboss(self, mock_post):
+        with resilience.deadline(0.001):
+            time.sleep(0.01)
+            self.assertEqual(get_amboss_fees(['a', 'b'], self.CONFIG), {'a': AMBOSS_DEFAULT_FEE,
+                                                                         'b': AMBOSS_DEFAULT_FEE})
+        mock_post.assert_not_called()
+
+
+class TestDeadlineSkipsChannels(unittest.TestCase):
+
+    CHANNELS = [{'chan_id': str(i), 'remote_pubkey': f'pub{i}'} for i in range(4)]
+
+    def test_skipped_channels_are_recorded(self):
+        def fake_channel_data(channel_id, config=None):
+            # 2 チャネル目の取得中に期限を過ぎる
+            if int(channel_id) >= 2:
+                return {"error": True, "skipped": True, "message": "deadline exceeded"}
+            return {'channel_id': channel_id}
+
+        config = {'lightning': {'node_id': 'node-a'}, 'collection': {'edge_source': 'edge'},
+                  'amboss': {'batch_size': 1}}
+        run = metrics.start_run('collect')
+        try:
+            with patch('src.api.collector.get_channel_data', side_effect=fake_channel_data), \
+                    patch('src.api.collector.get_amboss_fee', return_value=100):
+                results = list(collect_channel_snapshots(self.CHANNELS, config))
+        finally:
+            metrics.end_run(run)
+
+        self.assertEqual([channel['chan_id'] for channel, _, _ in results], ['0', '1'])
+        self.assertEqual(run.skipped, {'node-a': ['2', '3']})
+        self.assertEqual(run.counters.get('channels_skipped'), 2)
+        self.assertEqual(run.errors, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import signal
+import threading
+import time
+import unittest
+
+from src.utils.scheduler import Scheduler
+
+
+class TestScheduler(unittest.TestCase):
+
+    def test_runs_cycles_sequentially(self):
+        active = []
+        overlaps = []
+
+        def job():
+            if active:
+                overlaps.append(True)
+            active.append(True)
+            time.sleep(0.02)  # 間隔より長いジョブでも重ならない
+            active.pop()
+
+        scheduler = Scheduler(0.005)
+        self.assertEqual(scheduler.run(job, max_cycles=3), 3)
+        self.assertEqual(overlaps, [])
+
+    def test_delay_accounts_for_elapsed_time_and_jitter(self):
+        scheduler = Scheduler(60, jitter_seconds=10, jitter_fn=lambda low, high: high)
+        self.assertEqual(scheduler.next_delay(15), 55)
+        # 間隔を超えた場合は待たずに（ゆらぎ分だけ待って）次のサイクルを始める
+        self.assertEqual(scheduler.next_delay(90), 10)
+
+    def test_job_errors_do_not_stop_loop(self):
+        calls = []
+
+        def job():
+            calls.append(True)
+            raise RuntimeError('boom')
+
+        self.assertEqual(Scheduler(0.001).run(job, max_cycles=2), 2)
+        self.assertEqual(len(calls), 2)
+
+    def test_stop_interrupts_wait(self):
+        scheduler = Scheduler(60)
+        threading.Timer(0.05, scheduler.stop).start()
+        started = time.monotonic()
+        self.assertEqual(scheduler.run(lambda: None), 1)
+        self.assertLess(time.monotonic() - started, 5)
+
+    @unittest.skipUnless(os.name == 'posix', "os.kill でシグナルを送れる POSIX のみ")
+    def test_signal_stops_after_current_cycle(self):
+        scheduler = Scheduler(60)
+        previous = {name: signal.getsignal(getattr(signal, name)) for name in ('SIGINT', 'SIGTERM')}
+        scheduler.install_signal_handlers()
+        try:
+            threading.Timer(0.05, os.kill, (os.getpid(), signal.SIGTERM)).start()
+            started = time.monotonic()
+            self.assertEqual(scheduler.run(lambda: None), 1)
+            self.assertLess(time.monotonic() - started, 5)
+        finally:
+            for name, handler in previous.items():
+                signal.signal(getattr(signal, name), handler)
+
+
+if __name__ == '__main__':
+    unittest.main()